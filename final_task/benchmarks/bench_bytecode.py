@@ -0,0 +1,41 @@
+"""
+Benchmark of bytecode interpreter against the RPN tokens interpreter, with memory per program
+
+Usage: python benchmarks/bench_bytecode.py [NUMBER]
+"""
+from os.path import abspath, dirname
+from timeit import timeit
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from calculator.bytecode import BytecodeCompiler  # noqa: E402
+from calculator.pycalc import Calculator  # noqa: E402
+
+EXPRESSIONS = [
+    ('a*sin(x)+b', {'a': 2.0, 'x': 0.5, 'b': 1.0}),
+    ('(1+2)*3-4/5+6//7', {}),
+    ('log(x,2)*cos(y)/(1+exp(-x))', {'x': 8.0, 'y': 0.3}),
+    ('+'.join(f'{index}*x^{index % 4}' for index in range(1, 40)), {'x': 1.5}),
+    ('sin(' * 50 + 'x' + ')' * 50, {'x': 1.0}),
+]
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    calculator, compiler = Calculator(), BytecodeCompiler()
+    print(f'{"expression":<40} {"tokens, us":>11} {"bytecode, us":>13} {"speedup":>8} {"tokens, B":>10} '
+          f'{"bytecode, B":>12}')
+    for expression, bindings in EXPRESSIONS:
+        program = calculator.compile(expression)
+        compiled = compiler.assemble(program)
+        interpreted = timeit(lambda: calculator.evaluate(program, bindings), number=number) / number * 1e6
+        assembled = timeit(lambda: compiler.evaluate(compiled, bindings), number=number) / number * 1e6
+        size = sys.getsizeof(program.rpn) + sum(sys.getsizeof(token) for token in program.rpn)
+        label = expression if len(expression) <= 40 else expression[:37] + '...'
+        print(f'{label:<40} {interpreted:>11.2f} {assembled:>13.2f} {interpreted / assembled:>7.1f}x {size:>10} '
+              f'{compiled.nbytes():>12}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Benchmark of generated Python functions against the RPN interpreter
+
+Usage: python benchmarks/bench_codegen.py [NUMBER]
+"""
+from os.path import abspath, dirname
+from timeit import timeit
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from calculator.codegen import CodeGenerator  # noqa: E402
+from calculator.pycalc import Calculator  # noqa: E402
+
+EXPRESSIONS = [
+    ('a*sin(x)+b', {'a': 2.0, 'x': 0.5, 'b': 1.0}),
+    ('sqrt(x^2+y^2)', {'x': 3.0, 'y': 4.0}),
+    ('log(x,2)*cos(y)/(1+exp(-x))', {'x': 8.0, 'y': 0.3}),
+    ('(x<y)*x+(x>=y)*y-x%3+x//2', {'x': 7.0, 'y': 5.0}),
+    ('+'.join(f'{index}*x^{index % 4}' for index in range(1, 40)), {'x': 1.5}),
+]
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    calculator, generator = Calculator(), CodeGenerator()
+    print(f'{"expression":<40} {"interpreter, us":>16} {"generated, us":>14} {"speedup":>8}')
+    for expression, bindings in EXPRESSIONS:
+        program = calculator.compile(expression)
+        function = generator.generate(program)
+        values = [bindings[name] for name in function.arguments]
+        interpreted = timeit(lambda: calculator.evaluate(program, bindings), number=number) / number * 1e6
+        generated = timeit(lambda: function(*values), number=number) / number * 1e6
+        label = expression if len(expression) <= 40 else expression[:37] + '...'
+        print(f'{label:<40} {interpreted:>16.2f} {generated:>14.2f} {interpreted / generated:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Benchmark of batch evaluation sharing common subexpressions against evaluating every expression separately
+
+Usage: python benchmarks/bench_cse.py [NUMBER]
+"""
+from os.path import abspath, dirname
+from timeit import timeit
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from calculator.cse import BatchCompiler  # noqa: E402
+from calculator.pycalc import Calculator  # noqa: E402
+
+BATCHES = {
+    'distinct': [f'{index}*2+{index}^2' for index in range(1000)],
+    'shared norm': [f'sqrt(x^2+y^2)*{index % 10}+sqrt(y^2+x^2)/{index % 7 + 1}' for index in range(1000)],
+    'shared fragments': [f'exp(-(x-{index % 20})^2/2)/sqrt(2*pi)+log(1+abs(x-{index % 20}))*y'
+                         for index in range(1000)],
+}
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    calculator = Calculator(cache_size=None)
+    compiler = BatchCompiler(calculator)
+    bindings = {'x': 3.0, 'y': 4.0}
+    print(f'{"batch":<18} {"separate, ms":>13} {"shared, ms":>11} {"speedup":>8} {"evaluations":>12} {"saved":>7}')
+    for name, expressions in BATCHES.items():
+        programs = [calculator.compile(expression) for expression in expressions]
+        shared = compiler.compile(expressions)
+        separate = timeit(lambda: [calculator.evaluate(program, bindings) for program in programs],
+                          number=number) / number * 1e3
+        once = timeit(lambda: compiler.evaluate(shared, bindings), number=number) / number * 1e3
+        print(f'{name:<18} {separate:>13.2f} {once:>11.2f} {separate / once:>7.1f}x {shared.evaluations:>12} '
+              f'{shared.saved:>7}')
+
+
+if __name__ == '__main__':
+    main()
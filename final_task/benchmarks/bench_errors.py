@@ -0,0 +1,53 @@
+"""
+Benchmark of batch evaluation with malformed inputs: raising calculate against non-raising try_calculate
+
+Usage: python benchmarks/bench_errors.py [NUMBER]
+"""
+from os.path import abspath, dirname
+from timeit import timeit
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from calculator.pycalc import Calculator  # noqa: E402
+
+VALID = ['sin(x)*2+1', '(1+2)*3-4/5', 'log(x,2)+sqrt(16)', 'x^2-2*x+1']
+MALFORMED = ['(1+2', '2+*3', 'sin()', '1/0', 'foo(1)', '3 4', 'x+#']
+
+
+def rows(fraction):
+    """
+    Returns 1000 rows with given fraction of malformed ones repeating over the batch
+    """
+    malformed = int(1000 * fraction)
+    return [MALFORMED[index % len(MALFORMED)] if index < malformed else VALID[index % len(VALID)]
+            for index in range(1000)]
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    bindings = {'x': 2.0}
+    print(f'{"malformed":<10} {"raising, ms":>12} {"results, ms":>12} {"speedup":>8}')
+    for fraction in (0.0, 0.1, 0.3):
+        expressions = rows(fraction)
+        calculator = Calculator()
+
+        def raising():
+            lines = []
+            for expression in expressions:
+                try:
+                    lines.append(str(calculator.calculate(expression, bindings)))
+                except Exception as e:
+                    lines.append(f'ERROR: {e}')
+            return lines
+
+        def results():
+            return [calculator.try_calculate(expression, bindings) for expression in expressions]
+
+        raised = timeit(raising, number=number) / number * 1e3
+        returned = timeit(results, number=number) / number * 1e3
+        print(f'{fraction:<10.0%} {raised:>12.2f} {returned:>12.2f} {raised / returned:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark of user-defined functions: macros against the same formulas written inline
+and pure registered functions folded by optimizer against impure ones called on every evaluation
+
+Usage: python benchmarks/bench_functions.py [NUMBER]
+"""
+from os.path import abspath, dirname
+from timeit import timeit
+import math
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from calculator.functions import FunctionLibrary  # noqa: E402
+from calculator.pycalc import Calculator  # noqa: E402
+
+MACROS = [
+    ('lerp(a,b,t)', 'a+(b-a)*t'),
+    ('smooth(t)', 't*t*(3-2*t)'),
+    ('norm(x,y)', 'sqrt(x^2+y^2)'),
+]
+EXPRESSIONS = [
+    ('lerp(x,y,smooth(t))', 'x+(y-x)*(t*t*(3-2*t))'),
+    ('norm(lerp(1,x,t),lerp(2,y,t))', 'sqrt((1+(x-1)*t)^2+(2+(y-2)*t)^2)'),
+]
+BINDINGS = {'x': 1.5, 'y': 4.0, 't': 0.25}
+
+
+def gaussian(x, mu, sigma):
+    return math.exp(-((x - mu) / sigma) ** 2 / 2) / (sigma * math.sqrt(2 * math.pi))
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    library = FunctionLibrary()
+    for head, body in MACROS:
+        library.define(f'{head}={body}')
+    with_macros, plain = Calculator(cache_size=0, functions=library), Calculator(cache_size=0)
+    print(f'{"expression":<32} {"compile, us":>12} {"inline, us":>11} {"evaluate, us":>13} {"inline, us":>11}')
+    for expression, inline in EXPRESSIONS:
+        assert with_macros.calculate(expression, BINDINGS) == plain.calculate(inline, BINDINGS)
+        compiled = timeit(lambda: with_macros.compile(expression), number=number) / number * 1e6
+        parsed = timeit(lambda: plain.compile(inline), number=number) / number * 1e6
+        programs = with_macros.compile(expression), plain.compile(inline)
+        evaluated = timeit(lambda: with_macros.evaluate(programs[0], BINDINGS), number=number) / number * 1e6
+        written = timeit(lambda: plain.evaluate(programs[1], BINDINGS), number=number) / number * 1e6
+        print(f'{expression:<32} {compiled:>12.2f} {parsed:>11.2f} {evaluated:>13.2f} {written:>11.2f}')
+    print()
+    library.register('pdf', gaussian, pure=True)
+    library.register('density', gaussian)
+    calculator = Calculator(optimize=True, functions=library)
+    print(f'{"expression":<32} {"evaluate, us":>12}')
+    for expression in ('x*pdf(1,0,2)+pdf(2,0,2)', 'x*density(1,0,2)+density(2,0,2)'):
+        program = calculator.compile(expression)
+        evaluated = timeit(lambda: calculator.evaluate(program, BINDINGS), number=number) / number * 1e6
+        print(f'{expression:<32} {evaluated:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Benchmark of incremental formula graph updates against full re-evaluation of every formula
+
+Usage: python benchmarks/bench_incremental.py [NUMBER]
+"""
+from os.path import abspath, dirname
+from timeit import timeit
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from calculator.incremental import FormulaGraph  # noqa: E402
+from calculator.pycalc import Calculator  # noqa: E402
+
+VARIABLES = [f'x{index}' for index in range(50)]
+FORMULAS = {
+    f'f{index}': f'sqrt(x{index % 50}^2+x{(index + 1) % 50}^2)*exp(-x{index % 7}/10)+log(1+abs(x{index % 50}))'
+    for index in range(500)
+}
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    calculator = Calculator()
+    graph = FormulaGraph(calculator)
+    bindings = {name: float(index) for index, name in enumerate(VARIABLES)}
+    programs = [calculator.compile(expression) for expression in FORMULAS.values()]
+    for name, expression in FORMULAS.items():
+        graph.add(name, expression)
+    graph.update(bindings)
+    tokens = sum(len(program.rpn) for program in programs)
+    print(f'{len(FORMULAS)} formulas, {tokens} RPN tokens, {len(graph)} graph nodes')
+    print(f'{"changed variables":<20} {"full, us":>10} {"graph, us":>10} {"speedup":>8} {"changed formulas":>17}')
+    for changes in (1, 5, 50):
+        ticks = iter(range(sys.maxsize))
+
+        def full():
+            tick = next(ticks)
+            for name in VARIABLES[:changes]:
+                bindings[name] = float(tick)
+            return [calculator.evaluate(program, bindings) for program in programs]
+
+        def incremental():
+            tick = next(ticks)
+            return graph.update({name: float(tick) for name in VARIABLES[:changes]})
+
+        evaluated = timeit(full, number=number) / number * 1e6
+        updated = timeit(incremental, number=number) / number * 1e6
+        print(f'{changes:<20} {evaluated:>10.1f} {updated:>10.1f} {evaluated / updated:>7.1f}x '
+              f'{len(incremental()):>17}')
+
+
+if __name__ == '__main__':
+    main()
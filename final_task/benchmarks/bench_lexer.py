@@ -0,0 +1,43 @@
+"""
+Benchmark of single-pass Lexer against the former tokenize-based path
+
+Usage: python benchmarks/bench_lexer.py [NUMBER]
+"""
+from io import StringIO
+from os.path import abspath, dirname
+from timeit import timeit
+from tokenize import generate_tokens
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from calculator.pycalc import ExpressionResolver, Lexer  # noqa: E402
+
+EXPRESSIONS = [
+    '2+2',
+    '-sin(pi/2)',
+    'epi+pitau*2',
+    'log(8,2)+log10(100)^2-3!',
+    '(1+2)*(3-4)/(5+6)//7%8+' * 20 + '1',
+    'sin(' * 30 + 'x' + ')' * 30,
+]
+
+
+def legacy_tokens(resolver, expression):
+    expression = resolver.resolve_double_const(expression)
+    return [token[1] for token in generate_tokens(StringIO(expression).readline) if token[1]]
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    resolver, lexer = ExpressionResolver(), Lexer()
+    print(f'{"expression":<40} {"tokenize, us":>14} {"lexer, us":>12} {"speedup":>8}')
+    for expression in EXPRESSIONS:
+        legacy = timeit(lambda: legacy_tokens(resolver, expression), number=number) / number * 1e6
+        current = timeit(lambda: lexer.scan(expression), number=number) / number * 1e6
+        label = expression if len(expression) <= 40 else expression[:37] + '...'
+        print(f'{label:<40} {legacy:>14.2f} {current:>12.2f} {legacy / current:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
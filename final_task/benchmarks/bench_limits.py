@@ -0,0 +1,58 @@
+"""
+Benchmark of guarded evaluation: overhead on ordinary expressions and time to reject hostile ones
+
+Usage: python benchmarks/bench_limits.py [NUMBER]
+"""
+from os.path import abspath, dirname
+from timeit import timeit
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from calculator.limits import Limits  # noqa: E402
+from calculator.pycalc import Calculator  # noqa: E402
+
+ORDINARY = [
+    ('2+2*2', {}),
+    ('a*sin(x)+b', {'a': 2.0, 'x': 0.5, 'b': 1.0}),
+    ('+'.join(f'{index}*x^{index % 4}' for index in range(1, 40)), {'x': 1.5}),
+]
+HOSTILE = [
+    ('float', '30000!'),
+    ('fraction', '7^(2^20)'),
+    ('fraction', '(3/7)^200000'),
+    ('fraction', '*'.join(['(3^30000)'] * 8)),
+]
+
+
+def attempt(calculator, expression):
+    try:
+        calculator.calculate(expression)
+    except Exception:
+        pass
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    plain, guarded = Calculator(), Calculator(limits=Limits())
+    print(f'{"expression":<40} {"plain, us":>10} {"guarded, us":>12} {"overhead":>9}')
+    for expression, bindings in ORDINARY:
+        programs = plain.compile(expression), guarded.compile(expression)
+        unguarded = timeit(lambda: plain.evaluate(programs[0], bindings), number=number) / number * 1e6
+        checked = timeit(lambda: guarded.evaluate(programs[1], bindings), number=number) / number * 1e6
+        label = expression if len(expression) <= 40 else expression[:37] + '...'
+        print(f'{label:<40} {unguarded:>10.2f} {checked:>12.2f} {checked / unguarded - 1:>9.0%}')
+    print()
+    print(f'{"hostile expression":<40} {"plain, ms":>10} {"rejected, us":>12}')
+    for numeric, expression in HOSTILE:
+        plain = Calculator(cache_size=0, numeric=numeric)
+        guarded = Calculator(cache_size=0, numeric=numeric, limits=Limits())
+        unguarded = timeit(lambda: attempt(plain, expression), number=1) * 1e3
+        rejected = timeit(lambda: attempt(guarded, expression), number=100) / 100 * 1e6
+        label = f'{numeric} {expression}'
+        label = label if len(label) <= 40 else label[:37] + '...'
+        print(f'{label:<40} {unguarded:>10.1f} {rejected:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
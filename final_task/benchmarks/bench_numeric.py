@@ -0,0 +1,48 @@
+"""
+Benchmark of float, decimal and fraction numeric backends on typical workloads
+
+Usage: python benchmarks/bench_numeric.py [NUMBER]
+"""
+from os.path import abspath, dirname
+from timeit import timeit
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from calculator.pycalc import Calculator, CalculatorError  # noqa: E402
+
+WORKLOADS = [
+    ('arithmetic', '(1.5+2.25)*3/4-5//2+7%3', {}),
+    ('compound interest', 'p*(1+r/12)^n', {'p': 1000, 'r': 0.05, 'n': 120}),
+    ('polynomial', '3x^3-2x^2+x-7', {'x': 1.1}),
+    ('large integers', '30!/(10!*20!)', {}),
+    ('logarithm', 'ln(x)+sqrt(x)', {'x': 2}),
+]
+
+CALCULATORS = [
+    ('float', Calculator()),
+    ('decimal(28)', Calculator(numeric='decimal')),
+    ('decimal(60)', Calculator(precision=60)),
+    ('fraction', Calculator(numeric='fraction')),
+]
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f'{"workload":<20}' + ''.join(f'{name + ", us":>16}' for name, _ in CALCULATORS))
+    for label, expression, bindings in WORKLOADS:
+        row = f'{label:<20}'
+        for _, calculator in CALCULATORS:
+            try:
+                program = calculator.compile(expression)
+                calculator.evaluate(program, bindings)
+            except (CalculatorError, ArithmeticError, ValueError):
+                row += f'{"n/a":>16}'
+                continue
+            elapsed = timeit(lambda: calculator.evaluate(program, bindings), number=number) / number * 1e6
+            row += f'{elapsed:>16.2f}'
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark of single-pass ExpressionResolver.resolve against the former three-pass resolution
+
+Usage: python benchmarks/bench_resolver.py [NUMBER]
+NUMBER is count of resolved tokens per measurement, spread over repeats of each expression
+"""
+from os.path import abspath, dirname
+from timeit import timeit
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from calculator.pycalc import ExpressionResolver, Lexer, Token  # noqa: E402
+
+EXPRESSIONS = [
+    '-sin(pi/2)+2x',
+    'log(8)+log(9,3)',
+    'log(' * 50 + '8' + ')' * 50,
+    'log(x)*log(8,2)+' * 1000 + '1',
+    '-(2)(3)+' * 2000 + '1',
+]
+
+
+def legacy_resolve(resolver, tokens_list):
+    open_parentheses_count = close_parentheses_count = 0
+    for index, token in enumerate(tokens_list):
+        if token.text == 'log':
+            number_of_arguments = 1
+            for character in tokens_list[index + 1:]:
+                if character.kind == Token.OPEN:
+                    open_parentheses_count += 1
+                elif character.kind == Token.COMMA:
+                    number_of_arguments = 2
+                elif character.kind == Token.CLOSE:
+                    close_parentheses_count += 1
+                if open_parentheses_count == close_parentheses_count:
+                    break
+            if number_of_arguments == 1:
+                tokens_list[index] = resolver.make_token('ln', token.position)
+    unary = []
+    for index, token in enumerate(tokens_list):
+        if token.text in resolver.unary_signs and (index == 0
+                                                   or tokens_list[index - 1].kind not in resolver.operand_ends):
+            unary.append(resolver.make_token(resolver.unary_signs[token.text], token.position))
+        else:
+            unary.append(token)
+    result = []
+    for index, token in enumerate(unary):
+        if index:
+            previous, kind = unary[index - 1].kind, token.kind
+            if (kind in resolver.implicit_after_number and previous == Token.NUMBER
+                    or kind in resolver.operand_names and previous in resolver.operand_names
+                    or kind in resolver.implicit_after_close and previous == Token.CLOSE):
+                result.append(resolver.make_token('*', token.position))
+        result.append(token)
+    return result
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    resolver, lexer = ExpressionResolver(), Lexer()
+    print(f'{"expression":<40} {"tokens":>7} {"three-pass, us":>15} {"resolve, us":>12} {"speedup":>8}')
+    for expression in EXPRESSIONS:
+        tokens = lexer.scan(expression)
+        repeat = max(1, number // len(tokens))
+        legacy = timeit(lambda: legacy_resolve(resolver, list(tokens)), number=repeat) / repeat * 1e6
+        current = timeit(lambda: resolver.resolve(tokens), number=repeat) / repeat * 1e6
+        label = expression if len(expression) <= 40 else expression[:37] + '...'
+        print(f'{label:<40} {len(tokens):>7} {legacy:>15.2f} {current:>12.2f} {legacy / current:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark of pycalc startup: -X importtime breakdown of calculator import, wall time of single-shot calls
+and operation registry built from precomputed tables against math module introspection
+
+Usage: python benchmarks/bench_startup.py [NUMBER]
+"""
+from os.path import abspath, dirname
+from timeit import timeit
+import os
+import subprocess
+import sys
+import time
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from calculator.pycalc import OperationRegistry  # noqa: E402
+
+CALLS = {
+    'python -c pass': ['-c', 'pass'],
+    'pycalc 2+2': ['-m', 'calculator.pycalc', '2+2'],
+    'pycalc --format text 2+2': ['-m', 'calculator.pycalc', '--format', 'text', '2+2'],
+}
+
+
+class IntrospectedRegistry(OperationRegistry):
+    math_tables = classmethod(lambda cls: cls.introspect_math())
+
+
+def run(args, number):
+    """
+    Returns best wall time in seconds of Python subprocess with args, bytecode is cached by the first run
+    """
+    environment = {**os.environ, 'PYTHONPATH': ROOT}
+    environment.pop('PYTHONDONTWRITEBYTECODE', None)
+    command = [sys.executable, *args]
+    result = subprocess.run(command, env=environment, capture_output=True, text=True, check=True)
+    best = float('inf')
+    for _ in range(number):
+        start = time.perf_counter()
+        subprocess.run(command, env=environment, capture_output=True, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def import_times(number):
+    """
+    Returns self and cumulative microseconds of every module imported by calculator, best of number runs
+    """
+    times = {}
+    for _ in range(number):
+        _, result = run(['-X', 'importtime', '-c', 'import calculator.pycalc'], 0)
+        for line in result.stderr.splitlines()[1:]:
+            _, self_time, cumulative, name = (part.strip() for part in line.replace(':', '|', 1).split('|'))
+            times[name] = min(times.get(name, (float('inf'),) * 2), (int(self_time), int(cumulative)))
+    return times
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    times = import_times(number)
+    print(f'{"module":<28} {"self, us":>9} {"cumulative, us":>15}')
+    for name, (self_time, cumulative) in sorted(times.items(), key=lambda item: -item[1][0])[:12]:
+        print(f'{name:<28} {self_time:>9} {cumulative:>15}')
+    print(f'{"import calculator.pycalc":<28} {"":>9} {times["calculator.pycalc"][1]:>15}')
+    print()
+    print(f'{"call":<28} {"wall, ms":>9}')
+    for label, args in CALLS.items():
+        print(f'{label:<28} {run(args, number)[0] * 1e3:>9.2f}')
+    print()
+    precomputed = timeit(OperationRegistry, number=number * 10) / (number * 10) * 1e6
+    introspected = timeit(IntrospectedRegistry, number=number * 10) / (number * 10) * 1e6
+    print(f'registry from tables, us: {precomputed:.1f}, by introspection, us: {introspected:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Benchmark of loading converted expressions from persistent store against running the front end
+
+Usage: python benchmarks/bench_store.py [NUMBER]
+"""
+from os.path import abspath, dirname, join
+from tempfile import TemporaryDirectory
+from timeit import timeit
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from calculator.pycalc import Calculator  # noqa: E402
+from calculator.store import ProgramStore  # noqa: E402
+
+EXPRESSIONS = [
+    '2+2*2',
+    'p*(1+r/12)^n-log(x)',
+    '+'.join(f'sin({index})*log({index + 1},2)-sqrt(abs(cos({index})))' for index in range(1, 20)),
+    '(' * 40 + '1+2' + ')*2' * 40,
+]
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    calculator = Calculator(cache_size=0)
+    with TemporaryDirectory() as directory:
+        store = ProgramStore(join(directory, 'programs.db'))
+        print(f'{"expression":<40} {"front end, us":>14} {"store, us":>10} {"speedup":>8}')
+        for expression in EXPRESSIONS:
+            store.save(expression, calculator.convert_to_rpn(expression))
+            converted = timeit(lambda: calculator.convert_to_rpn(expression), number=number) / number * 1e6
+            loaded = timeit(lambda: store.load(expression), number=number) / number * 1e6
+            label = expression if len(expression) <= 40 else expression[:37] + '...'
+            print(f'{label:<40} {converted:>14.2f} {loaded:>10.2f} {converted / loaded:>7.1f}x')
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
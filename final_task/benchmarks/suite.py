@@ -0,0 +1,155 @@
+"""
+Benchmark suite timing every stage of calculator pipeline on a corpus of expressions
+
+Reports best time and peak memory allocated per call of each stage,
+saves results as JSON baseline and compares them with a saved one
+
+Usage: python benchmarks/suite.py [--stage NAME] [--repeat N] [--save FILE] [--compare FILE] [--threshold RATIO]
+"""
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+from timeit import Timer
+import json
+import platform
+import sys
+import tracemalloc
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from calculator.pycalc import Calculator, ErrorChecker  # noqa: E402
+
+CORPUS = {
+    'short': '2+2*2',
+    'constants': 'epi+pitau*2-e',
+    'long': '+'.join(f'{index}*{index + 1}/{index + 2}-{index}%3' for index in range(1, 60)),
+    'nested': '(' * 40 + '1+2' + ')*2' * 40,
+    'functions': '+'.join(f'sin({index})*log({index + 1},2)-sqrt(abs(cos({index})))' for index in range(1, 20)),
+    'unary': '-(' * 20 + '-1' + ')' * 20 + '--+-3!',
+}
+
+
+def build_stages(calculator):
+    """
+    Returns mapping of stage name to pair of input preparing and stage running functions
+    Prepared input is computed once, so only the stage itself is timed
+    """
+    def identity(expression):
+        return expression
+
+    def scanned(expression):
+        return calculator.lexer.scan(expression)
+
+    def compiled(expression):
+        return calculator.compile(expression)
+
+    def compile_uncached(expression):
+        calculator.cache.clear()
+        return calculator.compile(expression)
+
+    return {
+        'check_parentheses': (identity, ErrorChecker.check_parentheses),
+        'check_for_symbols': (identity, ErrorChecker.check_for_symbols),
+        'check_spaces': (identity, ErrorChecker.check_spaces),
+        'resolve_double_const': (identity, calculator.resolver.resolve_double_const),
+        'create_tokens_list': (identity, calculator.create_tokens_list),
+        'scan': (identity, calculator.lexer.scan),
+        'resolve': (scanned, calculator.resolver.resolve),
+        'convert_to_rpn': (identity, calculator.convert_to_rpn),
+        'compile': (identity, compile_uncached),
+        'handle_operations': (compiled, lambda program: calculator.handle_operations(program.rpn)),
+        'calculate': (identity, calculator.calculate),
+    }
+
+
+def calibrate(timer, min_time=0.05):
+    """
+    Returns number of calls taking at least min_time seconds
+    """
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return number
+
+
+def measure(function, argument, repeat=5):
+    """
+    Returns best time of one call in microseconds and peak memory allocated by one call in bytes
+    """
+    timer = Timer(lambda: function(argument))
+    number = calibrate(timer)
+    best = min(timer.repeat(repeat, number)) / number * 1e6
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        function(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'time_us': round(best, 3), 'peak_bytes': peak - start}
+
+
+def run(stages=None, repeat=5):
+    """
+    Returns results of all stages on all corpus expressions keyed by 'stage/expression'
+    Stages failing on some expression are skipped for it
+    """
+    calculator = Calculator(cache_size=None)
+    results = {}
+    for stage, (prepare, function) in build_stages(calculator).items():
+        if stages and stage not in stages:
+            continue
+        for name, expression in CORPUS.items():
+            try:
+                argument = prepare(expression)
+                function(argument)
+            except Exception:
+                continue
+            results[f'{stage}/{name}'] = measure(function, argument, repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns list of 'stage/expression' keys which are slower than baseline more than threshold times
+    """
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous and result['time_us'] > previous['time_us'] * threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark suite of calculator pipeline stages')
+    parser.add_argument('--stage', action='append', help='run only given stage, can be repeated')
+    parser.add_argument('--repeat', type=int, default=5, metavar='N', help='number of timing repeats, default 5')
+    parser.add_argument('--save', metavar='FILE', help='save results as JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare results with JSON baseline')
+    parser.add_argument('--threshold', type=float, default=1.25, metavar='RATIO',
+                        help='slowdown ratio reported as regression, default 1.25')
+    arguments = parser.parse_args()
+
+    results = run(arguments.stage, arguments.repeat)
+    baseline = {}
+    if arguments.compare:
+        with open(arguments.compare) as stream:
+            baseline = json.load(stream)['results']
+    print(f'{"stage/expression":<40} {"time, us":>12} {"peak, B":>10} {"baseline":>10}')
+    for key, result in results.items():
+        previous = baseline.get(key)
+        ratio = f'{result["time_us"] / previous["time_us"]:.2f}x' if previous else ''
+        print(f'{key:<40} {result["time_us"]:>12.3f} {result["peak_bytes"]:>10} {ratio:>10}')
+    if arguments.save:
+        with open(arguments.save, 'w') as stream:
+            json.dump({'python': platform.python_version(), 'implementation': platform.python_implementation(),
+                       'machine': platform.machine(), 'results': results}, stream, indent=2, sort_keys=True)
+    regressions = compare(results, baseline, arguments.threshold)
+    if regressions:
+        print(f'{len(regressions)} regressions slower than {arguments.threshold}x baseline: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Streaming batch evaluation of newline-delimited math expressions
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import os
+import sys
+
+from .cse import BatchCompiler
+from .pycalc import CalculationResult, Calculator
+from .stats import EvaluationStats
+
+_worker_calculator = None
+
+
+def read_expressions(stream):
+    """
+    Lazily yields expressions from text stream, one per line
+    """
+    for line in stream:
+        yield line.rstrip('\r\n')
+
+
+def calculate_results(expressions, calculator=None):
+    """
+    Lazily yields CalculationResult for every expression in input order, errors aren't raised
+    """
+    calculator = calculator or Calculator()
+    for expression in expressions:
+        yield calculator.try_calculate(expression)
+
+
+def calculate_shared(expressions, calculator=None, chunk_size=1024):
+    """
+    Lazily yields CalculationResult for every expression in input order
+    Common subexpressions of every chunk of chunk_size expressions are evaluated once
+    """
+    compiler = BatchCompiler(calculator)
+    observer = compiler.calculator.observer
+    for chunk in chunked(expressions, chunk_size):
+        for value in compiler.evaluate(compiler.compile(chunk)):
+            if isinstance(value, Exception):
+                result = CalculationResult.failure(value)
+                if observer is not None:
+                    observer.failed(result)
+                yield result
+            else:
+                yield CalculationResult.success(value)
+
+
+def evaluate_expressions(expressions, calculator=None, output_format='text'):
+    """
+    Lazily yields result or error line for every expression in input order
+    """
+    for result in calculate_results(expressions, calculator):
+        yield result.to_line(output_format)
+
+
+def evaluate_shared(expressions, calculator=None, chunk_size=1024, output_format='text'):
+    """
+    Lazily yields result or error line for every expression in input order,
+    evaluating common subexpressions of every chunk once
+    """
+    for result in calculate_shared(expressions, calculator, chunk_size):
+        yield result.to_line(output_format)
+
+
+def chunked(iterable, size):
+    """
+    Lazily yields lists of at most size items from iterable
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def initialize_worker(cache_size, numeric=None, precision=None, stats=False, store=None, limits=None):
+    """
+    Builds operation registry and compile cache once per worker process
+    """
+    global _worker_calculator
+    _worker_calculator = Calculator(cache_size, numeric=numeric, precision=precision,
+                                    observer=EvaluationStats() if stats else None, store=store, limits=limits)
+
+
+def calculate_chunk(expressions, cse=False):
+    """
+    Returns CalculationResult list of chunk and worker stats collected for it, if worker collects stats
+    cse=True evaluates common subexpressions of chunk once
+    """
+    if cse:
+        results = list(calculate_shared(expressions, _worker_calculator, len(expressions)))
+    else:
+        results = list(calculate_results(expressions, _worker_calculator))
+    stats = _worker_calculator.observer
+    if stats is not None:
+        _worker_calculator.observer = EvaluationStats()
+    return results, stats
+
+
+def calculate_parallel(expressions, jobs=None, chunk_size=256, cache_size=128, numeric=None, precision=None,
+                       stats=None, store=None, cse=False, limits=None):
+    """
+    Calculates expressions in a pool of worker processes
+    Lazily yields CalculationResult for every expression in input order as soon as it is ready
+    At most two chunks per worker are in flight, so memory usage stays bounded
+    Stats of workers are merged into stats if it is given, store is path of persistent store shared by workers
+    cse=True evaluates common subexpressions of every chunk once
+    """
+    jobs = jobs or os.cpu_count() or 1
+    initargs = (cache_size, numeric, precision, stats is not None, store, limits)
+    with ProcessPoolExecutor(jobs, initializer=initialize_worker, initargs=initargs) as executor:
+        pending = deque()
+
+        def collect():
+            results, chunk_stats = pending.popleft().result()
+            if chunk_stats is not None:
+                stats.merge(chunk_stats)
+            return results
+
+        for chunk in chunked(expressions, chunk_size):
+            pending.append(executor.submit(calculate_chunk, chunk, cse))
+            if len(pending) >= 2 * jobs:
+                yield from collect()
+        while pending:
+            yield from collect()
+
+
+def evaluate_parallel(expressions, jobs=None, chunk_size=256, cache_size=128, numeric=None, precision=None,
+                      stats=None, store=None, cse=False, output_format='text', limits=None):
+    """
+    Lazily yields result or error line for every expression in input order, calculated in worker processes
+    """
+    for result in calculate_parallel(expressions, jobs, chunk_size, cache_size, numeric, precision, stats, store, cse,
+                                     limits):
+        yield result.to_line(output_format)
+
+
+def run_batch(source='-', output=None, calculator=None, jobs=1, numeric=None, precision=None, stats=None,
+              store=None, cse=False, output_format='text', limits=None):
+    """
+    Evaluates expressions from file path or stdin ('-') writing one line per expression
+    Uses jobs worker processes if jobs isn't 1, memory usage doesn't depend on input size
+    numeric and precision select numeric backend of calculators created here,
+    stats is EvaluationStats observer collecting stats of their pipeline,
+    store is path of persistent store of converted expressions,
+    cse=True evaluates common subexpressions of chunks of expressions once,
+    output_format is 'text' for values and error messages or 'json' for objects with error codes,
+    limits is limits.Limits of evaluation of untrusted expressions
+    """
+    output = output or sys.stdout
+    stream = sys.stdin if source == '-' else open(source)
+    try:
+        expressions = read_expressions(stream)
+        if jobs == 1:
+            calculator = calculator or Calculator(numeric=numeric, precision=precision, observer=stats, store=store,
+                                                  limits=limits)
+            if cse:
+                lines = evaluate_shared(expressions, calculator, output_format=output_format)
+            else:
+                lines = evaluate_expressions(expressions, calculator, output_format)
+        else:
+            lines = evaluate_parallel(expressions, jobs, numeric=numeric, precision=precision, stats=stats, store=store,
+                                      cse=cse, output_format=output_format, limits=limits)
+        for line in lines:
+            output.write(line + '\n')
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
@@ -0,0 +1,180 @@
+"""
+Compact array-backed bytecode of compiled math expressions and its interpreter
+"""
+from array import array
+from struct import Struct
+import sys
+
+from .pycalc import (MathModuleData, MissingParameterError, RedundantParameterError, Token, UnboundVariableError,
+                     get_registry)
+
+LOAD_CONST, LOAD_VAR, CALL_1, CALL_2, CALL_N = range(5)
+
+
+class Bytecode:
+    """
+    Float program of one opcode byte and one 32-bit operand per instruction
+    LOAD_CONST operand indexes constants pool, LOAD_VAR operand indexes variable names,
+    CALL operands index registry operations, CALL_N keeps number of arguments in high 16 bits
+    Arrays may be memoryviews of a loaded buffer, they are never copied
+    """
+    __slots__ = ('expression', 'code', 'operands', 'constants', 'names', 'version')
+    header = Struct('<4s8sIII')
+    magic = b'PCB1'
+
+    def __init__(self, expression, code, operands, constants, names, version):
+        self.expression = expression
+        self.code = code
+        self.operands = operands
+        self.constants = constants
+        self.names = names
+        self.version = version
+
+    @property
+    def variables(self):
+        return frozenset(self.names)
+
+    @property
+    def rpn(self):
+        """
+        Disassembles program to RPN tokens, e.g. for observers and other evaluators
+        """
+        registry, classifier = get_registry(), MathModuleData()
+        rpn = []
+        for opcode, operand in zip(self.code, self.operands):
+            if opcode == LOAD_CONST:
+                value = self.constants[operand]
+                rpn.append(Token(Token.NUMBER, repr(value), value=value))
+            elif opcode == LOAD_VAR:
+                rpn.append(Token(Token.VARIABLE, self.names[operand]))
+            else:
+                token = classifier.make_token(registry.operation_names[operand & 0xFFFF])
+                if opcode == CALL_N:
+                    token.arity = operand >> 16
+                rpn.append(token)
+        return tuple(rpn)
+
+    def __len__(self):
+        return len(self.code)
+
+    def nbytes(self):
+        """
+        Returns memory size of program arrays and names in bytes
+        """
+        return sum(sys.getsizeof(part) for part in (self.code, self.operands, self.constants, self.names)) \
+            + sum(sys.getsizeof(name) for name in self.names)
+
+    def dump(self):
+        """
+        Returns bytes of program: header, constants, operands, opcodes and NUL separated variable names
+        Sections are aligned, so load() can cast them in place
+        """
+        names = '\0'.join(self.names).encode()
+        return b''.join((
+            self.header.pack(self.magic, bytes.fromhex(self.version), len(self.code), len(self.constants),
+                             len(self.names)),
+            memoryview(self.constants).cast('B'), memoryview(self.operands).cast('B'), memoryview(self.code),
+            names,
+        ))
+
+    @classmethod
+    def load(cls, buffer, expression=None):
+        """
+        Returns program viewing arrays of dumped buffer without copying them
+        """
+        view = memoryview(buffer).cast('B')
+        magic, version, length, constants_count, names_count = cls.header.unpack_from(view)
+        if magic != cls.magic:
+            raise ValueError('buffer isn\'t a dumped program')
+        offset = cls.header.size
+        constants = view[offset:offset + constants_count * 8].cast('d')
+        offset += constants_count * 8
+        operands = view[offset:offset + length * 4].cast('I')
+        offset += length * 4
+        code = view[offset:offset + length]
+        offset += length
+        names = tuple(bytes(view[offset:]).decode().split('\0')) if names_count else ()
+        return cls(expression, code, operands, constants, names, version.hex())
+
+
+class BytecodeCompiler(MathModuleData):
+    """
+    Assembles compiled expressions to Bytecode and interprets it dispatching on integer opcodes
+    Stack depth is checked on assembly, so interpreter runs without operand checks
+    All numbers are floats, constants folded to other types are stored as floats
+    """
+
+    def assemble(self, program):
+        """
+        Returns Bytecode of compiled expression
+        """
+        code, operands, constants = array('B'), array('I'), array('d')
+        names, pool, depth = {}, {}, 0
+        for token in program.rpn:
+            kind = token.kind
+            if kind == Token.NUMBER or kind == Token.CONSTANT:
+                value = float(token.value)
+                key = value.hex()
+                if key not in pool:
+                    pool[key] = len(constants)
+                    constants.append(value)
+                code.append(LOAD_CONST)
+                operands.append(pool[key])
+                depth += 1
+            elif kind == Token.VARIABLE:
+                code.append(LOAD_VAR)
+                operands.append(names.setdefault(token.text, len(names)))
+                depth += 1
+            else:
+                if depth < token.arity:
+                    raise MissingParameterError(f'not enough operands for "{token.text}" operation', token.position)
+                index = self.registry.operation_indexes[token.text]
+                if token.arity == 1:
+                    code.append(CALL_1)
+                    operands.append(index)
+                elif token.arity == 2:
+                    code.append(CALL_2)
+                    operands.append(index)
+                else:
+                    code.append(CALL_N)
+                    operands.append(index | token.arity << 16)
+                depth -= token.arity - 1
+        if depth > 1:
+            raise RedundantParameterError('function takes more parameters that it should')
+        if not depth:
+            raise MissingParameterError('no numbers or constants in expression')
+        return Bytecode(program.expression, code, operands, constants, tuple(names), self.registry.version)
+
+    def evaluate(self, bytecode, mapping=None, /, **bindings):
+        """
+        Evaluates Bytecode with free variables bound from mapping and/or keyword arguments
+        """
+        if bytecode.version != self.registry.version:
+            raise ValueError('program was assembled with other operation registry')
+        if mapping is not None:
+            bindings = {**mapping, **bindings} if bindings else mapping
+        values = []
+        for name in bytecode.names:
+            try:
+                values.append(float(bindings[name]))
+            except (KeyError, TypeError):
+                raise UnboundVariableError(f'no value for variable "{name}"')
+        constants, actions = bytecode.constants, self.registry.operation_actions
+        stack = []
+        push, pop = stack.append, stack.pop
+        for opcode, operand in zip(bytecode.code, bytecode.operands):
+            if opcode == LOAD_CONST:
+                push(constants[operand])
+            elif opcode == CALL_2:
+                y = pop()
+                stack[-1] = actions[operand](stack[-1], y)
+            elif opcode == CALL_1:
+                stack[-1] = actions[operand](stack[-1])
+            elif opcode == LOAD_VAR:
+                push(values[operand])
+            else:
+                arity = operand >> 16
+                args = stack[-arity:]
+                del stack[-arity:]
+                push(actions[operand & 0xFFFF](*args))
+        return stack[0]
@@ -0,0 +1,112 @@
+"""
+Code generation of native Python functions from compiled math expressions
+"""
+import ast
+
+from .pycalc import (CompiledExpressionCache, MissingParameterError, RedundantParameterError,
+                     ReversePolishNotationHandler, Token, UnboundVariableError, UnsupportedOperationError)
+
+
+class CodeGenerator(ReversePolishNotationHandler):
+    """
+    Turns compiled expression into Python function taking variables as arguments
+    Arithmetic and comparisons become native operators, other tokens call their actions directly
+    Parameters get synthetic names, so variables named like Python keywords are fine
+    Expressions too deep for Python compiler fall back to RPN interpreter
+    Generated code is float-only: arguments are converted to float and programs with Decimal or Fraction numbers
+    are rejected, programs of other numeric backends should be evaluated by their calculator
+    """
+    literal_types = (float, int, bool)
+    binary_operators = {'+': ast.Add, '-': ast.Sub, '*': ast.Mult}
+    comparisons = {'<': ast.Lt, '<=': ast.LtE, '=': ast.Eq, '==': ast.Eq, '!=': ast.NotEq, '>=': ast.GtE, '>': ast.Gt}
+
+    def __init__(self, cache_size=128):
+        super().__init__()
+        self.functions = CompiledExpressionCache(cache_size)
+
+    def build_expression(self, program, namespace, parameters):
+        """
+        Builds AST expression node of RPN program, registering actions in namespace
+        parameters maps variable names to names of function parameters
+        """
+        actions, stack = {}, []
+        for token in program.rpn:
+            kind = token.kind
+            if kind == Token.NUMBER or kind == Token.CONSTANT:
+                if type(token.value) not in self.literal_types:
+                    raise UnsupportedOperationError(f'generated code takes only float numbers, "{token.text}" is '
+                                                    f'{type(token.value).__name__}', token.position)
+                stack.append(ast.Constant(token.value))
+            elif kind == Token.VARIABLE:
+                stack.append(ast.Name(parameters[token.text], ast.Load()))
+            else:
+                if len(stack) < token.arity:
+                    raise MissingParameterError(f'not enough operands for "{token.text}" operation', token.position)
+                args = stack[-token.arity:]
+                del stack[-token.arity:]
+                if token.text in self.binary_operators:
+                    stack.append(ast.BinOp(args[0], self.binary_operators[token.text](), args[1]))
+                elif token.text in self.comparisons:
+                    stack.append(ast.Compare(args[0], [self.comparisons[token.text]()], [args[1]]))
+                else:
+                    name = actions.get(token.action)
+                    if name is None:
+                        name = actions[token.action] = f'_{len(actions)}'
+                        namespace[name] = token.action
+                    stack.append(ast.Call(ast.Name(name, ast.Load()), args, []))
+        if len(stack) > 1:
+            raise RedundantParameterError('function takes more parameters that it should')
+        if not stack:
+            raise MissingParameterError('no numbers or constants in expression')
+        return stack[0]
+
+    def generate(self, program):
+        """
+        Returns Python function of compiled expression
+        Function takes values of variables as positional arguments in order of its arguments attribute
+        """
+        arguments = tuple(sorted(program.variables))
+        parameters = {name: f'_a{index}' for index, name in enumerate(arguments)}
+        namespace = {'_float': float}
+        expression = self.build_expression(program, namespace, parameters)
+        module = ast.parse('def expression():\n    return None\n')
+        function = module.body[0]
+        function.args = ast.arguments(posonlyargs=[], args=[ast.arg(parameters[name]) for name in arguments],
+                                      vararg=None, kwonlyargs=[], kw_defaults=[], kwarg=None, defaults=[])
+        function.body = [ast.Assign([ast.Name(parameters[name], ast.Store())],
+                                    ast.Call(ast.Name('_float', ast.Load()), [ast.Name(parameters[name], ast.Load())],
+                                             []))
+                         for name in arguments] + [ast.Return(expression)]
+        try:
+            code = compile(ast.fix_missing_locations(module), f'<pycalc {program.expression!r}>', 'exec')
+        except (RecursionError, MemoryError, SyntaxError):
+            def interpreted(*values):
+                return self.handle_operations(program.rpn, dict(zip(arguments, values)))
+
+            function = interpreted
+        else:
+            exec(code, namespace)
+            function = namespace['expression']
+        function.arguments = arguments
+        return function
+
+    def evaluate(self, program, mapping=None, /, **bindings):
+        """
+        Evaluates compiled expression through its generated function, generated once per program
+        """
+        function = self.functions.get(program)
+        if function is None:
+            function = self.generate(program)
+            self.functions.put(program, function)
+        if mapping is not None:
+            bindings = {**mapping, **bindings} if bindings else mapping
+        if not function.arguments:
+            return function()
+        try:
+            values = [bindings[name] for name in function.arguments]
+        except KeyError as e:
+            name = e.args[0]
+            position = next(token.position for token in program.rpn
+                            if token.kind == Token.VARIABLE and token.text == name)
+            raise UnboundVariableError(f'no value for variable "{name}"', position)
+        return function(*values)
@@ -0,0 +1,165 @@
+"""
+Common subexpression elimination across batches of compiled math expressions
+"""
+from collections import namedtuple
+from time import perf_counter
+
+from .pycalc import (Calculator, CalculatorError, MissingParameterError, RedundantParameterError, Token,
+                     UnboundVariableError)
+
+COMMUTATIVE = frozenset(('+', '*'))
+
+
+def hash_cons(program, node, impure=frozenset()):
+    """
+    Walks RPN tokens of compiled program calling node(key, token, children) for every subexpression,
+    children are values node returned for operands of operation in RPN order
+    Equal subexpressions have equal keys, operands of commutative operations are sorted in keys only,
+    calls of impure functions get unique keys, so they aren't shared
+    Returns value node returned for the whole expression
+    """
+    stack = []
+    for token in program.rpn:
+        if not token.arity:
+            stack.append(node((token.kind, token.text), token, ()))
+            continue
+        if len(stack) < token.arity:
+            raise MissingParameterError(f'not enough operands for "{token.text}" operation', token.position)
+        children = tuple(stack[-token.arity:])
+        del stack[-token.arity:]
+        key = (token.text, token.arity) + (tuple(sorted(children)) if token.text in COMMUTATIVE else children)
+        if token.text in impure:
+            key += (object(),)
+        stack.append(node(key, token, children))
+    if len(stack) > 1:
+        raise RedundantParameterError('function takes more parameters that it should')
+    if not stack:
+        raise MissingParameterError('no numbers or constants in expression')
+    return stack[0]
+
+
+class SharedProgram(namedtuple('SharedProgram',
+                               'expressions programs roots values variables operations evaluations')):
+    """
+    Batch of expressions compiled to one list of unique subexpressions in topological order
+    programs are compiled expressions or None for failed ones,
+    roots are node indexes of expressions or their compile errors, values keep values of literal nodes,
+    variables are (index, name, position) triples, operations are (index, action, children) triples
+    and evaluations is number of operations of expressions without sharing
+    """
+    __slots__ = ()
+
+    @property
+    def saved(self):
+        """
+        Number of operation evaluations saved by sharing subexpressions
+        """
+        return self.evaluations - len(self.operations)
+
+
+class BatchCompiler:
+    """
+    Compiles batches of expressions to SharedProgram evaluating every unique subexpression once
+    Uses calculator for compiling, its numeric backend for numbers, bytecode isn't supported
+    Resource limits of calculator are checked after every operation, batch gets time budget of all its expressions
+    """
+
+    def __init__(self, calculator=None):
+        calculator = calculator or Calculator()
+        if calculator.assembler is not None:
+            raise ValueError('subexpression elimination needs RPN programs, not bytecode')
+        self.calculator = calculator
+        self.convert = (calculator.backend or calculator).convert
+
+    def compile(self, expressions):
+        """
+        Returns SharedProgram of expressions, expressions failing to compile keep their errors
+        """
+        expressions = tuple(expressions)
+        keys, values, variables, operations, roots, programs = {}, [], [], [], [], []
+        evaluations = 0
+
+        def node(key, token, children):
+            index = keys.get(key)
+            if index is None:
+                index = keys[key] = len(values)
+                values.append(token.value)
+                if token.kind == Token.VARIABLE:
+                    variables.append((index, token.text, token.position))
+                elif token.arity:
+                    operations.append((index, token.action, children))
+            return index
+
+        for expression in expressions:
+            try:
+                program = self.calculator.compile(expression)
+                roots.append(hash_cons(program, node, self.calculator.registry.impure_functions))
+            except Exception as e:
+                roots.append(e)
+                programs.append(None)
+            else:
+                programs.append(program)
+                evaluations += sum(1 for token in program.rpn if token.arity)
+        return SharedProgram(expressions, tuple(programs), tuple(roots), tuple(values), tuple(variables),
+                             tuple(operations), evaluations)
+
+    def evaluate(self, program, mapping=None, /, **bindings):
+        """
+        Evaluates SharedProgram with free variables bound from mapping and/or keyword arguments
+        Returns list of values of expressions in order, failed expressions have their errors instead
+        Shared node may keep operands order of other expression, so failed expressions are evaluated
+        once more on their own to get the same error as per-expression evaluation
+        Observer gets latency of the whole batch as 'evaluate' stage and operations of succeeded expressions,
+        failed ones are reported by their evaluation on their own
+        """
+        if mapping is not None:
+            bindings = {**mapping, **bindings} if bindings else mapping
+        observer = self.calculator.observer
+        start = perf_counter() if observer is not None else None
+        values, convert, failed = list(program.values), self.convert, False
+        guard = self.calculator.guard
+        deadline = guard.deadline(len(program.roots)) if guard is not None else None
+        for index, name, position in program.variables:
+            try:
+                values[index] = convert(bindings[name])
+            except (KeyError, TypeError):
+                values[index] = UnboundVariableError(f'no value for variable "{name}"', position)
+                failed = True
+        for index, action, children in program.operations:
+            args = [values[child] for child in children]
+            if failed:
+                error = next((arg for arg in args if isinstance(arg, Exception)), None)
+                if error is not None:
+                    values[index] = error
+                    continue
+            try:
+                if deadline is not None:
+                    guard.check_deadline(deadline)
+                value = action(*args)
+                if guard is not None and type(value) is not float:
+                    guard.check_result(value)
+                values[index] = value
+            except (ArithmeticError, ValueError, TypeError, CalculatorError) as e:
+                values[index] = e
+                failed = True
+        results = [root if isinstance(root, Exception) else values[root] for root in program.roots]
+        if observer is not None:
+            observer.stage('evaluate', perf_counter() - start)
+            observer.shared(program.evaluations, program.saved)
+            for compiled, result in zip(program.programs, results):
+                if compiled is not None and not isinstance(result, Exception):
+                    observer.evaluated(compiled)
+        if failed:
+            for index, root in enumerate(program.roots):
+                if isinstance(results[index], Exception) and not isinstance(root, Exception):
+                    results[index] = self.recalculate(program.expressions[index], bindings)
+        return results
+
+    def recalculate(self, expression, bindings):
+        """
+        Returns value or error of expression evaluated without sharing
+        """
+        try:
+            return self.calculator.evaluate(self.calculator.compile(expression), bindings)
+        except Exception as e:
+            return e
@@ -0,0 +1,170 @@
+"""
+User-defined functions of calculator: Python callables and macros defined by expressions
+"""
+from collections import Counter, namedtuple
+from functools import lru_cache
+from re import DOTALL, compile
+
+from .pycalc import (MathModuleData, MissingParameterError, OperationRegistry, RedundantParameterError,
+                     ReversePolishNotationConverter, ReversePolishNotationHandler, Token, TokenLimitError,
+                     UnboundVariableError)
+
+
+class UserFunction(namedtuple('UserFunction', 'name action arity pure parameters rpn')):
+    """
+    Function added to operation registry by FunctionLibrary
+    parameters and rpn are parameter names and RPN body of macro, None for Python callable
+    """
+    __slots__ = ()
+
+
+class MacroExpander(MathModuleData):
+    """
+    Inlines calls of macros of operation registry into compiled expressions
+    Body tokens get position of call, arguments used in body more than once are duplicated only if they are
+    single numbers, constants or variables, otherwise macro is called as function evaluating arguments once
+    max_tokens stops expansion of nested calls growing expression over the limit, default_max_tokens applies
+    if it isn't given
+    """
+    default_max_tokens = 10000
+
+    def __init__(self, registry, max_tokens=None):
+        super().__init__(registry)
+        self.max_tokens = max_tokens if max_tokens is not None else self.default_max_tokens
+
+    def expand(self, rpn):
+        """
+        Returns RPN tokens list with bodies of macros in place of their calls
+        """
+        macros, max_tokens, stack = self.registry.macros, self.max_tokens, []
+        for token in rpn:
+            if not token.arity:
+                stack.append([token])
+                continue
+            if len(stack) < token.arity:
+                raise MissingParameterError(f'not enough operands for "{token.text}" operation', token.position)
+            args = stack[-token.arity:]
+            del stack[-token.arity:]
+            macro = macros.get(token.text)
+            if macro is not None:
+                uses = Counter(item.text for item in macro.rpn if item.kind == Token.VARIABLE)
+                if any(uses[parameter] > 1 and len(arg) > 1 for parameter, arg in zip(macro.parameters, args)):
+                    macro = None
+            if macro is None:
+                stack.append([item for arg in args for item in arg] + [token])
+                continue
+            arguments, fragment = dict(zip(macro.parameters, args)), []
+            for item in macro.rpn:
+                if item.kind == Token.VARIABLE:
+                    fragment.extend(arguments[item.text])
+                else:
+                    fragment.append(Token(item.kind, item.text, token.position, item.value, item.action, item.arity,
+                                          item.priority))
+            if len(fragment) > max_tokens:
+                raise TokenLimitError(f'call of "{token.text}" expands to {len(fragment)} tokens, '
+                                      f'limit is {max_tokens}', token.position)
+            stack.append(fragment)
+        if len(stack) > 1:
+            raise RedundantParameterError('function takes more parameters that it should')
+        if not stack:
+            raise MissingParameterError('no numbers or constants in expression')
+        return stack[0]
+
+    def inline(self, program):
+        """
+        Returns compiled expression with inlined macros
+        Malformed expressions are returned unchanged to fail on evaluation
+        """
+        macros = self.registry.macros
+        if not any(token.text in macros for token in program.rpn):
+            return program
+        try:
+            rpn = tuple(self.expand(program.rpn))
+        except (MissingParameterError, RedundantParameterError):
+            return program
+        return program._replace(rpn=rpn,
+                                variables=frozenset(token.text for token in rpn if token.kind == Token.VARIABLE))
+
+
+class FunctionLibrary(ReversePolishNotationConverter):
+    """
+    User-defined functions added to operation registry of calculators created with Calculator(functions=library)
+    register() adds Python callables, define() adds macros defined by expressions like "f(x)=x^2+1",
+    which are inlined into calling expressions on compilation unless that would evaluate an argument twice
+    Pure functions are folded by optimizer and memoized, impure ones are called on every evaluation
+    """
+    definition_pattern = compile(r'\s*([A-Za-z][A-Za-z0-9]*)\s*\(([^()]*)\)\s*=(?!=)(.*)', DOTALL)
+    name_pattern = compile(r'[A-Za-z][A-Za-z0-9]*')
+
+    def __init__(self):
+        super().__init__()
+        self.functions = {}
+
+    def __contains__(self, name):
+        return name in self.functions
+
+    def __len__(self):
+        return len(self.functions)
+
+    def check_name(self, name, kind='function'):
+        """
+        Checks whether name can be name of new function or parameter
+        """
+        if not isinstance(name, str) or not self.name_pattern.fullmatch(name):
+            raise ValueError(f'"{name}" isn\'t valid {kind} name')
+        if name in self.registry.all_operations or name in self.registry.constants:
+            raise ValueError(f'"{name}" is already defined')
+        if kind == 'parameter' and self.lexer.split_constants(name) != [name]:
+            constants = ' and '.join(self.lexer.split_constants(name))
+            raise ValueError(f'parameter "{name}" is read as constants {constants}')
+
+    def add(self, function):
+        """
+        Adds user function and rebuilds operation registry with lexer and resolver using it
+        """
+        self.functions[function.name] = function
+        super().__init__(OperationRegistry(self.functions))
+
+    def register(self, name, function, arity=None, pure=False, cache_size=128):
+        """
+        Adds Python callable taking arity numbers, arity is counted by its signature by default
+        Pure function returns the same result for the same arguments and has no side effects,
+        its results are memoized in LRU cache of cache_size entries, None means unbounded cache
+        """
+        self.check_name(name)
+        if arity is None:
+            arity = OperationRegistry.count_arguments(name, function)
+        if arity < 1:
+            raise ValueError(f'function "{name}" must take at least one argument')
+        if pure and cache_size != 0:
+            function = lru_cache(maxsize=cache_size, typed=True)(function)
+        self.add(UserFunction(name, function, arity, pure, None, None))
+
+    def define(self, definition):
+        """
+        Adds macro defined by expression like "lerp(a,b,t)=a+(b-a)*t"
+        Body may call functions defined before and use only parameters as variables
+        """
+        match = self.definition_pattern.fullmatch(definition)
+        if match is None:
+            raise ValueError(f'definition "{definition}" doesn\'t look like "f(x)=expression"')
+        name, parameters, body = match.group(1), match.group(2).split(','), match.group(3).strip()
+        parameters = tuple(parameter.strip() for parameter in parameters)
+        self.check_name(name)
+        if parameters == ('',):
+            raise ValueError(f'function "{name}" must take at least one argument')
+        for parameter in parameters:
+            self.check_name(parameter, 'parameter')
+        if len(set(parameters)) != len(parameters):
+            raise ValueError(f'function "{name}" has repeated parameters')
+        rpn = tuple(MacroExpander(self.registry).expand(super().convert_to_rpn(body)))
+        for token in rpn:
+            if token.kind == Token.VARIABLE and token.text not in parameters:
+                raise UnboundVariableError(f'variable "{token.text}" isn\'t parameter of function "{name}"',
+                                           token.position)
+        handler = ReversePolishNotationHandler()
+
+        def action(*args):
+            return handler.handle_operations(rpn, dict(zip(parameters, args)))
+
+        self.add(UserFunction(name, action, len(parameters), True, parameters, rpn))
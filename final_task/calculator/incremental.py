@@ -0,0 +1,161 @@
+"""
+Incremental re-evaluation of formula sets over a shared dependency graph
+"""
+from heapq import heappop, heappush
+from threading import Lock
+
+from .cse import hash_cons
+from .pycalc import Calculator, CalculatorError, Token, UnboundVariableError
+
+
+class FormulaGraph:
+    """
+    Dependency DAG of named formulas, equal subexpressions of all formulas share one node
+    Node values are memoized, changed variables recompute only nodes depending on them,
+    and dependents of nodes keeping their value aren't recomputed at all
+    Failed nodes keep their error, which formulas depending on them share
+    Uses calculator for compiling, its numeric backend for numbers, bytecode isn't supported
+    Resource limits of calculator are checked after every operation, every add() and update() call
+    gets its own time budget, nodes computed after it is exhausted keep TimeLimitError
+    """
+
+    def __init__(self, calculator=None):
+        calculator = calculator or Calculator()
+        if calculator.assembler is not None:
+            raise ValueError('incremental evaluation needs RPN programs, not bytecode')
+        self.calculator = calculator
+        self.convert = (calculator.backend or calculator).convert
+        self.guard = calculator.guard
+        self.formulas = {}
+        self.recomputed = 0
+        self.__keys = {}
+        self.__actions, self.__children, self.__dependents, self.__values = [], [], [], []
+        self.__roots = {}
+        self.__deadline = None
+        self.__lock = Lock()
+
+    def __len__(self):
+        """
+        Returns number of distinct nodes of all formulas
+        """
+        return len(self.__values)
+
+    def __contains__(self, name):
+        return name in self.formulas
+
+    def __getitem__(self, name):
+        """
+        Returns current value of formula, raises its error if formula fails
+        """
+        value = self.__values[self.formulas[name]]
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    @staticmethod
+    def same(old, new):
+        """
+        Checks whether recomputed value equals memoized one, NaNs and equal errors are the same
+        """
+        if isinstance(old, Exception) or isinstance(new, Exception):
+            return type(old) is type(new) and old.args == new.args
+        return old == new or old != old and new != new
+
+    def node(self, key, action=None, children=(), value=None):
+        """
+        Returns index of node with key, creating and computing it if graph has no such node
+        Nodes are created after their children, so indexes are in topological order
+        """
+        index = self.__keys.get(key)
+        if index is None:
+            index = self.__keys[key] = len(self.__values)
+            self.__actions.append(action)
+            self.__children.append(children)
+            self.__dependents.append([])
+            self.__values.append(value)
+            for child in set(children):
+                self.__dependents[child].append(index)
+            if action is not None:
+                self.__values[index] = self.compute(index)
+        return index
+
+    def intern(self, key, token, children):
+        if token.kind == Token.VARIABLE:
+            return self.variable(token.text)
+        if not token.arity:
+            return self.node(key, value=token.value)
+        return self.node(key, token.action, children)
+
+    def variable(self, name):
+        return self.node((Token.VARIABLE, name), value=UnboundVariableError(f'no value for variable "{name}"'))
+
+    def compute(self, index):
+        args = [self.__values[child] for child in self.__children[index]]
+        for arg in args:
+            if isinstance(arg, Exception):
+                return arg
+        guard = self.guard
+        try:
+            if guard is not None:
+                guard.check_deadline(self.__deadline)
+            value = self.__actions[index](*args)
+            if guard is not None and type(value) is not float:
+                guard.check_result(value)
+            return value
+        except (ArithmeticError, ValueError, TypeError, CalculatorError) as e:
+            return e
+
+    def add(self, name, expression):
+        """
+        Compiles expression and adds it as formula name, reusing nodes of equal subexpressions
+        Returns current value of formula, or its error
+        """
+        program = self.calculator.compile(expression)
+        with self.__lock:
+            if name in self.formulas:
+                raise ValueError(f'formula "{name}" is already defined')
+            if self.guard is not None:
+                self.__deadline = self.guard.deadline()
+            root = hash_cons(program, self.intern, self.calculator.registry.impure_functions)
+            self.formulas[name] = root
+            self.__roots.setdefault(root, []).append(name)
+            return self.__values[root]
+
+    def update(self, mapping=None, /, **bindings):
+        """
+        Sets variables from mapping and/or keyword arguments and recomputes nodes depending on changed ones
+        Returns dict of formulas which changed value to their new values or errors
+        """
+        if mapping is not None:
+            bindings = {**mapping, **bindings} if bindings else mapping
+        with self.__lock:
+            if self.guard is not None:
+                self.__deadline = self.guard.deadline()
+            values, dependents, roots = self.__values, self.__dependents, self.__roots
+            dirty, scheduled, changed = [], set(), {}
+
+            def mark(index):
+                for name in roots.get(index, ()):
+                    changed[name] = values[index]
+                for dependent in dependents[index]:
+                    if dependent not in scheduled:
+                        scheduled.add(dependent)
+                        heappush(dirty, dependent)
+
+            for name, value in bindings.items():
+                index = self.variable(name)
+                try:
+                    value = self.convert(value)
+                except (TypeError, ValueError, ArithmeticError):
+                    value = UnboundVariableError(f'no value for variable "{name}"')
+                if not self.same(values[index], value):
+                    values[index] = value
+                    mark(index)
+            while dirty:
+                index = heappop(dirty)
+                value = self.compute(index)
+                self.recomputed += 1
+                if not self.same(values[index], value):
+                    values[index] = value
+                    mark(index)
+            return changed
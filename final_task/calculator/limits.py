@@ -0,0 +1,185 @@
+"""
+Guarded evaluation of untrusted math expressions within resource limits
+"""
+from collections import namedtuple
+from time import perf_counter
+import math
+
+from .pycalc import (DepthLimitError, LengthLimitError, MissingParameterError, NumberLimitError,
+                     RedundantParameterError, ReversePolishNotationHandler, TimeLimitError, Token, TokenLimitError,
+                     UnboundVariableError)
+
+
+class Limits(namedtuple('Limits', 'max_length max_tokens max_depth max_bits max_factorial timeout')):
+    """
+    Resource limits of guarded evaluation, None disables a limit
+    max_length is number of characters of expression, max_tokens number of its RPN tokens,
+    max_depth depth of its expression tree, max_bits bit length of exact numbers and magnitude of powers,
+    max_factorial argument of factorial, comb and perm, timeout wall-clock seconds of evaluation
+    """
+    __slots__ = ()
+
+    def __new__(cls, max_length=10000, max_tokens=1000, max_depth=100, max_bits=10000, max_factorial=1000,
+                timeout=1.0):
+        return super().__new__(cls, max_length, max_tokens, max_depth, max_bits, max_factorial, timeout)
+
+
+class ExpressionGuard(ReversePolishNotationHandler):
+    """
+    Checks compiled expressions against Limits and evaluates them within the time budget
+    Size, depth and literal arguments are checked on compilation, factorial and power actions
+    check their arguments before computing, exact results are checked after every operation
+    Time budget is checked between operations, so no single operation may run long
+    """
+    factorials = frozenset(('!', 'factorial', 'comb', 'perm'))
+    powers = frozenset(('^', '**', 'pow'))
+
+    def __init__(self, limits=None, convert=float):
+        super().__init__()
+        self.limits = limits or Limits()
+        self.convert = convert
+
+    @staticmethod
+    def bits(value):
+        """
+        Returns bit length of numerator or denominator of exact number, None for inexact one
+        """
+        numerator = getattr(value, 'numerator', None)
+        if numerator is None:
+            return None
+        return max(numerator.bit_length(), value.denominator.bit_length())
+
+    def power_bits(self, digit, base):
+        """
+        Estimates bit length of digit raised to base
+        Inexact numbers count only when power grows, shrinking ones just underflow to zero
+        """
+        size = self.bits(digit)
+        if size is None:
+            digit = abs(digit)
+            if not 1 < digit < math.inf or not base > 0:
+                return 0
+            return float(base) * math.log2(float(digit))
+        elif size <= 1:
+            return 0
+        return abs(base) * size
+
+    def check_factorial(self, text, digit, position=None):
+        if self.limits.max_factorial is not None and digit > self.limits.max_factorial:
+            raise NumberLimitError(f'argument of "{text}" exceeds limit of {self.limits.max_factorial}', position)
+
+    def check_power(self, digit, base, position=None):
+        if self.limits.max_bits is not None and self.power_bits(digit, base) > self.limits.max_bits:
+            raise NumberLimitError(f'power exceeds limit of {self.limits.max_bits} bits', position)
+
+    def deadline(self, count=1):
+        """
+        Returns deadline of evaluation of count expressions started now, None without time limit
+        """
+        timeout = self.limits.timeout
+        return perf_counter() + timeout * count if timeout is not None else None
+
+    def check_deadline(self, deadline, position=None):
+        if deadline is not None and perf_counter() > deadline:
+            raise TimeLimitError(f'evaluation exceeds time limit of {self.limits.timeout} seconds', position)
+
+    def check_result(self, value, text=None, position=None):
+        """
+        Checks bit length of exact result of operation text
+        """
+        max_bits = self.limits.max_bits
+        if max_bits is not None:
+            size = self.bits(value)
+            if size is not None and size > max_bits:
+                operation = f' of "{text}"' if text is not None else ''
+                raise NumberLimitError(f'result{operation} exceeds limit of {max_bits} bits', position)
+
+    def guard(self, token):
+        """
+        Returns token with action checking its arguments against limits before calling original action
+        """
+        action, text, position = token.action, token.text, token.position
+        if text in self.factorials:
+            def guarded(digit, *args):
+                self.check_factorial(text, digit, position)
+                return action(digit, *args)
+        elif text in self.powers:
+            def guarded(digit, base):
+                self.check_power(digit, base, position)
+                return action(digit, base)
+        else:
+            return token
+        return Token(token.kind, text, position, action=guarded, arity=token.arity, priority=token.priority)
+
+    def check_length(self, expression):
+        if self.limits.max_length is not None and len(expression) > self.limits.max_length:
+            raise LengthLimitError(f'expression has {len(expression)} characters, limit is {self.limits.max_length}',
+                                   self.limits.max_length)
+
+    def prepare(self, program):
+        """
+        Checks token count, tree depth and literal arguments of compiled expression
+        Returns compiled expression with guarded actions
+        """
+        limits, rpn = self.limits, program.rpn
+        if limits.max_tokens is not None and len(rpn) > limits.max_tokens:
+            raise TokenLimitError(f'expression has {len(rpn)} tokens, limit is {limits.max_tokens}',
+                                  rpn[limits.max_tokens].position)
+        depths, literals, guarded = [], [], []
+        for token in rpn:
+            if not token.arity:
+                depths.append(1)
+                literals.append(token.value if token.kind != Token.VARIABLE else None)
+                guarded.append(token)
+                continue
+            if len(depths) < token.arity:
+                raise MissingParameterError(f'not enough operands for "{token.text}" operation', token.position)
+            depth = max(depths[-token.arity:]) + 1
+            args = literals[-token.arity:]
+            del depths[-token.arity:], literals[-token.arity:]
+            if limits.max_depth is not None and depth > limits.max_depth:
+                raise DepthLimitError(f'expression is nested deeper than {limits.max_depth} levels', token.position)
+            if args[0] is not None:
+                if token.text in self.factorials:
+                    self.check_factorial(token.text, args[0], token.position)
+                elif token.text in self.powers and args[-1] is not None:
+                    self.check_power(args[0], args[-1], token.position)
+            depths.append(depth)
+            literals.append(None)
+            guarded.append(self.guard(token))
+        if len(depths) > 1:
+            raise RedundantParameterError('function takes more parameters that it should')
+        return program._replace(rpn=tuple(guarded))
+
+    def handle_operations(self, rpn_tokens, bindings=None):
+        """
+        Handles Reverse Polish Notation tokens within time budget and bit length limit of exact numbers
+        """
+        deadline, stack = self.deadline(), []
+        for token in rpn_tokens:
+            kind = token.kind
+            if kind == Token.NUMBER or kind == Token.CONSTANT:
+                stack.append(token.value)
+                continue
+            if kind == Token.VARIABLE:
+                try:
+                    stack.append(self.convert(bindings[token.text]))
+                except (KeyError, TypeError):
+                    raise UnboundVariableError(f'no value for variable "{token.text}"', token.position)
+                continue
+            if deadline is not None and perf_counter() > deadline:
+                raise TimeLimitError(f'evaluation exceeds time limit of {self.limits.timeout} seconds',
+                                     token.position)
+            if len(stack) < token.arity:
+                raise MissingParameterError(f'not enough operands for "{token.text}" operation', token.position)
+            args = stack[-token.arity:]
+            del stack[-token.arity:]
+            value = token.action(*args)
+            if type(value) is not float:
+                self.check_result(value, token.text, token.position)
+            stack.append(value)
+        if len(stack) > 1:
+            raise RedundantParameterError('function takes more parameters that it should')
+        if not stack:
+            raise MissingParameterError('no numbers or constants in expression')
+        return stack[0]
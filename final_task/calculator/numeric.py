@@ -0,0 +1,347 @@
+"""
+Numeric backends evaluating compiled math expressions with float, Decimal or Fraction numbers
+"""
+from abc import ABCMeta, abstractmethod
+import decimal
+from decimal import Decimal, ROUND_CEILING, ROUND_DOWN, ROUND_FLOOR, ROUND_HALF_EVEN
+from fractions import Fraction
+import math
+
+from .pycalc import MathOperationsHandler, ReversePolishNotationHandler, Token, UnsupportedOperationError
+
+
+class NumericBackend(ReversePolishNotationHandler, metaclass=ABCMeta):
+    """
+    Base numeric backend with its own tables of operations and constants
+    prepare() binds tokens of compiled expression to backend numbers and operations once per program,
+    so evaluation runs the same RPN handler loop as float calculation
+    """
+    name = None
+
+    def __init__(self):
+        super().__init__()
+        self.operations = {}
+        self.constants = {}
+
+    @abstractmethod
+    def number(self, text):
+        """
+        Returns backend number of number literal text
+        """
+
+    @abstractmethod
+    def convert(self, value):
+        """
+        Returns backend number of variable value, floats are taken by their shortest repr
+        """
+
+    def prepare(self, program):
+        """
+        Returns compiled expression with tokens bound to backend numbers and operations
+        Raises UnsupportedOperationError for functions and constants missing in backend tables
+        Operations missing in the shared registry are user-defined functions, they take backend numbers as is
+        """
+        rpn = []
+        for token in program.rpn:
+            kind = token.kind
+            if kind == Token.NUMBER:
+                token = Token(kind, token.text, token.position, value=self.number(token.text))
+            elif kind == Token.CONSTANT:
+                if token.text not in self.constants:
+                    raise UnsupportedOperationError(f'constant "{token.text}" is not supported by {self.name} numbers',
+                                                    token.position)
+                token = Token(kind, token.text, token.position, value=self.constants[token.text])
+            elif kind != Token.VARIABLE:
+                if token.text not in self.operations:
+                    if token.text not in self.registry.all_operations:
+                        rpn.append(token)
+                        continue
+                    raise UnsupportedOperationError(f'operation "{token.text}" is not supported by {self.name} numbers',
+                                                    token.position)
+                token = Token(kind, token.text, token.position, action=self.operations[token.text],
+                              arity=token.arity, priority=token.priority)
+            rpn.append(token)
+        return program._replace(rpn=tuple(rpn))
+
+
+class FloatBackend(NumericBackend):
+    """
+    Fast default backend, math module functions over float numbers
+    """
+    name = 'float'
+    convert = float
+
+    def __init__(self):
+        super().__init__()
+        self.operations = {name: action for name, action in super().get_all_operations().items() if action}
+        self.constants = dict(super().get_constants())
+
+    def number(self, text):
+        return float(text)
+
+    def prepare(self, program):
+        return program
+
+
+class DecimalBackend(NumericBackend):
+    """
+    Arbitrary-precision backend over decimal.Decimal numbers
+    All operations are rounded by its own context, so they don't depend on context of current thread
+    Trigonometric and other transcendental functions except exp and logarithms aren't supported
+    """
+    name = 'decimal'
+
+    def __init__(self, context=None):
+        super().__init__()
+        self.context = context.copy() if context is not None else decimal.Context()
+        context = self.context
+        comparisons = {name: action for name, (priority, action) in super().get_one_sign_operations().items()
+                       if priority == 0}
+        pi = self.count_pi()
+        self.constants = {
+            'pi': pi,
+            'tau': context.multiply(2, pi),
+            'e': context.exp(Decimal(1)),
+            'inf': Decimal('Infinity'),
+            'nan': Decimal('NaN'),
+        }
+        self.operations = {
+            **comparisons,
+            '^': self.power,
+            '**': self.power,
+            'pow': self.power,
+            '/': self.divide,
+            '//': self.int_divide,
+            '%': self.get_rest_of_division,
+            '*': context.multiply,
+            '+': context.add,
+            '-': context.subtract,
+            '!': self.factorial,
+            'factorial': self.factorial,
+            'minus': context.minus,
+            'plus': context.plus,
+            'abs': context.abs,
+            'fabs': context.abs,
+            'sqrt': self.square_root,
+            'exp': context.exp,
+            'ln': self.logarithm_by_e,
+            'log': self.logarithm,
+            'log2': self.logarithm_by_two,
+            'log10': self.logarithm_by_ten,
+            'floor': lambda digit: digit.to_integral_value(ROUND_FLOOR, context),
+            'ceil': lambda digit: digit.to_integral_value(ROUND_CEILING, context),
+            'trunc': lambda digit: digit.to_integral_value(ROUND_DOWN, context),
+            'round': lambda digit: digit.to_integral_value(ROUND_HALF_EVEN, context),
+            'gcd': lambda *digits: Decimal(math.gcd(*(self.to_integer(digit, 'gcd') for digit in digits))),
+            'lcm': lambda *digits: Decimal(math.lcm(*(self.to_integer(digit, 'lcm') for digit in digits))),
+            'hypot': lambda *digits: context.sqrt(sum((context.multiply(digit, digit) for digit in digits),
+                                                      Decimal(0))),
+            'copysign': lambda digit, sign: digit.copy_sign(sign, context),
+            'fmod': self.fmod,
+            'degrees': lambda digit: context.divide(context.multiply(digit, 180), pi),
+            'radians': lambda digit: context.divide(context.multiply(digit, pi), 180),
+            'isnan': lambda digit: digit.is_nan(),
+            'isinf': lambda digit: digit.is_infinite(),
+            'isfinite': lambda digit: digit.is_finite(),
+        }
+
+    def count_pi(self):
+        """
+        Counts pi with precision of backend context by series from decimal module recipes
+        """
+        context = self.context.copy()
+        context.prec += 2
+        lasts, t, s, n, na, d, da = 0, Decimal(3), Decimal(3), 1, 0, 0, 24
+        while s != lasts:
+            lasts = s
+            n, na = n + na, na + 8
+            d, da = d + da, da + 32
+            t = context.divide(context.multiply(t, n), d)
+            s = context.add(s, t)
+        return self.context.plus(s)
+
+    def number(self, text):
+        return self.context.create_decimal(text)
+
+    def convert(self, value):
+        if isinstance(value, float):
+            value = repr(value)
+        elif isinstance(value, Fraction):
+            return self.context.divide(Decimal(value.numerator), value.denominator)
+        return self.context.create_decimal(value)
+
+    def factorial(self, digit):
+        return self.context.create_decimal(MathOperationsHandler.factorial(digit))
+
+    def power(self, digit, base):
+        if digit < 0 and base != base.to_integral_value():
+            raise ValueError('can\'t raise negative number to fractional power')
+        elif digit == 0 and base < 0:
+            raise ZeroDivisionError('can\'t raise zero to negative power')
+        elif digit == 0 and base == 0:
+            return Decimal(1)
+        else:
+            return self.context.power(digit, base)
+
+    def square_root(self, digit):
+        if digit >= 0:
+            return self.context.sqrt(digit)
+        else:
+            raise ValueError('can\'t count square root of negative number')
+
+    def divide(self, digit, base):
+        if base == 0:
+            raise ZeroDivisionError('can\'t divide by zero')
+        else:
+            return self.context.divide(digit, base)
+
+    def int_divide(self, digit, base):
+        if base == 0:
+            raise ZeroDivisionError('can\'t divide by zero')
+        quotient = self.context.divide_int(digit, base)
+        if self.context.remainder(digit, base) and (digit < 0) != (base < 0):
+            quotient = self.context.subtract(quotient, 1)
+        return quotient
+
+    def get_rest_of_division(self, digit, base):
+        if base == 0:
+            raise ZeroDivisionError('can\'t divide by zero')
+        rest = self.context.remainder(digit, base)
+        if rest and (rest < 0) != (base < 0):
+            rest = self.context.add(rest, base)
+        return rest
+
+    def fmod(self, digit, base):
+        if base == 0:
+            raise ValueError('math domain error')
+        return self.context.remainder(digit, base)
+
+    def logarithm(self, digit, base):
+        if base == 1:
+            raise ZeroDivisionError('cant\'t count logarithm by base 1')
+        elif digit <= 0 or base <= 0:
+            raise ValueError('can\'t count logarithm of non-positive digit')
+        else:
+            return self.context.divide(self.context.ln(digit), self.context.ln(base))
+
+    def logarithm_by_e(self, digit):
+        if digit > 0:
+            return self.context.ln(digit)
+        else:
+            raise ValueError('can\'t count non-positive logarithm')
+
+    def logarithm_by_two(self, digit):
+        if digit > 0:
+            return self.context.divide(self.context.ln(digit), self.context.ln(Decimal(2)))
+        else:
+            raise ValueError('can\'t count logarithm of non-positive digit by base 2')
+
+    def logarithm_by_ten(self, digit):
+        if digit > 0:
+            return self.context.log10(digit)
+        else:
+            raise ValueError('can\'t count logarithm of non-positive number by base 10')
+
+
+class FractionBackend(NumericBackend):
+    """
+    Exact backend over fractions.Fraction numbers
+    Supports only operations with rational results: no irrational constants, logarithms or trigonometry,
+    powers take integer exponents, square roots are taken of exact squares only
+    """
+    name = 'fraction'
+
+    def __init__(self):
+        super().__init__()
+        exact = {name: action for name, (priority, action) in super().get_one_sign_operations().items()
+                 if priority == 0 or name in ('*', '+', '-')}
+        self.operations = {
+            **exact,
+            '^': self.power,
+            '**': self.power,
+            'pow': self.power,
+            '/': self.divide,
+            '//': self.int_divide,
+            '%': MathOperationsHandler.get_rest_of_division,
+            '!': self.factorial,
+            'factorial': self.factorial,
+            'minus': MathOperationsHandler.add_unary_minus,
+            'plus': MathOperationsHandler.add_unary_plus,
+            'abs': abs,
+            'fabs': abs,
+            'sqrt': self.square_root,
+            'floor': lambda digit: Fraction(math.floor(digit)),
+            'ceil': lambda digit: Fraction(math.ceil(digit)),
+            'trunc': lambda digit: Fraction(math.trunc(digit)),
+            'round': lambda digit: Fraction(round(digit)),
+            'gcd': lambda *digits: Fraction(math.gcd(*(self.to_integer(digit, 'gcd') for digit in digits))),
+            'lcm': lambda *digits: Fraction(math.lcm(*(self.to_integer(digit, 'lcm') for digit in digits))),
+            'hypot': lambda *digits: self.square_root(sum(digit * digit for digit in digits)),
+            'fmod': self.fmod,
+        }
+
+    def number(self, text):
+        return Fraction(text)
+
+    def convert(self, value):
+        return Fraction(repr(value)) if isinstance(value, float) else Fraction(value)
+
+    def factorial(self, digit):
+        return Fraction(MathOperationsHandler.factorial(digit))
+
+    @staticmethod
+    def power(digit, base):
+        if base != int(base):
+            raise ValueError('can\'t raise number to fractional power exactly')
+        elif digit == 0 and base < 0:
+            raise ZeroDivisionError('can\'t raise zero to negative power')
+        else:
+            return Fraction(digit) ** int(base)
+
+    @staticmethod
+    def square_root(digit):
+        if digit < 0:
+            raise ValueError('can\'t count square root of negative number')
+        digit = Fraction(digit)
+        numerator, denominator = math.isqrt(digit.numerator), math.isqrt(digit.denominator)
+        if numerator * numerator != digit.numerator or denominator * denominator != digit.denominator:
+            raise ValueError('can\'t count square root of number exactly')
+        return Fraction(numerator, denominator)
+
+    @staticmethod
+    def divide(digit, base):
+        if base == 0:
+            raise ZeroDivisionError('can\'t divide by zero')
+        else:
+            return Fraction(digit) / base
+
+    @staticmethod
+    def int_divide(digit, base):
+        if base == 0:
+            raise ZeroDivisionError('can\'t divide by zero')
+        else:
+            return Fraction(digit // base)
+
+    @staticmethod
+    def fmod(digit, base):
+        if base == 0:
+            raise ValueError('math domain error')
+        return digit - base * math.trunc(Fraction(digit) / base)
+
+
+backends = {backend.name: backend for backend in (FloatBackend, DecimalBackend, FractionBackend)}
+
+
+def get_backend(name='float', precision=None):
+    """
+    Returns numeric backend by its name, precision is number of significant digits of decimal backend
+    """
+    if name not in backends:
+        raise ValueError(f'unknown numeric backend "{name}"')
+    if precision is None:
+        return backends[name]()
+    if name != 'decimal':
+        raise ValueError('precision is supported only by decimal numbers')
+    if precision < 1:
+        raise ValueError('precision must be positive')
+    return DecimalBackend(decimal.Context(prec=precision))
@@ -1,40 +1,210 @@
-from re import compile
-from io import StringIO
-from tokenize import generate_tokens
+from re import compile, VERBOSE
 import math
-from argparse import ArgumentParser
-from numbers import Number
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from enum import Enum
+from functools import lru_cache
+from threading import Lock
+from time import perf_counter
+from types import MappingProxyType
+import sys
 
 
-class UnbalancedParenthesesError(Exception):
-    def __init__(self, message):
-        super(UnbalancedParenthesesError, self).__init__(message)
+class ErrorCode(str, Enum):
+    """
+    Stable machine-readable codes of calculation errors, values never change
+    """
+    INVALID_EXPRESSION = 'invalid_expression'
+    UNBALANCED_PARENTHESES = 'unbalanced_parentheses'
+    UNKNOWN_FUNCTION = 'unknown_function'
+    REDUNDANT_PARAMETER = 'redundant_parameter'
+    MISSING_PARAMETER = 'missing_parameter'
+    UNKNOWN_SYMBOL = 'unknown_symbol'
+    UNEXPECTED_SPACE = 'unexpected_space'
+    UNBOUND_VARIABLE = 'unbound_variable'
+    UNSUPPORTED_OPERATION = 'unsupported_operation'
+    EXPRESSION_TOO_LONG = 'expression_too_long'
+    TOO_MANY_TOKENS = 'too_many_tokens'
+    TOO_DEEP = 'too_deep'
+    NUMBER_TOO_LARGE = 'number_too_large'
+    TIMEOUT = 'timeout'
+    DIVISION_BY_ZERO = 'division_by_zero'
+    OVERFLOW = 'overflow'
+    DOMAIN = 'domain'
+    ARITHMETIC = 'arithmetic'
+    TYPE = 'type'
+    INTERNAL = 'internal'
+
+
+class CalculatorError(Exception):
+    """
+    Base error of math expression, position is index of faulty character if known
+    """
+    code = ErrorCode.INVALID_EXPRESSION
+
+    def __init__(self, message, position=None):
+        super(CalculatorError, self).__init__(message)
+        self.position = position
+
+
+class UnbalancedParenthesesError(CalculatorError):
+    code = ErrorCode.UNBALANCED_PARENTHESES
+
+    def __init__(self, message, position=None):
+        super(UnbalancedParenthesesError, self).__init__(message, position)
+
+
+class UnknownFunctionError(CalculatorError):
+    code = ErrorCode.UNKNOWN_FUNCTION
+
+    def __init__(self, message, position=None):
+        super(UnknownFunctionError, self).__init__(message, position)
+
+
+class RedundantParameterError(CalculatorError):
+    code = ErrorCode.REDUNDANT_PARAMETER
 
+    def __init__(self, message, position=None):
+        super(RedundantParameterError, self).__init__(message, position)
 
-class UnknownFunctionError(Exception):
-    def __init__(self, message):
-        super(UnknownFunctionError, self).__init__(message)
 
+class MissingParameterError(CalculatorError):
+    code = ErrorCode.MISSING_PARAMETER
 
-class RedundantParameterError(Exception):
-    def __init__(self, message):
-        super(RedundantParameterError, self).__init__(message)
+    def __init__(self, message, position=None):
+        super(MissingParameterError, self).__init__(message, position)
 
 
-class MissingParameterError(Exception):
-    def __init__(self, message):
-        super(MissingParameterError, self).__init__(message)
+class UnknownSymbolError(CalculatorError):
+    code = ErrorCode.UNKNOWN_SYMBOL
 
+    def __init__(self, message, position=None):
+        super(UnknownSymbolError, self).__init__(message, position)
+
+
+class UnexpectedSpaceError(CalculatorError):
+    code = ErrorCode.UNEXPECTED_SPACE
+
+    def __init__(self, message, position=None):
+        super(UnexpectedSpaceError, self).__init__(message, position)
+
+
+class UnboundVariableError(CalculatorError):
+    code = ErrorCode.UNBOUND_VARIABLE
+
+    def __init__(self, message, position=None):
+        super(UnboundVariableError, self).__init__(message, position)
+
+
+class UnsupportedOperationError(CalculatorError):
+    code = ErrorCode.UNSUPPORTED_OPERATION
+
+    def __init__(self, message, position=None):
+        super(UnsupportedOperationError, self).__init__(message, position)
+
+
+class LimitExceededError(CalculatorError):
+    """
+    Base error of expression exceeding resource limits of guarded evaluation
+    """
 
-class UnknownSymbolError(Exception):
-    def __init__(self, message):
-        super(UnknownSymbolError, self).__init__(message)
+    def __init__(self, message, position=None):
+        super(LimitExceededError, self).__init__(message, position)
+
+
+class LengthLimitError(LimitExceededError):
+    code = ErrorCode.EXPRESSION_TOO_LONG
+
+    def __init__(self, message, position=None):
+        super(LengthLimitError, self).__init__(message, position)
+
+
+class TokenLimitError(LimitExceededError):
+    code = ErrorCode.TOO_MANY_TOKENS
+
+    def __init__(self, message, position=None):
+        super(TokenLimitError, self).__init__(message, position)
+
+
+class DepthLimitError(LimitExceededError):
+    code = ErrorCode.TOO_DEEP
+
+    def __init__(self, message, position=None):
+        super(DepthLimitError, self).__init__(message, position)
+
+
+class NumberLimitError(LimitExceededError):
+    code = ErrorCode.NUMBER_TOO_LARGE
+
+    def __init__(self, message, position=None):
+        super(NumberLimitError, self).__init__(message, position)
+
+
+class TimeLimitError(LimitExceededError):
+    code = ErrorCode.TIMEOUT
+
+    def __init__(self, message, position=None):
+        super(TimeLimitError, self).__init__(message, position)
+
+
+builtin_error_codes = (
+    (ZeroDivisionError, ErrorCode.DIVISION_BY_ZERO),
+    (OverflowError, ErrorCode.OVERFLOW),
+    (ValueError, ErrorCode.DOMAIN),
+    (ArithmeticError, ErrorCode.ARITHMETIC),
+    (TypeError, ErrorCode.TYPE),
+)
+
+
+def error_code(error):
+    """
+    Returns ErrorCode of error raised by calculation
+    """
+    if isinstance(error, CalculatorError):
+        return error.code
+    for kind, code in builtin_error_codes:
+        if isinstance(error, kind):
+            return code
+    return ErrorCode.INTERNAL
+
+
+class CalculationResult(namedtuple('CalculationResult', 'value code position message type', defaults=(None,))):
+    """
+    Value of calculated expression, or ErrorCode, position, message and exception class name of its error
+    """
+    __slots__ = ()
 
+    @classmethod
+    def success(cls, value):
+        return cls(value, None, None, None)
 
-class UnexpectedSpaceError(Exception):
-    def __init__(self, message):
-        super(UnexpectedSpaceError, self).__init__(message)
+    @classmethod
+    def failure(cls, error):
+        return cls(None, error_code(error), getattr(error, 'position', None), str(error), error.__class__.__name__)
+
+    @property
+    def ok(self):
+        return self.code is None
+
+    def to_dict(self):
+        """
+        Returns JSON compatible object of result, non-finite and exact numbers are returned as strings
+        """
+        if self.code is not None:
+            return {'error': {'type': self.type, 'code': self.code.value, 'message': self.message,
+                              'position': self.position}}
+        value = self.value
+        if not (isinstance(value, int) or isinstance(value, float) and math.isfinite(value)):
+            value = str(value)
+        return {'result': value}
+
+    def to_line(self, output_format='text'):
+        """
+        Returns output line of result, 'text' value or error message, or 'json' object
+        """
+        if output_format == 'json':
+            import json
+            return json.dumps(self.to_dict())
+        return str(self.value) if self.code is None else f'ERROR: {self.message}'
 
 
 class MathOperationsHandler:
@@ -54,10 +224,24 @@ class MathOperationsHandler:
     def factorial(digit):
         if digit < 0:
             raise ValueError('can\'t count factorial of negative number')
-        elif not str(digit).isdigit():
+        elif digit != int(digit):
             raise ValueError('can\'t count factorial of fractional number')
         else:
-            return math.factorial(digit)
+            return math.factorial(int(digit))
+
+    @staticmethod
+    def to_integer(digit, name):
+        if digit != int(digit):
+            raise ValueError(f'function "{name}" takes only integer numbers')
+        return int(digit)
+
+    @staticmethod
+    def greatest_common_divisor(*digits):
+        return math.gcd(*(MathOperationsHandler.to_integer(digit, 'gcd') for digit in digits))
+
+    @staticmethod
+    def least_common_multiple(*digits):
+        return math.lcm(*(MathOperationsHandler.to_integer(digit, 'lcm') for digit in digits))
 
     @staticmethod
     def logarithm(digit, base):
@@ -134,30 +318,49 @@ class MathOperationsHandler:
         return False
 
 
-class MathModuleData(MathOperationsHandler):
-    def __init__(self):
-        self.__postfix_operations = {'!': super().factorial}
-        self.__prefix_operations = {a: getattr(math, a) for a in dir(math) if callable(getattr(math, a))}
-        custom_prefix_operations = {
-            'log': super().logarithm,
-            'log2': super().logarithm_by_two,
-            'log10': super().logarithm_by_ten,
-            'pow': super().power,
-            'sqrt': super().square_root,
-            'ln': super().logarithm_by_e,
+class OperationRegistry:
+    """
+    Immutable tables of operations and constants shared by all calculator objects
+    Built once per process on the first get_registry() call from precomputed tables of math module
+    Calculators with user-defined functions get their own registry extended by functions.FunctionLibrary
+    """
+    operation = namedtuple('operation', 'priority action')
+    declared_arities = {'gcd': 2, 'lcm': 2, 'hypot': 2}
+    variadic_functions = frozenset(('gcd', 'lcm', 'hypot'))
+    arity_overloads = {'log': {1: 'ln'}}
+
+    def __init__(self, functions=None):
+        """
+        functions maps names to functions.UserFunction added to prefix operations
+        """
+        functions = functions or {}
+        math_arities, math_constants = self.math_tables()
+        postfix_operations = {'!': MathOperationsHandler.factorial}
+        prefix_operations = {name: getattr(math, name) for name in math_arities}
+        overrides = {
+            'log': MathOperationsHandler.logarithm,
+            'log2': MathOperationsHandler.logarithm_by_two,
+            'log10': MathOperationsHandler.logarithm_by_ten,
+            'pow': MathOperationsHandler.power,
+            'sqrt': MathOperationsHandler.square_root,
+            'ln': MathOperationsHandler.logarithm_by_e,
             'abs': abs,
             'round': round,
-            'minus': super().add_unary_minus,
-            'plus': super().add_unary_plus,
+            'factorial': MathOperationsHandler.factorial,
+            'gcd': MathOperationsHandler.greatest_common_divisor,
+            'lcm': MathOperationsHandler.least_common_multiple,
+            'minus': MathOperationsHandler.add_unary_minus,
+            'plus': MathOperationsHandler.add_unary_plus,
         }
-        self.__prefix_operations.update(custom_prefix_operations)
-        operation = namedtuple('operation', 'priority action')
-        self.__one_sign_operations = {
-            '^': operation(4, super().power),
-            '**': operation(4, super().power),
-            '/': operation(3, super().divide),
-            '//': operation(3, super().int_divide),
-            '%': operation(3, super().get_rest_of_division),
+        prefix_operations.update(overrides)
+        prefix_operations.update((name, function.action) for name, function in functions.items())
+        operation = self.operation
+        one_sign_operations = {
+            '^': operation(4, MathOperationsHandler.power),
+            '**': operation(4, MathOperationsHandler.power),
+            '/': operation(3, MathOperationsHandler.divide),
+            '//': operation(3, MathOperationsHandler.int_divide),
+            '%': operation(3, MathOperationsHandler.get_rest_of_division),
             '*': operation(3, lambda digit, base: digit * base),
             '+': operation(2, lambda digit, base: digit + base),
             '-': operation(2, lambda digit, base: digit - base),
@@ -171,105 +374,382 @@ class MathModuleData(MathOperationsHandler):
             '>=': operation(0, lambda digit, base: digit >= base),
             '>': operation(0, lambda digit, base: digit > base)
         }
-        self.__CONSTANTS = {attr: getattr(math, attr) for attr in dir(math)
-                            if isinstance(getattr(math, attr), Number)}
-        self.__all_operations = {**self.__postfix_operations, **self.__prefix_operations, **self.__one_sign_operations}
+        constants = {name: getattr(math, name) for name in math_constants}
+        arities = dict(math_arities)
+        arities.update({name: self.count_arguments(name, function) for name, function in overrides.items()})
+        arities.update({name: function.arity for name, function in functions.items()})
+        arities.update({name: 1 for name in postfix_operations})
+        arities.update({name: 2 for name, (_, action) in one_sign_operations.items() if action is not None})
+        constants_trie = {}
+        for constant in constants:
+            node = constants_trie
+            for character in constant:
+                node = node.setdefault(character, {})
+            node[None] = constant
+
+        self.postfix_operations = MappingProxyType(postfix_operations)
+        self.prefix_operations = MappingProxyType(prefix_operations)
+        self.one_sign_operations = MappingProxyType(one_sign_operations)
+        self.constants = MappingProxyType(constants)
+        self.all_operations = MappingProxyType({**postfix_operations, **prefix_operations, **one_sign_operations})
+        self.arities = MappingProxyType(arities)
+        self.constants_trie = constants_trie
+        self.operation_names = tuple(sorted(arities))
+        self.operation_indexes = MappingProxyType({name: index for index, name in enumerate(self.operation_names)})
+        self.operation_actions = tuple(one_sign_operations[name].action if name in one_sign_operations
+                                       else self.all_operations[name] for name in self.operation_names)
+        self.macros = MappingProxyType({name: function for name, function in functions.items()
+                                        if function.rpn is not None})
+        self.impure_functions = frozenset(name for name, function in functions.items() if not function.pure)
+        self.__version = None
+
+    @property
+    def version(self):
+        if self.__version is None:
+            self.__version = self.count_version()
+        return self.__version
+
+    @classmethod
+    def math_tables(cls):
+        """
+        Returns arities of math module functions and names of its constants
+        Uses tables precomputed for running Python version, introspects math module for other versions
+        """
+        from . import tables
+        if tables.python_version == sys.version_info[:2]:
+            return tables.math_arities, tables.math_constants
+        return cls.introspect_math()
+
+    @classmethod
+    def introspect_math(cls):
+        """
+        Returns arities of math module functions and names of its constants found by introspection
+        """
+        from numbers import Number
+        arities = {name: cls.count_arguments(name, getattr(math, name))
+                   for name in dir(math) if callable(getattr(math, name))}
+        return arities, tuple(name for name in dir(math) if isinstance(getattr(math, name), Number))
+
+    def count_version(self):
+        """
+        Returns hash of names, arities and priorities of operations and values of constants
+        Programs compiled with registry of other version can't be reused
+        """
+        from hashlib import sha256
+        signature = sorted((name, self.arities.get(name, 0), getattr(operation, 'priority', None),
+                            name in self.prefix_operations, name in self.postfix_operations)
+                           for name, operation in self.all_operations.items())
+        signature.append(sorted((name, repr(value)) for name, value in self.constants.items()))
+        return sha256(repr(signature).encode()).hexdigest()[:16]
+
+    @classmethod
+    def count_arguments(cls, name, function):
+        """
+        Counts required positional arguments of function by its signature
+        Variadic functions take default arity from declared_arities table
+        """
+        if name in cls.declared_arities:
+            return cls.declared_arities[name]
+        code = getattr(function, '__code__', None)
+        if code is not None:
+            return code.co_argcount - len(function.__defaults__ or ())
+        signature = getattr(function, '__text_signature__', None)
+        if not signature:
+            return 1
+        arity = 0
+        for parameter in signature.strip('()').split(','):
+            parameter = parameter.strip()
+            if parameter.startswith('*') and parameter != '*':
+                return 2
+            elif parameter == '*':
+                break
+            elif parameter not in ('$module', '/') and '=' not in parameter:
+                arity += 1
+        return arity
+
+
+_registry = None
+_registry_lock = Lock()
+
+
+def get_registry():
+    """
+    Returns shared OperationRegistry building it on the first call
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = OperationRegistry()
+    return _registry
+
+
+class MathModuleData(MathOperationsHandler):
+    def __init__(self, registry=None):
+        self.registry = registry or get_registry()
 
     def get_postfix_operations(self):
-        return self.__postfix_operations
+        return self.registry.postfix_operations
 
     def get_prefix_operations(self):
-        return self.__prefix_operations
+        return self.registry.prefix_operations
 
     def get_one_sign_operations(self):
-        return self.__one_sign_operations
+        return self.registry.one_sign_operations
+
+    def get_arity(self, name):
+        return self.registry.arities[name]
 
     def get_constants(self):
-        return self.__CONSTANTS
+        return self.registry.constants
 
     def get_all_operations(self):
-        return self.__all_operations
+        return self.registry.all_operations
 
+    def make_token(self, text, position=None):
+        """
+        Classifies token text once, resolving its value or action and arity
+        """
+        registry = self.registry
+        if text == '(':
+            return Token(Token.OPEN, text, position)
+        elif text == ')':
+            return Token(Token.CLOSE, text, position)
+        elif text == ',':
+            return Token(Token.COMMA, text, position)
+        elif text in registry.one_sign_operations:
+            priority, action = registry.one_sign_operations[text]
+            return Token(Token.OPERATOR, text, position, action=action, arity=2, priority=priority)
+        elif text in registry.postfix_operations:
+            return Token(Token.POSTFIX, text, position, action=registry.postfix_operations[text],
+                         arity=registry.arities[text])
+        elif text in registry.prefix_operations:
+            return Token(Token.FUNCTION, text, position, action=registry.prefix_operations[text],
+                         arity=registry.arities[text])
+        elif text in registry.constants:
+            return Token(Token.CONSTANT, text, position, value=registry.constants[text])
+        elif text.isidentifier():
+            return Token(Token.VARIABLE, text, position)
+        try:
+            return Token(Token.NUMBER, text, position, value=float(text))
+        except ValueError:
+            raise UnknownSymbolError(f'unknown symbols "{text}"', position)
 
-class ExpressionResolver(MathModuleData):
+
+class Token:
     """
-    Resolves implicit multiplication, unary signs and double constants standing together
+    Math expression token classified once by Lexer
+    Numbers and constants keep their value, operations keep action and arity
     """
+    NUMBER, CONSTANT, VARIABLE = 'number', 'constant', 'variable'
+    FUNCTION, POSTFIX, OPERATOR = 'function', 'postfix', 'operator'
+    OPEN, CLOSE, COMMA = 'open', 'close', 'comma'
+    __slots__ = ('kind', 'text', 'position', 'value', 'action', 'arity', 'priority')
+
+    def __init__(self, kind, text, position=None, value=None, action=None, arity=0, priority=None):
+        self.kind = kind
+        self.text = text
+        self.position = position
+        self.value = value
+        self.action = action
+        self.arity = arity
+        self.priority = priority
 
-    # maybe it is better to use regular expression for this case
+    def __repr__(self):
+        return f'Token({self.kind!r}, {self.text!r})'
 
-    def __init__(self):
-        super().__init__()
 
-    def resolve_implicit_multiplication(self, tokens_list):
+class Lexer(MathModuleData):
+    """
+    Single-pass scanner of math expression string into typed tokens
+    Tokens of registry names are copied from templates, splits of names are memoized in LRU cache,
+    so untrusted input with ever new variable names doesn't grow memory
+    """
+    split_cache_size = 1024
+    pattern = compile(r'''
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+        |(?P<name>[A-Za-z][A-Za-z0-9]*)
+        |(?P<operator>\*\*|//|<=|>=|==|!=|[-+*/%^<>=!])
+        |(?P<paren>[()])
+        |(?P<comma>,)
+        |(?P<space>\s+)
+        |(?P<unknown>.)
+    ''', VERBOSE)
+
+    def __init__(self, registry=None):
+        super().__init__(registry)
+        self.__templates = {}
+        self.__split_names = lru_cache(maxsize=self.split_cache_size)(self.split_constants)
+
+    def split_constants(self, name):
         """
-        Resolves implicit multiplication to the new tokens list
-        Returns resolved list
+        Splits constants standing together (e.g. "pie") by the longest match
+        Returns list with the name itself if it can't be split to constants
         """
+        if name in super().get_constants() or name in super().get_all_operations():
+            return [name]
+        result, start = [], 0
+        while start < len(name):
+            node, longest, index = self.registry.constants_trie, None, start
+            while index < len(name) and name[index] in node:
+                node = node[name[index]]
+                index += 1
+                if None in node:
+                    longest = index
+            if longest is None:
+                return [name]
+            result.append(name[start:longest])
+            start = longest
+        return result
 
-        result = []
-
-        def add_multiplication_sign():
-            result.append('*')
-            result.append(token)
+    def memo_info(self):
+        """
+        Returns numbers of memoized token templates and split names, variables don't add to either beyond bound
+        """
+        return len(self.__templates), self.__split_names.cache_info().currsize
 
-        for index, token in enumerate(tokens_list):
-            previous = tokens_list[index - 1]
-            if index == 0:
-                result.append(token)
-            elif (token in super().get_prefix_operations() and super().is_number(previous)
-                  or token in super().get_constants() and super().is_number(previous)
-                  or token in super().get_constants() and previous in super().get_constants()
-                  or token in super().get_prefix_operations() and previous == ')'
-                  or super().is_number(token) and previous == ')'
-                  or token == '(' and super().is_number(previous)):
-                add_multiplication_sign()
+    def template_token(self, text, position):
+        """
+        Copies token of operation or constant classified on first occurrence, variables get new tokens
+        """
+        template = self.__templates.get(text)
+        if template is None:
+            template = super().make_token(text)
+            if template.kind == Token.VARIABLE:
+                return Token(Token.VARIABLE, text, position)
+            template = self.__templates.setdefault(text, template)
+        return Token(template.kind, text, position, template.value, template.action, template.arity,
+                     template.priority)
+
+    def scan(self, expression):
+        """
+        Creates typed tokens list from math expression string
+        Checks symbols, spaces and parentheses balance in the same pass
+        """
+        tokens, open_parentheses = [], []
+        redundant_count, redundant_position = 0, None
+        append, length = tokens.append, len(expression)
+        for match in self.pattern.finditer(expression):
+            kind = match.lastgroup
+            if kind == 'number':
+                append(Token(Token.NUMBER, match.group(), match.start(), value=float(match.group())))
+            elif kind == 'operator' or kind == 'comma':
+                append(self.template_token(match.group(), match.start()))
+            elif kind == 'name':
+                offset, text = match.start(), match.group()
+                for name in self.__split_names(text):
+                    append(self.template_token(name, offset))
+                    offset += len(name)
+            elif kind == 'paren':
+                position = match.start()
+                if match.group() == '(':
+                    open_parentheses.append(position)
+                elif open_parentheses:
+                    open_parentheses.pop()
+                else:
+                    redundant_count += 1
+                    if redundant_position is None:
+                        redundant_position = position
+                append(self.template_token(match.group(), position))
+            elif kind == 'space':
+                if match.end() < length:
+                    for index in range(match.start(), match.end()):
+                        if expression[index] == ' ':
+                            ErrorChecker.check_space(expression[index - 1] if index else '',
+                                                     expression[index + 1], index)
             else:
-                result.append(token)
-        return result
+                raise UnknownSymbolError(f'unknown symbols "{match.group()}"', match.start())
+        if redundant_count:
+            raise UnbalancedParenthesesError(f'expression has {redundant_count} redundant closing parentheses',
+                                             redundant_position)
+        if open_parentheses:
+            raise UnbalancedParenthesesError(f'expression has {len(open_parentheses)} unclosed parentheses',
+                                             open_parentheses[0])
+        return tokens
+
 
-    def resolve_log(self, tokens_list):
-        """
-        If log() takes two parameter leaves it the same
-        If log() takes one parameter changes log() to ln() in place
-        """
-        open_parentheses_count = 0
-        close_parentheses_count = 0
-        for index, token in enumerate(tokens_list):
-            if token == 'log':
-                number_of_arguments = 1
-                for character in tokens_list[index + 1:]:
-                    if character == '(':
-                        open_parentheses_count += 1
-                    elif character == ',':
-                        number_of_arguments = 2
-                    elif character == ')':
-                        close_parentheses_count += 1
-                    if open_parentheses_count == close_parentheses_count:
-                        break
-                if number_of_arguments == 1:
-                    tokens_list[index] = 'ln'
-        return tokens_list
-
-    def resolve_unary(self, tokens_list):
-        """
-        Resolves all unary '-' and '+' operations changing them to 'minus' and 'plus' functions
+class ExpressionResolver(MathModuleData):
+    """
+    Resolves implicit multiplication, unary signs, function arity and double constants standing together
+    """
+
+    operands = frozenset((Token.NUMBER, Token.CONSTANT, Token.VARIABLE))
+    operand_names = frozenset((Token.CONSTANT, Token.VARIABLE))
+    operand_ends = frozenset((Token.NUMBER, Token.CONSTANT, Token.VARIABLE, Token.CLOSE, Token.POSTFIX))
+    implicit_after_number = frozenset((Token.FUNCTION, Token.CONSTANT, Token.VARIABLE, Token.OPEN))
+    implicit_after_close = frozenset((Token.FUNCTION, Token.NUMBER))
+    unary_signs = {'-': 'minus', '+': 'plus'}
+
+    def __init__(self, registry=None):
+        super().__init__(registry)
+
+    def resolve(self, tokens_list):
+        """
+        Resolves unary signs, implicit multiplication and arity of functions in one linear pass
+        Function arity is counted by commas of its parentheses: overloads like log(x) are
+        replaced (with ln(x)), variadic functions get actual number of arguments,
+        other functions must get declared number of arguments
         Returns resolved list
         """
-        result = []
-        for index, token in enumerate(tokens_list):
-            previous = tokens_list[index - 1]
-            if token == '-' or token == '+':
-                if index == 0:
-                    result.append('minus') if token == '-' else result.append('plus')
-                elif previous == ')' or previous in super().get_constants() or super().is_number(previous):
-                    result.append(token)
-                else:
-                    result.append('minus') if token == '-' else result.append('plus')
-            else:
-                result.append(token)
+        result, frames = [], []
+        append, make_token = result.append, super().make_token
+        implicit_after_number, operand_names = self.implicit_after_number, self.operand_names
+        implicit_after_close, operand_ends, unary_signs = self.implicit_after_close, self.operand_ends, self.unary_signs
+        has_operands, pending_function, previous = False, None, None
+        for token in tokens_list:
+            kind = token.kind
+            if (kind in implicit_after_number and previous == Token.NUMBER
+                    or kind in operand_names and previous in operand_names
+                    or kind in implicit_after_close and previous == Token.CLOSE):
+                append(make_token('*', token.position))
+                previous = Token.OPERATOR
+            if kind == Token.OPERATOR and token.text in unary_signs and previous not in operand_ends:
+                token = make_token(unary_signs[token.text], token.position)
+                kind = token.kind
+            if kind == Token.OPEN:
+                if frames:
+                    frames[-1][2] = False
+                frames.append([pending_function, 1, True])
+            elif kind == Token.CLOSE:
+                if frames:
+                    function_index, count, empty = frames.pop()
+                    if function_index is not None:
+                        self.resolve_arity(result, function_index, 0 if empty else count)
+                    if frames:
+                        frames[-1][2] = False
+            elif frames:
+                frame = frames[-1]
+                frame[2] = False
+                if kind == Token.COMMA:
+                    frame[1] += 1
+            if kind in self.operands:
+                has_operands = True
+            pending_function = len(result) if kind == Token.FUNCTION else None
+            previous = kind
+            append(token)
+        if not has_operands:
+            raise MissingParameterError('no numbers or constants in expression')
         return result
 
+    def resolve_arity(self, tokens_list, index, count):
+        """
+        Checks or resolves arity of function token called with count arguments in place
+        """
+        function = tokens_list[index]
+        overloads = self.registry.arity_overloads.get(function.text)
+        if overloads and count in overloads:
+            tokens_list[index] = super().make_token(overloads[count], function.position)
+        elif function.text in self.registry.variadic_functions and count >= function.arity:
+            if count != function.arity:
+                tokens_list[index] = Token(function.kind, function.text, function.position, function.value,
+                                           function.action, count, function.priority)
+        elif count < function.arity:
+            raise MissingParameterError(f'function "{function.text}" takes {function.arity} arguments, '
+                                        f'{count} given', function.position)
+        elif count > function.arity:
+            raise RedundantParameterError(f'function "{function.text}" takes {function.arity} arguments, '
+                                          f'{count} given', function.position)
+
     def resolve_double_const(self, expression):
         """
         Resolves constant values standing together
@@ -285,138 +765,195 @@ class ReversePolishNotationConverter(MathModuleData):
     Converter of math expression to ReversePolishNotation (RPN) expression
     """
 
-    def __init__(self):
-        super().__init__()
-        self.stack, self.output, self.tokens = [], [], []
-        self.resolver = ExpressionResolver()
+    operands = frozenset((Token.NUMBER, Token.CONSTANT, Token.VARIABLE))
 
-    def clear_stack(self):
-        self.stack = []
+    def __init__(self, registry=None):
+        super().__init__(registry)
+        self.resolver = ExpressionResolver(self.registry)
+        self.lexer = Lexer(self.registry)
 
-    def check_for_numbers(self, list_of_tokens):
-        """
-        Checks whether expression has no operands
-        """
-        numbers_count = 0
-        for token in list_of_tokens:
-            if super().is_number(token) or token in super().get_constants():
-                numbers_count += 1
-        if numbers_count == 0:
-            raise MissingParameterError('no numbers or constants in expression')
-
-    @staticmethod
-    def create_tokens_list(expression):
+    def create_tokens_list(self, expression):
         """
         Creates tokens list from math expressions string
         """
-        line = generate_tokens(StringIO(expression).readline)
-        return [token[1] for token in line if token[1]]
+        return [token.text for token in self.lexer.scan(expression)]
 
     def resolve_math_expression(self, expression):
-        expression = self.resolver.resolve_double_const(expression)
-        tokens = self.create_tokens_list(expression)
-        tokens = self.resolver.resolve_log(tokens)
-        tokens = self.resolver.resolve_unary(tokens)
-        self.check_for_numbers(tokens)
-        self.tokens = self.resolver.resolve_implicit_multiplication(tokens)
+        return self.resolver.resolve(self.lexer.scan(expression))
 
     def convert_to_rpn(self, expression):
         """
         Converts initial math expression to Reverse Polish Notation
         Returns tokens list in Reverse Polish Notation
         """
+        return self.convert_tokens_to_rpn(self.resolve_math_expression(expression))
 
-        self.resolve_math_expression(expression)
-
-        for item in self.tokens:
-            if super().is_number(item) or item in super().get_postfix_operations() \
-                    or item in super().get_constants():
-                self.output.append(item)
-            elif item == '(' or item in super().get_prefix_operations():
-                self.stack.append(item)
-            elif item == ')':
-                for element in reversed(self.stack):
-                    if element != '(':
-                        self.output.append(self.stack.pop())
-                    else:
-                        self.stack.pop()
-                        break
-            elif item in super().get_one_sign_operations():
-                for element in reversed(self.stack):
-                    if self.stack[-1] in super().get_prefix_operations() \
-                            or super().get_one_sign_operations()[self.stack[-1]].priority \
-                            > self.get_one_sign_operations()[item].priority \
-                            or super().get_one_sign_operations()[self.stack[-1]].priority \
-                            == super().get_one_sign_operations()[item].priority and item != '^':
-                        self.output.append(self.stack.pop())
-                self.stack.append(item)
-            elif item == ',':
-                for element in reversed(self.stack):
-                    if element != '(':
-                        self.output.append(self.stack.pop())
-                    else:
-                        break
+    def convert_tokens_to_rpn(self, tokens):
+        """
+        Converts resolved tokens list to Reverse Polish Notation by shunting-yard algorithm
+        Returns tokens list in Reverse Polish Notation
+        """
+        stack, output = [], []
+
+        for index, item in enumerate(tokens):
+            kind = item.kind
+            if kind in self.operands or kind == Token.POSTFIX:
+                if kind == Token.VARIABLE and index + 1 < len(tokens) \
+                        and tokens[index + 1].kind == Token.OPEN:
+                    raise UnknownFunctionError(f'wrong operation "{item.text}"', item.position)
+                output.append(item)
+            elif kind == Token.OPEN or kind == Token.FUNCTION:
+                stack.append(item)
+            elif kind == Token.CLOSE:
+                while stack and stack[-1].kind != Token.OPEN:
+                    output.append(stack.pop())
+                if stack:
+                    stack.pop()
+            elif kind == Token.OPERATOR:
+                while stack and (stack[-1].kind == Token.FUNCTION
+                                 or stack[-1].kind == Token.OPERATOR
+                                 and (stack[-1].priority > item.priority
+                                      or stack[-1].priority == item.priority and item.text != '^')):
+                    output.append(stack.pop())
+                stack.append(item)
+            elif kind == Token.COMMA:
+                while stack and stack[-1].kind != Token.OPEN:
+                    output.append(stack.pop())
             else:
-                raise UnknownFunctionError(f'wrong operation "{item}"')
-        for element in reversed(self.stack):
-            self.output.append(self.stack.pop())
-        self.clear_stack()
-        return list(self.output)
+                raise UnknownFunctionError(f'wrong operation "{item.text}"', item.position)
+        while stack:
+            output.append(stack.pop())
+        return output
 
 
 class ReversePolishNotationHandler(MathModuleData):
     """
     Handles PRN expression
+    Values of variables are converted to numbers by convert
     """
+    convert = float
 
-    def __init__(self):
-        super().__init__()
-        self.stack = []
-
-    def pop_one(self):
-        return float(self.stack.pop())
+    @staticmethod
+    def pop_one(stack):
+        return stack.pop()
 
-    def pop_two(self):
-        y = float(self.stack.pop())
-        x = float(self.stack.pop())
+    @staticmethod
+    def pop_two(stack):
+        y = stack.pop()
+        x = stack.pop()
         return x, y
 
-    def handle_operations(self, rpn_tokens):
+    def handle_operations(self, rpn_tokens, bindings=None):
         """
         Handles all operations in Reverse Polish Notation tokens list
+        Takes values of free variables from bindings mapping
         Return result of calculation
         """
+        stack = []
         for token in rpn_tokens:
-            if token in super().get_constants():
-                self.stack.append(super().get_constants()[token])
-            elif token not in super().get_all_operations():
-                self.stack.append(token)
-            elif token in super().get_one_sign_operations():
+            kind = token.kind
+            if kind == Token.NUMBER or kind == Token.CONSTANT:
+                stack.append(token.value)
+            elif kind == Token.VARIABLE:
                 try:
-                    function = super().get_one_sign_operations()[token].action
-                    x, y = self.pop_two()
-                    self.stack.append(function(x, y))
-                except IndexError:
-                    raise MissingParameterError(f'not enough operands for "{token}" operation')
-            elif token in super().get_prefix_operations() or super().get_postfix_operations():
+                    stack.append(self.convert(bindings[token.text]))
+                except (KeyError, TypeError):
+                    raise UnboundVariableError(f'no value for variable "{token.text}"', token.position)
+            else:
                 try:
-                    if token in ('fmod', 'gcd', 'isclose', 'ldexp', 'remainder', 'log', 'pow', 'atan2'):
-                        function = super().get_all_operations()[token]
-                        x, y = self.pop_two()
-                        self.stack.append(function(x, y))
+                    if token.arity == 2:
+                        x, y = self.pop_two(stack)
+                        stack.append(token.action(x, y))
+                    elif token.arity == 1:
+                        stack.append(token.action(self.pop_one(stack)))
                     else:
-                        function = super().get_all_operations()[token]
-                        self.stack.append(function(self.pop_one()))
+                        if len(stack) < token.arity:
+                            raise IndexError
+                        args = stack[-token.arity:]
+                        del stack[-token.arity:]
+                        stack.append(token.action(*args))
                 except IndexError:
-                    raise MissingParameterError(f'not enough operands for "{token}" operation')
-        if len(self.stack) > 1:
+                    raise MissingParameterError(f'not enough operands for "{token.text}" operation', token.position)
+        if len(stack) > 1:
             raise RedundantParameterError('function takes more parameters that it should')
-        return self.stack[0]
+        return stack[0]
+
+
+class RPNOptimizer(MathModuleData):
+    """
+    Folds constant subexpressions of compiled expressions and applies safe identities:
+    removes unary plus and double minus, simplifies x*1, x+0, x-0, x/1, x^1
+    Subexpressions failing to fold are left as is, so their errors happen on evaluation
+    Impure user-defined functions are never folded
+    """
+    optimization = namedtuple('optimization', 'program eliminated')
+    literals = frozenset((Token.NUMBER, Token.CONSTANT))
+    identities = {
+        '*': (1, 1),
+        '+': (0, 0),
+        '-': (None, 0),
+        '/': (None, 1),
+        '^': (None, 1),
+        '**': (None, 1),
+    }
+
+    @staticmethod
+    def is_literal(fragment, value):
+        return len(fragment) == 1 and fragment[0].kind == Token.NUMBER and fragment[0].value == value
+
+    @staticmethod
+    def is_comparison(fragment):
+        return fragment[-1].kind == Token.OPERATOR and fragment[-1].priority == 0
+
+    def fold(self, token, args):
+        """
+        Returns optimized tokens fragment of operation token applied to args fragments
+        """
+        if (token.text not in self.registry.impure_functions
+                and all(len(arg) == 1 and arg[0].kind in self.literals for arg in args)):
+            try:
+                value = token.action(*(arg[0].value for arg in args))
+            except (ArithmeticError, ValueError, TypeError):
+                pass
+            else:
+                return [Token(Token.NUMBER, str(value), token.position, value=value)]
+        if token.text == 'plus':
+            return args[0]
+        if token.text == 'minus' and args[0][-1].text == 'minus':
+            return args[0][:-1]
+        if token.kind == Token.OPERATOR and token.text in self.identities:
+            (left_identity, right_identity), (x, y) = self.identities[token.text], args
+            if right_identity is not None and self.is_literal(y, right_identity) and not self.is_comparison(x):
+                return x
+            if left_identity is not None and self.is_literal(x, left_identity) and not self.is_comparison(y):
+                return y
+        return [item for arg in args for item in arg] + [token]
+
+    def optimize(self, program):
+        """
+        Returns optimization with optimized program and number of eliminated RPN tokens
+        Malformed programs are returned unchanged to fail on evaluation
+        """
+        stack = []
+        for token in program.rpn:
+            if not token.arity:
+                stack.append([token])
+                continue
+            if len(stack) < token.arity:
+                return self.optimization(program, 0)
+            args = stack[-token.arity:]
+            del stack[-token.arity:]
+            stack.append(self.fold(token, args))
+        if len(stack) != 1:
+            return self.optimization(program, 0)
+        rpn = tuple(stack[0])
+        return self.optimization(program._replace(rpn=rpn), len(program.rpn) - len(rpn))
 
 
 class ErrorChecker:
     """
     Class has methods for initial error check of math expression
+    Calculator runs the same checks fused into Lexer.scan pass
     """
 
     @staticmethod
@@ -443,68 +980,346 @@ class ErrorChecker:
         else:
             pass
 
+    @staticmethod
+    def check_space(previous, nxt, position=None):
+        """
+        Checks whether space between previous and next characters is unexpected
+        """
+        if nxt.isdigit() and previous.isdigit():
+            raise UnexpectedSpaceError('unexpected space between numbers', position)
+        elif nxt == ' ' or previous == ' ':
+            raise UnexpectedSpaceError('unexpected double space', position)
+        elif nxt == '.' and previous.isdigit() or nxt.isdigit() and previous == '.':
+            raise UnexpectedSpaceError('unexpected space between/or in fractional numbers', position)
+        elif nxt and previous and nxt in '<>=!' and previous in '<>=!':
+            raise UnexpectedSpaceError(f'unexpected space in comparison operation {previous + nxt}', position)
+        elif nxt and previous and nxt in '*/^' and previous in '*/^':
+            raise UnexpectedSpaceError(f'unexpected space in operation {previous + nxt}', position)
+        elif previous == '(' and nxt == ')':
+            raise UnexpectedSpaceError('unexpected empty parentheses', position)
+        elif previous == ')' and nxt == '.':
+            raise UnexpectedSpaceError('unexpected fractional number after ")"', position)
+
     @staticmethod
     def check_spaces(expression):
         """
         Checks whether unexpected spaces are in the string
         """
-        for index, character in enumerate(expression):
-            try:
-                nxt = expression[index + 1]
-                previous = expression[index - 1]
-                if character == ' ':
-                    if nxt.isdigit() and previous.isdigit():
-                        raise UnexpectedSpaceError('unexpected space between numbers')
-                    elif nxt == ' ' or previous == ' ':
-                        raise UnexpectedSpaceError('unexpected double space')
-                    elif nxt == '.' and previous.isdigit() or nxt.isdigit() and previous == '.':
-                        raise UnexpectedSpaceError('unexpected space between/or in fractional numbers')
-                    elif nxt in '<>=!' and previous in '<>=!':
-                        raise UnexpectedSpaceError(f'unexpected space in comparison operation {previous + nxt}')
-                    elif nxt in '*/^' and previous in '*/^':
-                        raise UnexpectedSpaceError(f'unexpected space in operation {previous + nxt}')
-                    elif previous == '(' and nxt == ')':
-                        raise UnexpectedSpaceError('unexpected empty parentheses')
-                    elif previous == ')' and nxt == '.':
-                        raise UnexpectedSpaceError('unexpected fractional number after ")"')
-            except IndexError:
-                pass
+        for index, character in enumerate(expression[:-1]):
+            if character == ' ':
+                ErrorChecker.check_space(expression[index - 1], expression[index + 1], index)
+
+
+class CompiledExpression(namedtuple('CompiledExpression', 'expression rpn variables')):
+    """
+    Immutable math expression compiled to Reverse Polish Notation tokens
+    with the set of free variable names it depends on
+    """
+    __slots__ = ()
+
+
+class CompiledExpressionCache:
+    """
+    Thread-safe LRU cache of compiled expressions keyed by expression text
+    None maxsize means unbounded cache, 0 disables caching
+    """
+    cache_info = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+    def __init__(self, maxsize=128):
+        if maxsize is not None and maxsize < 0:
+            raise ValueError('cache size can\'t be negative')
+        self.maxsize = maxsize
+        self.hits, self.misses = 0, 0
+        self.__programs = OrderedDict()
+        self.__lock = Lock()
+
+    def get(self, expression):
+        """
+        Returns cached program or None, updates hit/miss counters
+        """
+        with self.__lock:
+            program = self.__programs.get(expression)
+            if program is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.__programs.move_to_end(expression)
+            return program
+
+    def put(self, expression, program):
+        if self.maxsize == 0:
+            return
+        with self.__lock:
+            self.__programs[expression] = program
+            self.__programs.move_to_end(expression)
+            if self.maxsize is not None and len(self.__programs) > self.maxsize:
+                self.__programs.popitem(last=False)
+
+    def clear(self):
+        with self.__lock:
+            self.__programs.clear()
+            self.hits, self.misses = 0, 0
+
+    def info(self):
+        with self.__lock:
+            return self.cache_info(self.hits, self.misses, self.maxsize, len(self.__programs))
 
 
 class Calculator(ReversePolishNotationConverter, ReversePolishNotationHandler):
     """
     Main calculator class
+    Keeps no per-call state, so one instance can be shared between threads
+    numeric is name of numeric backend ('float', 'decimal' or 'fraction') or backend object,
+    precision sets number of significant digits of decimal backend and selects it by default
+    observer gets stage latencies, cache lookups, errors and evaluated programs, see stats.CalculatorObserver
+    store is path or store.ProgramStore keeping converted expressions on disk for other processes
+    bytecode=True compiles expressions to compact bytecode.Bytecode programs of float numbers
+    limits is limits.Limits of guarded evaluation of untrusted expressions, True means default limits
+    functions is functions.FunctionLibrary of user-defined functions, calculator takes ones added before its creation
     """
-    def __init__(self):
-        super().__init__()
+    def __init__(self, cache_size=128, optimize=False, numeric=None, precision=None, observer=None, store=None,
+                 bytecode=False, limits=None, functions=None):
+        super().__init__(functions.registry if functions is not None else None)
+        self.observer = observer
+        if isinstance(store, str):
+            from .store import ProgramStore
+            store = ProgramStore(store, registry=self.registry)
+        elif store is not None and store.registry.version != self.registry.version:
+            raise ValueError('program store was created with other operation registry')
+        self.store = store
+        self.cache = CompiledExpressionCache(cache_size)
+        self.failures, self.failures_size, self.failures_lock = {}, cache_size, Lock()
+        self.optimizer = RPNOptimizer(self.registry) if optimize else None
+        if isinstance(numeric, str) or precision is not None:
+            from .numeric import get_backend
+            numeric = get_backend(numeric or 'decimal', precision)
+        self.backend = numeric
+        self.assembler = None
+        if bytecode:
+            if numeric is not None and numeric.name != 'float':
+                raise ValueError('bytecode supports only float numbers')
+            if functions is not None:
+                raise ValueError('user-defined functions aren\'t supported by bytecode')
+            from .bytecode import BytecodeCompiler
+            self.assembler = BytecodeCompiler()
+        self.guard = None
+        if limits:
+            if bytecode:
+                raise ValueError('resource limits aren\'t supported by bytecode')
+            from .limits import ExpressionGuard
+            self.guard = ExpressionGuard(None if limits is True else limits, (numeric or self).convert)
+        self.expander = None
+        if self.registry.macros:
+            from .functions import MacroExpander
+            self.expander = MacroExpander(self.registry, self.guard.limits.max_tokens if self.guard else None)
 
     @staticmethod
-    def parse_expression():
+    def parse_arguments(args=None):
         """
         Creates command-line arguments parser
-        Returns parsed argument
+        Returns parsed arguments with expression string or batch source
         """
+        from argparse import ArgumentParser
         parser = ArgumentParser(description='Pure Python command-line calculator')
         parser.add_argument('EXPRESSION', help='expression string to evaluate', action='store_true')
-        parsed, args = parser.parse_known_args()
-        return args[0]
+        parser.add_argument('--batch', nargs='?', const='-', metavar='FILE',
+                            help='evaluate newline-delimited expressions from FILE or stdin')
+        parser.add_argument('--jobs', type=int, default=1, metavar='N',
+                            help='number of worker processes for batch mode, 0 means all cores')
+        parser.add_argument('--numeric', choices=('float', 'decimal', 'fraction'),
+                            help='numbers to calculate with: float (default), arbitrary-precision decimal '
+                                 'or exact fraction')
+        parser.add_argument('--precision', type=int, metavar='DIGITS',
+                            help='number of significant digits of decimal numbers')
+        parser.add_argument('--store', metavar='FILE',
+                            help='SQLite file keeping converted expressions for next runs')
+        parser.add_argument('--cse', action='store_true',
+                            help='evaluate common subexpressions of batch expressions once')
+        parser.add_argument('--format', choices=('text', 'json'), default='text',
+                            help='output values and error messages as text (default) or JSON objects '
+                                 'with error codes and positions')
+        parser.add_argument('--sandbox', action='store_true',
+                            help='evaluate untrusted expressions within default resource limits')
+        parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                            help='wall-clock budget of evaluation of every expression, implies --sandbox')
+        parser.add_argument('--stats', action='store_true',
+                            help='print stage latencies, cache hit rate and operation usage to stderr')
+        parsed, rest = parser.parse_known_args(args)
+        parsed.expression = rest[0] if rest else None
+        if parsed.expression is None and parsed.batch is None:
+            parser.error('the following arguments are required: EXPRESSION')
+        return parsed
+
+    @staticmethod
+    def parse_expression():
+        """
+        Returns expression string from command-line arguments
+        """
+        return Calculator.parse_arguments().expression
 
-    def calculate(self):
-        math_expression = self.parse_expression()
-        ErrorChecker.check_for_symbols(math_expression)
-        ErrorChecker.check_parentheses(math_expression)
-        ErrorChecker.check_spaces(math_expression)
-        rpn_expression = super().convert_to_rpn(math_expression)
-        return super().handle_operations(rpn_expression)
+    def observe_stage(self, stage, function, *args):
+        """
+        Calls function reporting its latency and error to observer as pipeline stage if calculator has observer
+        """
+        if self.observer is None:
+            return function(*args)
+        start = perf_counter()
+        try:
+            return function(*args)
+        except Exception as e:
+            self.observer.error(stage, e)
+            raise
+        finally:
+            self.observer.stage(stage, perf_counter() - start)
+
+    def compile(self, expression):
+        """
+        Checks and converts math expression to Reverse Polish Notation once
+        and optimizes it if calculator was created with optimize=True
+        Calls of macros are inlined if calculator has user-defined functions
+        Tokens are bound to numbers and functions of numeric backend if calculator has one
+        Converted expressions are loaded from and saved to persistent store if calculator has one
+        Expressions are checked against resource limits and get guarded actions if calculator has limits
+        Returns cached CompiledExpression, or Bytecode if calculator has assembler, for repeated expressions
+        """
+        observer = self.observer
+        program = self.cache.get(expression)
+        if observer is not None:
+            observer.cache(program is not None)
+        if program is None:
+            if self.guard is not None:
+                self.guard.check_length(expression)
+            rpn = None
+            if self.store is not None:
+                rpn = self.observe_stage('load', self.store.load, expression)
+            if rpn is None:
+                if observer is None:
+                    rpn = tuple(super().convert_to_rpn(expression))
+                else:
+                    tokens = self.observe_stage('scan', self.lexer.scan, expression)
+                    tokens = self.observe_stage('resolve', self.resolver.resolve, tokens)
+                    rpn = tuple(self.observe_stage('convert', super().convert_tokens_to_rpn, tokens))
+                if self.store is not None:
+                    self.store.save(expression, rpn)
+            variables = frozenset(token.text for token in rpn if token.kind == Token.VARIABLE)
+            program = CompiledExpression(expression, rpn, variables)
+            if self.expander is not None:
+                program = self.observe_stage('inline', self.expander.inline, program)
+            if self.backend is not None:
+                program = self.observe_stage('prepare', self.backend.prepare, program)
+            if self.guard is not None:
+                program = self.observe_stage('guard', self.guard.prepare, program)
+            if self.optimizer is not None:
+                program = self.observe_stage('optimize', self.optimizer.optimize, program).program
+            if self.assembler is not None:
+                program = self.observe_stage('assemble', self.assembler.assemble, program)
+            self.cache.put(expression, program)
+        return program
+
+    def evaluate(self, program, mapping=None, /, **bindings):
+        """
+        Evaluates compiled expression skipping all checks and conversions, within time budget if calculator has limits
+        Free variables are bound from mapping and/or keyword arguments
+        """
+        if mapping is not None:
+            bindings = {**mapping, **bindings} if bindings else mapping
+        if self.assembler is not None:
+            if self.observer is None:
+                return self.assembler.evaluate(program, bindings)
+            self.observer.evaluated(program)
+            return self.observe_stage('evaluate', self.assembler.evaluate, program, bindings)
+        if self.guard is not None:
+            handle_operations = self.guard.handle_operations
+        elif self.backend is not None:
+            handle_operations = self.backend.handle_operations
+        else:
+            handle_operations = super().handle_operations
+        if self.observer is None:
+            return handle_operations(program.rpn, bindings)
+        self.observer.evaluated(program)
+        return self.observe_stage('evaluate', handle_operations, program.rpn, bindings)
+
+    def calculate(self, expression=None, mapping=None, /, **bindings):
+        """
+        Calculates given expression or expression from command-line arguments
+        """
+        if expression is None:
+            expression = self.parse_expression()
+        return self.evaluate(self.compile(expression), mapping, **bindings)
+
+    def remember_failure(self, expression, result):
+        """
+        Keeps failed result of expression compilation, oldest ones are dropped when failures exceed cache size
+        Failures are read without lock, they are only added and dropped under it
+        """
+        if self.failures_size == 0:
+            return
+        with self.failures_lock:
+            if self.failures_size is not None and len(self.failures) >= self.failures_size:
+                del self.failures[next(iter(self.failures))]
+            self.failures[expression] = result
+
+    def try_calculate(self, expression, mapping=None, /, **bindings):
+        """
+        Calculates expression without raising, returns CalculationResult with value or error code
+        Failed compilations are cached, so repeated malformed expressions skip the front end
+        """
+        result = self.failures.get(expression)
+        if result is None:
+            try:
+                program = self.compile(expression)
+            except Exception as e:
+                result = CalculationResult.failure(e)
+                self.remember_failure(expression, result)
+            else:
+                try:
+                    return CalculationResult(self.evaluate(program, mapping, **bindings), None, None, None)
+                except Exception as e:
+                    result = CalculationResult.failure(e)
+        if self.observer is not None:
+            self.observer.failed(result)
+        return result
 
 
 def main():
+    """
+    Command-line entry point, plain "pycalc EXPRESSION" call skips building argument parser
+    """
+    args = sys.argv[1:]
+    if args[:1] == ['serve']:
+        from .server import main as serve
+        return serve(args[1:])
+    if len(args) == 1 and args[0] != '-h' and not args[0].startswith('--'):
+        print(Calculator().try_calculate(args[0]).to_line())
+        return
+    stats = None
     try:
-        calculator = Calculator()
-        print(calculator.calculate())
+        arguments = Calculator.parse_arguments()
+        if arguments.stats:
+            from .stats import EvaluationStats
+            stats = EvaluationStats()
+        limits = None
+        if arguments.sandbox or arguments.timeout is not None:
+            from .limits import Limits
+            limits = Limits() if arguments.timeout is None else Limits(timeout=arguments.timeout)
+        if arguments.batch is not None:
+            from .batch import run_batch
+            run_batch(arguments.batch, jobs=arguments.jobs, numeric=arguments.numeric, precision=arguments.precision,
+                      stats=stats, store=arguments.store, cse=arguments.cse, output_format=arguments.format,
+                      limits=limits)
+        else:
+            calculator = Calculator(numeric=arguments.numeric, precision=arguments.precision, observer=stats,
+                                    store=arguments.store, limits=limits)
+            print(calculator.try_calculate(arguments.expression).to_line(arguments.format))
     except Exception as e:
         print(f'ERROR: {e}')
+    if stats is not None:
+        print(stats.summary(), file=sys.stderr)
 
 
 if __name__ == "__main__":
-    main()
+    if __spec__ is not None:
+        from importlib import import_module
+        import_module(__spec__.name).main()
+    else:
+        main()
@@ -0,0 +1,328 @@
+"""
+Asyncio evaluation service answering over TCP or Unix sockets with JSON lines or HTTP
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import json
+
+from . import batch
+from .limits import Limits
+from .pycalc import CalculationResult, Calculator
+
+MAX_LINE = 1 << 20
+
+
+def evaluate_requests(requests, calculator=None):
+    """
+    Returns response for every (expression, variables) request, errors are returned as structured objects
+    Uses calculator of batch worker process if calculator isn't given
+    """
+    calculator = calculator or batch._worker_calculator
+    return [calculator.try_calculate(expression, variables or None).to_dict() for expression, variables in requests]
+
+
+def request_error(kind, code, message):
+    """
+    Returns response object of error of request itself
+    """
+    return {'error': {'type': kind, 'code': code, 'message': message, 'position': None}}
+
+
+class EvaluationService:
+    """
+    Evaluates expressions of many concurrent clients on a bounded pool of workers
+    Requests waiting at most batch_delay seconds are sent to a worker together, up to batch_size of them
+    At most queue_size requests wait for workers, further clients wait to enqueue, so socket reading stops
+    Worker threads share one calculator, worker processes have calculators of their own
+    """
+
+    def __init__(self, workers=1, processes=False, batch_size=64, batch_delay=0.001, queue_size=1024,
+                 calculator=None, **options):
+        self.workers, self.batch_size, self.batch_delay = workers, batch_size, batch_delay
+        self.queue_size = queue_size
+        self.batches = 0
+        if processes:
+            initargs = (options.get('cache_size', 128), options.get('numeric'), options.get('precision'), False,
+                        options.get('store'), options.get('limits'))
+            self.executor = ProcessPoolExecutor(workers, initializer=batch.initialize_worker, initargs=initargs)
+            self.calculator = None
+        else:
+            self.executor = ThreadPoolExecutor(workers)
+            self.calculator = calculator or Calculator(**options)
+        self.queue = self.dispatcher = None
+
+    async def start(self):
+        self.queue = asyncio.Queue(self.queue_size)
+        self.dispatcher = asyncio.create_task(self.dispatch())
+
+    async def close(self):
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+            await asyncio.gather(self.dispatcher, return_exceptions=True)
+        self.executor.shutdown()
+
+    async def evaluate(self, expression, variables=None):
+        """
+        Returns response object of expression evaluated with variables mapping
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((expression, variables, future))
+        return await future
+
+    async def collect(self):
+        """
+        Returns next batch of queued requests
+        """
+        requests = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.batch_delay
+        while len(requests) < self.batch_size:
+            if self.queue.empty():
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    requests.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                requests.append(self.queue.get_nowait())
+        return requests
+
+    async def dispatch(self):
+        loop, workers = asyncio.get_running_loop(), asyncio.Semaphore(self.workers)
+        running = set()
+        try:
+            while True:
+                requests = await self.collect()
+                await workers.acquire()
+                self.batches += 1
+                task = asyncio.create_task(self.run(loop, requests))
+                task.add_done_callback(lambda _: workers.release())
+                running.add(task)
+                task.add_done_callback(running.discard)
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def run(self, loop, requests):
+        try:
+            responses = await loop.run_in_executor(
+                self.executor, evaluate_requests, [(expression, variables) for expression, variables, _ in requests],
+                self.calculator)
+        except Exception as e:
+            responses = [CalculationResult.failure(e).to_dict()] * len(requests)
+        for (_, _, future), response in zip(requests, responses):
+            if not future.done():
+                future.set_result(response)
+
+
+def parse_request(data):
+    """
+    Returns (id, expression, variables) of JSON object or plain expression text
+    """
+    if isinstance(data, str):
+        if not data.lstrip().startswith('{'):
+            return None, data, None
+        data = json.loads(data)
+    if not isinstance(data, dict) or not isinstance(data.get('expression'), str):
+        raise ValueError('request must have "expression" string')
+    variables = data.get('variables')
+    if variables is not None and not isinstance(variables, dict):
+        raise ValueError('request "variables" must be an object')
+    return data.get('id'), data['expression'], variables
+
+
+async def answer(service, data):
+    """
+    Returns response object of parsed request with its id
+    """
+    try:
+        request_id, expression, variables = parse_request(data)
+    except ValueError as e:
+        return request_error(e.__class__.__name__, 'invalid_request', str(e))
+    response = await service.evaluate(expression, variables)
+    if request_id is not None:
+        response = {'id': request_id, **response}
+    return response
+
+
+async def read_line(reader):
+    """
+    Returns next line of reader, empty bytes at the end of stream
+    Lines longer than reader limit are skipped up to their end and returned as None
+    """
+    try:
+        return await reader.readuntil(b'\n')
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError as e:
+        consumed = e.consumed
+    while True:
+        await reader.readexactly(consumed)
+        try:
+            await reader.readuntil(b'\n')
+            return None
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+
+
+async def handle_lines(service, reader, writer, window=256):
+    """
+    Answers newline-delimited requests of one connection in order, plain expressions or JSON objects
+    At most window requests of connection are evaluated at once
+    Lines longer than MAX_LINE or not in UTF-8 are answered with invalid_request error
+    """
+    loop, pending = asyncio.get_running_loop(), asyncio.Queue(window)
+
+    def rejected(kind, message):
+        future = loop.create_future()
+        future.set_result(request_error(kind, 'invalid_request', message))
+        return future
+
+    async def respond():
+        while True:
+            task = await pending.get()
+            if task is None:
+                break
+            writer.write(json.dumps(await task).encode() + b'\n')
+            await writer.drain()
+
+    responder = asyncio.create_task(respond())
+    try:
+        while True:
+            line = await read_line(reader)
+            if line is None:
+                await pending.put(rejected('LimitOverrunError', f'request line exceeds {MAX_LINE} bytes'))
+                continue
+            if not line:
+                break
+            try:
+                line = line.decode().rstrip('\r\n')
+            except UnicodeDecodeError as e:
+                await pending.put(rejected(e.__class__.__name__, str(e)))
+                continue
+            if line:
+                await pending.put(asyncio.create_task(answer(service, line)))
+        await pending.put(None)
+        await responder
+    finally:
+        responder.cancel()
+        writer.close()
+
+
+async def handle_http(service, reader, writer):
+    """
+    Answers HTTP/1.1 requests of one connection: POST /evaluate with JSON request object or list of them
+    Bodies longer than MAX_LINE are answered with 413 status and connection is closed without reading them
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            keep_alive = headers.get('connection', '').lower() != 'close'
+            if length > MAX_LINE:
+                status, keep_alive = '413 Payload Too Large', False
+                response = request_error('PayloadTooLarge', 'payload_too_large',
+                                         f'request body exceeds {MAX_LINE} bytes')
+            else:
+                status, response = await route(service, method, path, await reader.readexactly(length))
+            payload = json.dumps(response).encode()
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n'
+                         f'Content-Length: {len(payload)}\r\n'
+                         f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + payload)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def route(service, method, path, body):
+    """
+    Returns HTTP status and response object of request
+    """
+    if path == '/health' and method == 'GET':
+        return '200 OK', {'status': 'ok'}
+    if path != '/evaluate':
+        return '404 Not Found', request_error('NotFound', 'not_found', f'no resource {path}')
+    if method != 'POST':
+        return '405 Method Not Allowed', request_error('MethodNotAllowed', 'method_not_allowed', 'use POST')
+    try:
+        data = json.loads(body or b'null')
+    except ValueError as e:
+        return '400 Bad Request', request_error(e.__class__.__name__, 'invalid_request', str(e))
+    if isinstance(data, list):
+        return '200 OK', list(await asyncio.gather(*(answer(service, item) for item in data)))
+    return '200 OK', await answer(service, data)
+
+
+async def serve(service, host='127.0.0.1', port=8000, path=None, http=False, started=None):
+    """
+    Serves requests until cancelled, on Unix socket path if it's given or on TCP host and port
+    started future gets listening server
+    """
+    await service.start()
+
+    async def handle(reader, writer):
+        if http:
+            await handle_http(service, reader, writer)
+        else:
+            await handle_lines(service, reader, writer)
+
+    if path is not None:
+        server = await asyncio.start_unix_server(handle, path, limit=MAX_LINE)
+    else:
+        server = await asyncio.start_server(handle, host, port, limit=MAX_LINE)
+    if started is not None:
+        started.set_result(server)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(args=None):
+    parser = ArgumentParser(prog='pycalc serve', description='Serve math expression evaluation over sockets')
+    parser.add_argument('--host', default='127.0.0.1', help='TCP host, default 127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000, help='TCP port, default 8000')
+    parser.add_argument('--unix', metavar='PATH', help='serve on Unix socket PATH instead of TCP')
+    parser.add_argument('--http', action='store_true', help='speak HTTP instead of newline-delimited JSON')
+    parser.add_argument('--workers', type=int, default=1, metavar='N', help='number of evaluation workers')
+    parser.add_argument('--processes', action='store_true', help='evaluate in worker processes instead of threads')
+    parser.add_argument('--batch-size', type=int, default=64, metavar='N',
+                        help='maximum number of requests evaluated by worker at once')
+    parser.add_argument('--queue-size', type=int, default=1024, metavar='N',
+                        help='maximum number of requests waiting for workers')
+    parser.add_argument('--numeric', choices=('float', 'decimal', 'fraction'), help='numbers to calculate with')
+    parser.add_argument('--precision', type=int, metavar='DIGITS', help='significant digits of decimal numbers')
+    parser.add_argument('--store', metavar='FILE', help='SQLite file keeping converted expressions')
+    parser.add_argument('--sandbox', action='store_true', help='evaluate within default resource limits')
+    parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                        help='wall-clock budget of evaluation of every expression, implies --sandbox')
+    arguments = parser.parse_args(args)
+    limits = None
+    if arguments.sandbox or arguments.timeout is not None:
+        limits = Limits() if arguments.timeout is None else Limits(timeout=arguments.timeout)
+    service = EvaluationService(arguments.workers, arguments.processes, arguments.batch_size,
+                                queue_size=arguments.queue_size, numeric=arguments.numeric,
+                                precision=arguments.precision, store=arguments.store, limits=limits)
+    try:
+        asyncio.run(serve(service, arguments.host, arguments.port, arguments.unix, arguments.http))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,186 @@
+"""
+Opt-in instrumentation of calculator pipeline: stage latency histograms, cache hit rate and operation usage
+"""
+from collections import Counter
+from threading import Lock
+
+
+class CalculatorObserver:
+    """
+    Base observer of Calculator pipeline, all callbacks do nothing
+    Stages are 'load', 'scan', 'resolve', 'convert', 'inline', 'prepare', 'guard', 'optimize', 'assemble'
+    and 'evaluate'
+    """
+
+    def stage(self, name, seconds):
+        """
+        Called after every pipeline stage with its latency in seconds
+        """
+
+    def cache(self, hit):
+        """
+        Called after every compiled expression cache lookup
+        """
+
+    def error(self, stage, error):
+        """
+        Called when pipeline stage raises error
+        """
+
+    def evaluated(self, program):
+        """
+        Called before evaluation of compiled expression
+        """
+
+    def failed(self, result):
+        """
+        Called when non-raising calculation returns failed CalculationResult
+        """
+
+    def shared(self, evaluations, saved):
+        """
+        Called after evaluation of batch sharing subexpressions with number of operations and saved evaluations
+        """
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies with power of two microsecond buckets
+    Bucket k counts latencies from 2 ** (k - 1) to 2 ** k microseconds
+    """
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count, self.total, self.maximum = 0, 0.0, 0.0
+
+    def record(self, seconds):
+        self.buckets[int(seconds * 1e6).bit_length()] += 1
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """
+        Returns upper bound in seconds of bucket holding given fraction of latencies
+        """
+        if not self.count:
+            return 0.0
+        rank, seen = fraction * self.count, 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** bucket / 1e6, self.maximum)
+        return self.maximum
+
+
+class EvaluationStats(CalculatorObserver):
+    """
+    Thread-safe observer collecting stage latency histograms, cache hits and misses,
+    errors per stage, failed results per error code and usage counts of operations and functions
+    Stats of several calculators, e.g. of batch worker processes, are combined by merge()
+    """
+    stages = ('load', 'scan', 'resolve', 'convert', 'inline', 'prepare', 'guard', 'optimize', 'assemble', 'evaluate')
+
+    def __init__(self):
+        self.histograms = {}
+        self.hits, self.misses = 0, 0
+        self.errors = Counter()
+        self.failures = Counter()
+        self.operations = Counter()
+        self.evaluations, self.saved = 0, 0
+        self.__lock = Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_EvaluationStats__lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = Lock()
+
+    def stage(self, name, seconds):
+        with self.__lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def cache(self, hit):
+        with self.__lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def error(self, stage, error):
+        with self.__lock:
+            self.errors[stage] += 1
+
+    def evaluated(self, program):
+        operations = [token.text for token in program.rpn if token.arity]
+        with self.__lock:
+            self.operations.update(operations)
+
+    def failed(self, result):
+        with self.__lock:
+            self.failures[result.code.value] += 1
+
+    def shared(self, evaluations, saved):
+        with self.__lock:
+            self.evaluations += evaluations
+            self.saved += saved
+
+    def merge(self, other):
+        with self.__lock:
+            for name, histogram in other.histograms.items():
+                self.histograms.setdefault(name, LatencyHistogram()).merge(histogram)
+            self.hits += other.hits
+            self.misses += other.misses
+            self.errors.update(other.errors)
+            self.failures.update(other.failures)
+            self.operations.update(other.operations)
+            self.evaluations += other.evaluations
+            self.saved += other.saved
+
+    def stage_order(self, name):
+        return (self.stages.index(name), '') if name in self.stages else (len(self.stages), name)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self, top=10):
+        """
+        Returns human readable summary of collected stats
+        """
+        with self.__lock:
+            lines = [f'{"stage":<10} {"count":>8} {"total, ms":>10} {"mean, us":>10} {"p50, us":>10} '
+                     f'{"p99, us":>10} {"max, us":>10}']
+            names = sorted(self.histograms, key=self.stage_order)
+            for name in names:
+                histogram = self.histograms[name]
+                lines.append(f'{name:<10} {histogram.count:>8} {histogram.total * 1e3:>10.3f} '
+                             f'{histogram.mean() * 1e6:>10.2f} {histogram.percentile(0.5) * 1e6:>10.2f} '
+                             f'{histogram.percentile(0.99) * 1e6:>10.2f} {histogram.maximum * 1e6:>10.2f}')
+            lines.append(f'cache: {self.hits} hits, {self.misses} misses, {self.hit_rate():.1%} hit rate')
+            if self.evaluations:
+                lines.append(f'shared subexpressions: {self.saved} of {self.evaluations} evaluations saved')
+            if self.errors:
+                lines.append('errors: ' + ', '.join(f'{stage} {self.errors[stage]}'
+                                                    for stage in sorted(self.errors, key=self.stage_order)))
+            if self.failures:
+                lines.append('failures: ' + ', '.join(f'{code} {count}' for code, count in self.failures.most_common()))
+            if self.operations:
+                lines.append('operations: ' + ', '.join(f'{name} {count}'
+                                                        for name, count in self.operations.most_common(top)))
+            return '\n'.join(lines)
@@ -0,0 +1,95 @@
+"""
+Persistent on-disk store of compiled expressions shared by calculator processes
+"""
+from hashlib import sha256
+from threading import Lock
+import json
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+from .pycalc import Lexer, Token
+
+
+class ProgramStore(Lexer):
+    """
+    SQLite store of expressions converted to Reverse Polish Notation, keyed by hash
+    of expression text, operation registry version and storage format version
+    Stores front end output only, so programs are shared by calculators of any numeric backend
+    and optimization settings
+    WAL journal lets many processes read while one of them writes, writers wait for each other
+    registry of calculator with user-defined functions lets store decode their calls
+    """
+    format_version = 1
+
+    def __init__(self, path, timeout=30.0, registry=None):
+        if sqlite3 is None:
+            raise ImportError('sqlite3 is required for persistent program store')
+        super().__init__(registry)
+        self.path = path
+        self.__lock = Lock()
+        self.__connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        with self.__lock:
+            self.__connection.execute('PRAGMA journal_mode=WAL')
+            self.__connection.execute('PRAGMA synchronous=NORMAL')
+            self.__connection.execute('CREATE TABLE IF NOT EXISTS programs '
+                                      '(key TEXT PRIMARY KEY, version TEXT NOT NULL, rpn TEXT NOT NULL)')
+        self.version = f'{self.registry.version}-{self.format_version}'
+
+    def key(self, expression):
+        return sha256(f'{self.version}\0{expression}'.encode()).hexdigest()
+
+    def encode(self, rpn):
+        """
+        Returns compact JSON of text, position and arity of RPN tokens
+        """
+        return json.dumps([[token.text, token.position, token.arity] for token in rpn], separators=(',', ':'))
+
+    def decode(self, data):
+        """
+        Returns RPN tokens tuple of encoded program, operations keep stored arity of variadic functions
+        """
+        rpn = []
+        for text, position, arity in json.loads(data):
+            if text[0].isdigit() or text[0] == '.':
+                token = Token(Token.NUMBER, text, position, value=float(text))
+            else:
+                token = super().template_token(text, position)
+                token.arity = arity
+            rpn.append(token)
+        return tuple(rpn)
+
+    def load(self, expression):
+        """
+        Returns stored RPN tokens of expression or None
+        """
+        with self.__lock:
+            row = self.__connection.execute('SELECT rpn FROM programs WHERE key = ?',
+                                            (self.key(expression),)).fetchone()
+        return None if row is None else self.decode(row[0])
+
+    def save(self, expression, rpn):
+        """
+        Stores RPN tokens of expression, programs stored by other processes are kept
+        """
+        data = self.encode(rpn)
+        with self.__lock:
+            self.__connection.execute('INSERT OR IGNORE INTO programs (key, version, rpn) VALUES (?, ?, ?)',
+                                      (self.key(expression), self.version, data))
+
+    def purge(self):
+        """
+        Deletes programs stored with other registry or format version, returns their number
+        """
+        with self.__lock:
+            return self.__connection.execute('DELETE FROM programs WHERE version != ?', (self.version,)).rowcount
+
+    def __len__(self):
+        with self.__lock:
+            return self.__connection.execute('SELECT COUNT(*) FROM programs').fetchone()[0]
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
@@ -0,0 +1,49 @@
+"""
+Precomputed tables of math module functions and constants, so startup skips introspection
+Generated by python -m calculator.tables, registry introspects math module on other Python versions
+"""
+python_version = (3, 11)
+
+math_arities = {
+    'acos': 1, 'acosh': 1, 'asin': 1, 'asinh': 1, 'atan': 1, 'atan2': 2, 'atanh': 1, 'cbrt': 1, 'ceil': 1,
+    'comb': 2, 'copysign': 2, 'cos': 1, 'cosh': 1, 'degrees': 1, 'dist': 2, 'erf': 1, 'erfc': 1, 'exp': 1,
+    'exp2': 1, 'expm1': 1, 'fabs': 1, 'factorial': 1, 'floor': 1, 'fmod': 2, 'frexp': 1, 'fsum': 1, 'gamma': 1,
+    'gcd': 2, 'hypot': 2, 'isclose': 2, 'isfinite': 1, 'isinf': 1, 'isnan': 1, 'isqrt': 1, 'lcm': 2, 'ldexp': 2,
+    'lgamma': 1, 'log': 1, 'log10': 1, 'log1p': 1, 'log2': 1, 'modf': 1, 'nextafter': 2, 'perm': 1, 'pow': 2,
+    'prod': 1, 'radians': 1, 'remainder': 2, 'sin': 1, 'sinh': 1, 'sqrt': 1, 'tan': 1, 'tanh': 1, 'trunc': 1,
+    'ulp': 1,
+}
+
+math_constants = ('e', 'inf', 'nan', 'pi', 'tau')
+
+
+def generate():
+    """
+    Returns source of this module with tables of running Python version
+    """
+    import sys
+    from .pycalc import OperationRegistry
+    arities, constants = OperationRegistry.introspect_math()
+    lines = ['']
+    for name, arity in arities.items():
+        item = f'{name!r}: {arity},'
+        if len(lines[-1]) + len(item) >= 112:
+            lines.append('')
+        lines[-1] += f' {item}' if lines[-1] else item
+    with open(__file__) as source:
+        text = source.read()
+    header, _, rest = text.partition('python_version = ')
+    functions = rest[rest.index('\n\n\ndef generate') + 1:]
+    return (f'{header}python_version = {tuple(sys.version_info[:2])!r}\n\n'
+            'math_arities = {\n' + ''.join(f'    {line}\n' for line in lines) + '}\n\n'
+            f'math_constants = {constants!r}\n' + functions)
+
+
+def main():
+    source = generate()
+    with open(__file__, 'w') as module:
+        module.write(source)
+
+
+if __name__ == '__main__':
+    main()
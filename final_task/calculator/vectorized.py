@@ -0,0 +1,165 @@
+"""
+NumPy-vectorized evaluation of compiled math expressions
+"""
+from collections import namedtuple
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .pycalc import (MathModuleData, MissingParameterError, RedundantParameterError, Token, UnboundVariableError,
+                     UnsupportedOperationError)
+
+
+BatchResult = namedtuple('BatchResult', 'values errors')
+
+
+class VectorizedEvaluator(MathModuleData):
+    """
+    Evaluates compiled expressions over NumPy arrays of variable values
+    Domain errors are reported per element through errors mask instead of raising
+    Programs of calculators with user-defined functions need evaluator created with their registry
+    """
+
+    def __init__(self, registry=None):
+        if numpy is None:
+            raise ImportError('numpy is required for vectorized evaluation')
+        super().__init__(registry)
+        ufuncs = {
+            '^': numpy.power,
+            '**': numpy.power,
+            'pow': numpy.power,
+            '/': numpy.true_divide,
+            '//': numpy.floor_divide,
+            '%': numpy.mod,
+            '*': numpy.multiply,
+            '+': numpy.add,
+            '-': numpy.subtract,
+            '<': numpy.less,
+            '<=': numpy.less_equal,
+            '=': numpy.equal,
+            '==': numpy.equal,
+            '!=': numpy.not_equal,
+            '>=': numpy.greater_equal,
+            '>': numpy.greater,
+            'log': lambda digit, base: numpy.log(digit) / numpy.log(base),
+            'atan2': numpy.arctan2,
+            'hypot': numpy.hypot,
+            'copysign': numpy.copysign,
+            'fmod': numpy.fmod,
+            'minus': numpy.negative,
+            'plus': numpy.positive,
+            'abs': numpy.abs,
+            'fabs': numpy.fabs,
+            'sqrt': numpy.sqrt,
+            'cbrt': numpy.cbrt,
+            'exp': numpy.exp,
+            'exp2': numpy.exp2,
+            'expm1': numpy.expm1,
+            'ln': numpy.log,
+            'log2': numpy.log2,
+            'log10': numpy.log10,
+            'log1p': numpy.log1p,
+            'sin': numpy.sin,
+            'cos': numpy.cos,
+            'tan': numpy.tan,
+            'asin': numpy.arcsin,
+            'acos': numpy.arccos,
+            'atan': numpy.arctan,
+            'sinh': numpy.sinh,
+            'cosh': numpy.cosh,
+            'tanh': numpy.tanh,
+            'asinh': numpy.arcsinh,
+            'acosh': numpy.arccosh,
+            'atanh': numpy.arctanh,
+            'floor': numpy.floor,
+            'ceil': numpy.ceil,
+            'trunc': numpy.trunc,
+            'round': numpy.round,
+            'degrees': numpy.degrees,
+            'radians': numpy.radians,
+            'isnan': numpy.isnan,
+            'isinf': numpy.isinf,
+            'isfinite': numpy.isfinite,
+        }
+        operation = namedtuple('operation', 'arity action')
+        self.__operations = {}
+        for name, arity in self.registry.arities.items():
+            action = ufuncs.get(name) or self.elementwise(super().get_all_operations()[name], arity)
+            self.__operations[name] = operation(arity, action)
+        self.__zero_divisor_operations = ('/', '//', '%', 'fmod')
+        self.__logarithm_base_operations = ('log',)
+
+    @staticmethod
+    def elementwise(function, arity):
+        """
+        Wraps scalar function to NumPy function returning nan instead of raising
+        Integral float arguments are passed as int, e.g. for factorial or gcd
+        """
+
+        def safe(*args):
+            try:
+                return float(function(*(int(arg) if arg.is_integer() else arg for arg in args)))
+            except (ValueError, ArithmeticError, TypeError):
+                return math.nan
+
+        universal = numpy.frompyfunc(safe, arity, 1)
+        return lambda *args: numpy.asarray(universal(*args), dtype=float)
+
+    def bind(self, program, arrays):
+        """
+        Converts values of program variables to float arrays
+        """
+        values = {}
+        for name in program.variables:
+            try:
+                values[name] = numpy.asarray(arrays[name], dtype=float)
+            except KeyError:
+                raise UnboundVariableError(f'no value for variable "{name}"')
+        return values
+
+    def evaluate(self, program, mapping=None, /, **arrays):
+        """
+        Evaluates compiled expression for every element of variable arrays
+        Returns BatchResult with values array and boolean errors mask
+        Values of failed elements are nan
+        """
+        if mapping is not None:
+            arrays = {**mapping, **arrays} if arrays else mapping
+        values = self.bind(program, arrays)
+        errors = numpy.zeros(numpy.broadcast_shapes(*(value.shape for value in values.values())), dtype=bool)
+        stack = []
+        with numpy.errstate(all='ignore'):
+            for token in program.rpn:
+                if token.kind == Token.NUMBER or token.kind == Token.CONSTANT:
+                    stack.append(token.value)
+                elif token.kind == Token.VARIABLE:
+                    stack.append(values[token.text])
+                else:
+                    if token.text not in self.__operations:
+                        raise UnsupportedOperationError(f'operation "{token.text}" is not supported by evaluator, '
+                                                        f'create it with registry of the calculator', token.position)
+                    arity, action = self.__operations[token.text]
+                    if token.arity != arity:
+                        arity, action = token.arity, self.elementwise(super().get_all_operations()[token.text],
+                                                                      token.arity)
+                    if len(stack) < arity:
+                        raise MissingParameterError(f'not enough operands for "{token.text}" operation',
+                                                    token.position)
+                    args = stack[-arity:]
+                    del stack[-arity:]
+                    result = action(*args)
+                    failed = ~numpy.isfinite(result)
+                    for arg in args:
+                        failed &= numpy.isfinite(arg)
+                    if token.text in self.__zero_divisor_operations:
+                        failed |= args[1] == 0
+                    elif token.text in self.__logarithm_base_operations:
+                        failed |= (args[1] <= 0) | (args[1] == 1)
+                    errors |= failed
+                    stack.append(numpy.where(failed, numpy.nan, result))
+        if len(stack) > 1:
+            raise RedundantParameterError('function takes more parameters that it should')
+        return BatchResult(numpy.where(errors, numpy.nan, stack[0]), errors)
@@ -7,6 +7,9 @@ setup(
     author_email='Pavel_Kuzmich@epam.com',
     description='Pure Python command-line calculator',
     packages=find_packages(),
+    extras_require={
+        'vectorized': ['numpy'],
+    },
     entry_points={
         'console_scripts': [
             'pycalc=calculator.pycalc:main',
@@ -1,7 +1,23 @@
+import asyncio
+import json
 import unittest
+from array import array
 from parameterized import parameterized, parameterized_class
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from unittest import mock
+import os
+import pickle
+import subprocess
 import sys
-from final_task.calculator import pycalc
+import time
+import tracemalloc
+from final_task.calculator import (pycalc, vectorized, batch, codegen, numeric, stats, store, bytecode, server,
+                                   incremental, cse, tables, limits, functions)
+from decimal import Decimal
+from fractions import Fraction
+import decimal
 import math
 
 
@@ -24,8 +40,17 @@ class TestMathOperationsHandler(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.math_operations.factorial(-13)
         self.assertEqual(self.math_operations.factorial(5), 120)
+        self.assertEqual(self.math_operations.factorial(5.0), 120)
         self.assertEqual(self.math_operations.factorial(0), 1)
 
+    def test_common_divisor_and_multiple(self):
+        self.assertEqual(self.math_operations.greatest_common_divisor(12.0, 18, 8.0), 2)
+        self.assertEqual(self.math_operations.least_common_multiple(4.0, 6.0), 12)
+        with self.assertRaises(ValueError):
+            self.math_operations.greatest_common_divisor(4.5, 6)
+        with self.assertRaises(ValueError):
+            self.math_operations.least_common_multiple(4, math.nan)
+
     def test_logarithm(self):
         self.assertEqual(self.math_operations.logarithm(8, 2), math.log(8, 2))
         with self.assertRaises(ZeroDivisionError):
@@ -87,39 +112,179 @@ class TestMathOperationsHandler(unittest.TestCase):
         self.assertEqual(self.math_operations.is_number('sin'), False)
 
 
+class TestOperationRegistry(unittest.TestCase):
+    def test_shared_registry(self):
+        registry = pycalc.get_registry()
+        self.assertIs(pycalc.get_registry(), registry)
+        self.assertIs(pycalc.Calculator().registry, registry)
+        self.assertIs(pycalc.Lexer().get_constants(), registry.constants)
+
+    @parameterized.expand([
+        ('sin', 1),
+        ('log', 2),
+        ('atan2', 2),
+        ('copysign', 2),
+        ('gcd', 2),
+        ('perm', 1),
+        ('isclose', 2),
+        ('round', 1),
+        ('minus', 1),
+        ('!', 1),
+        ('//', 2),
+    ])
+    def test_arity(self, name, arity):
+        self.assertEqual(pycalc.get_registry().arities[name], arity)
+
+    def test_immutable_tables(self):
+        with self.assertRaises(TypeError):
+            pycalc.get_registry().constants['pi'] = 3
+
+
+class TestStartup(unittest.TestCase):
+    @unittest.skipUnless(tables.python_version == sys.version_info[:2], 'tables are generated for other Python')
+    def test_tables_match_math_module(self):
+        self.assertEqual(pycalc.OperationRegistry.math_tables(), pycalc.OperationRegistry.introspect_math())
+        with open(tables.__file__) as source:
+            self.assertEqual(tables.generate(), source.read())
+
+    def test_registry_of_other_python(self):
+        with mock.patch.object(tables, 'python_version', (2, 7)):
+            introspected = pycalc.OperationRegistry()
+        registry = pycalc.get_registry()
+        self.assertEqual(dict(introspected.arities), dict(registry.arities))
+        self.assertEqual(introspected.constants.keys(), registry.constants.keys())
+        self.assertEqual(introspected.version, registry.version)
+
+    def test_lazy_imports(self):
+        code = ('import sys; sys.argv = ["pycalc", "2*(3+4)"]; from final_task.calculator import pycalc; '
+                'pycalc.main(); print(sorted({"argparse", "hashlib", "json", "numbers"} & set(sys.modules)))')
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.splitlines(), ['14.0', '[]'])
+
+
+def texts(tokens):
+    return [token.text for token in tokens]
+
+
 class TestExpressionResolver(unittest.TestCase):
     def setUp(self):
         self.resolver = pycalc.ExpressionResolver()
+        self.lexer = pycalc.Lexer()
 
     # some issue with (3)(10+1) kind of expression
     @parameterized.expand([
-        ('2 ( 10 + 1 )'.split(), '2 * ( 10 + 1 )'.split()),
-        ('8 sin ( 10 + 1 )'.split(), '8 * sin ( 10 + 1 )'.split()),
-        ('e pi'.split(), 'e * pi'.split()),
-        ('( 3 ) 10'.split(), '( 3 ) * 10'.split()),
-        ('6 pi'.split(), '6 * pi'.split()),
+        ('2 ( 10 + 1 )', '2 * ( 10 + 1 )'.split()),
+        ('8 sin ( 10 + 1 )', '8 * sin ( 10 + 1 )'.split()),
+        ('e pi', 'e * pi'.split()),
+        ('( 3 ) 10', '( 3 ) * 10'.split()),
+        ('6 pi', '6 * pi'.split()),
+        ('2 x', '2 * x'.split()),
+        ('x y', 'x * y'.split()),
     ])
     def test_resolve_implicit_multiplication(self, expression, expected):
-        self.assertEqual(self.resolver.resolve_implicit_multiplication(expression), expected)
+        tokens = self.resolver.resolve(self.lexer.scan(expression))
+        self.assertEqual(texts(tokens), expected)
 
     @parameterized.expand([
-        ('log ( 8 , 2 )'.split(), 'log ( 8 , 2 )'.split()),
-        ('log ( 8 )'.split(), 'ln ( 8 )'.split()),
+        ('log ( 8 , 2 )', 'log ( 8 , 2 )'.split()),
+        ('log ( 8 )', 'ln ( 8 )'.split()),
+        ('log ( log ( 8 , 2 ) )', 'ln ( log ( 8 , 2 ) )'.split()),
+        ('log ( 8 ) + log ( 9 , 3 )', 'ln ( 8 ) + log ( 9 , 3 )'.split()),
+        ('log ( pow ( 2 , 3 ) )', 'ln ( pow ( 2 , 3 ) )'.split()),
     ])
     def test_resolve_log(self, expression, expected):
-        self.assertEqual(self.resolver.resolve_log(expression), expected)
+        self.assertEqual(texts(self.resolver.resolve(self.lexer.scan(expression))), expected)
 
     @parameterized.expand([
-        ('+ 13'.split(), 'plus 13'.split()),
-        ('- sin ( pi )'.split(), 'minus sin ( pi )'.split()),
+        ('gcd(12, 18, 8)', 3),
+        ('hypot(3, 4)', 2),
+        ('lcm(2, 3, 4, 5)', 4),
+    ])
+    def test_resolve_variadic(self, expression, arity):
+        tokens = self.resolver.resolve(self.lexer.scan(expression))
+        self.assertEqual(tokens[0].arity, arity)
+
+    @parameterized.expand([
+        ('sin(1, 2)', pycalc.RedundantParameterError, 0, '1 arguments, 2 given'),
+        ('1 + pow(2)', pycalc.MissingParameterError, 4, '2 arguments, 1 given'),
+        ('sin()', pycalc.MissingParameterError, 0, '1 arguments, 0 given'),
+        ('gcd(4)', pycalc.MissingParameterError, 0, '2 arguments, 1 given'),
+    ])
+    def test_resolve_arity_errors(self, expression, error, position, message):
+        with self.assertRaises(error) as context:
+            self.resolver.resolve(self.lexer.scan(expression))
+        self.assertEqual(context.exception.position, position)
+        self.assertIn(message, str(context.exception))
+
+    @parameterized.expand([
+        ('+ 13', 'plus 13'.split()),
+        ('- sin ( pi )', 'minus sin ( pi )'.split()),
+        ('x - 1', 'x - 1'.split()),
+        ('3 ! - 1', '3 ! - 1'.split()),
     ])
     def test_resolve_unary(self, expression, expected):
-        self.assertEqual(self.resolver.resolve_unary(expression), expected)
+        tokens = self.resolver.resolve(self.lexer.scan(expression))
+        self.assertEqual(texts(tokens), expected)
 
     def test_resolve_double_const(self):
         self.assertEqual(self.resolver.resolve_double_const('epi + pitau'), 'e pi + pi tau')
 
 
+class TestLexer(unittest.TestCase):
+    def setUp(self):
+        self.lexer = pycalc.Lexer()
+
+    def test_scan(self):
+        tokens = self.lexer.scan('log(1e5, .5)!=2**x+pi')
+        self.assertEqual([(token.kind, token.text, token.position) for token in tokens], [
+            ('function', 'log', 0), ('open', '(', 3), ('number', '1e5', 4), ('comma', ',', 7),
+            ('number', '.5', 9), ('close', ')', 11), ('operator', '!=', 12), ('number', '2', 14),
+            ('operator', '**', 15), ('variable', 'x', 17), ('operator', '+', 18), ('constant', 'pi', 19),
+        ])
+        self.assertEqual(tokens[2].value, 1e5)
+        self.assertEqual(tokens[0].arity, 2)
+        self.assertEqual(tokens[-1].value, math.pi)
+        self.assertEqual(tokens[8].priority, 4)
+        with self.assertRaises(AttributeError):
+            tokens[0].extra = None
+
+    @parameterized.expand([
+        ('epi', ['e', 'pi']),
+        ('pitaue', ['pi', 'tau', 'e']),
+        ('degrees', ['degrees']),
+        ('pie2', ['pie2']),
+        ('nan', ['nan']),
+    ])
+    def test_split_constants(self, name, expected):
+        self.assertEqual(self.lexer.split_constants(name), expected)
+
+    @parameterized.expand([
+        ('2 $ 3', pycalc.UnknownSymbolError, 2),
+        ('sin(x_1)', pycalc.UnknownSymbolError, 5),
+        ('8*(3+2))', pycalc.UnbalancedParenthesesError, 7),
+        (')(', pycalc.UnbalancedParenthesesError, 0),
+        ('((8*(3+2))', pycalc.UnbalancedParenthesesError, 0),
+        ('1 2', pycalc.UnexpectedSpaceError, 1),
+        ('8 > =  7', pycalc.UnexpectedSpaceError, 3),
+        ('5 / / 88', pycalc.UnexpectedSpaceError, 3),
+        ('(88) .3', pycalc.UnexpectedSpaceError, 4),
+        ('( )', pycalc.UnexpectedSpaceError, 1),
+    ])
+    def test_scan_errors(self, expression, error, position):
+        with self.assertRaises(error) as context:
+            self.lexer.scan(expression)
+        self.assertEqual(context.exception.position, position)
+
+    @parameterized.expand([
+        ' 1 + 2 ',
+        '- 1',
+        'sin( pi ) >= 0',
+    ])
+    def test_scan_spaces(self, expression):
+        self.assertTrue(self.lexer.scan(expression))
+
+
 class TestRPNConverter(unittest.TestCase):
     def setUp(self):
         self.converter = pycalc.ReversePolishNotationConverter()
@@ -132,14 +297,15 @@ class TestRPNConverter(unittest.TestCase):
         self.assertEqual(self.converter.create_tokens_list(expression), expected)
 
     def test_convert_to_rpn(self):
-        self.assertEqual(self.converter.convert_to_rpn('-sin(pi/2)'), ['pi', '2', '/', 'sin', 'minus'])
+        self.assertEqual(texts(self.converter.convert_to_rpn('-sin(pi/2)')), ['pi', '2', '/', 'sin', 'minus'])
+        self.assertEqual(texts(self.converter.convert_to_rpn('(1<2)*3')), ['1', '2', '<', '3', '*'])
         with self.assertRaises(pycalc.UnknownFunctionError):
             self.converter.convert_to_rpn('sen(pi/2)')
 
-    def test_clear_stack(self):
-        self.converter.stack = ['1', '3', '+']
-        self.converter.clear_stack()
-        self.assertEqual(self.converter.stack, [])
+    def test_convert_to_rpn_keeps_no_state(self):
+        self.converter.convert_to_rpn('1+2')
+        self.assertEqual(texts(self.converter.convert_to_rpn('3*4')), ['3', '4', '*'])
+        self.assertEqual(set(vars(self.converter)), {'registry', 'resolver', 'lexer'})
 
 
 class TestRPNHandler(unittest.TestCase):
@@ -147,12 +313,14 @@ class TestRPNHandler(unittest.TestCase):
         self.handler = pycalc.ReversePolishNotationHandler()
 
     def test_pop_one(self):
-        self.handler.stack = ['1', '2']
-        self.assertEqual(self.handler.pop_one(), 2.0)
+        stack = [1.0, 2.0]
+        self.assertEqual(self.handler.pop_one(stack), 2.0)
+        self.assertEqual(stack, [1.0])
 
     def test_pop_two(self):
-        self.handler.stack = ['1', '2', '3']
-        self.assertEqual(self.handler.pop_two(), (2.0, 3.0))
+        stack = [1.0, 2.0, 3.0]
+        self.assertEqual(self.handler.pop_two(stack), (2.0, 3.0))
+        self.assertEqual(stack, [1.0])
 
     @parameterized.expand([
         (['pi', '2', '1', '^', '/', 'sin', '1', '4', '*', '2', '2', '^', '+', '1', '+', '3', '2', '^', 'log', '+'],
@@ -161,9 +329,52 @@ class TestRPNHandler(unittest.TestCase):
          (2.0 ** (math.pi / math.pi + math.e / math.e + 2.0 ** 0.0)))
     ])
     def test_handle_operation(self, tokens, expected):
+        tokens = [self.handler.make_token(token) for token in tokens]
         self.assertEqual(self.handler.handle_operations(tokens), expected)
 
 
+class TestRPNOptimizer(unittest.TestCase):
+    def setUp(self):
+        self.calculator = pycalc.Calculator()
+        self.optimizer = pycalc.RPNOptimizer()
+
+    @parameterized.expand([
+        ('2*pi*sqrt(2)', [str(2 * math.pi * math.sqrt(2))], 5),
+        ('x*(2+3)', ['x', '5.0', '*'], 2),
+        ('+x', ['x'], 1),
+        ('--x', ['x'], 2),
+        ('x*1+0', ['x'], 4),
+        ('1*x-0', ['x'], 4),
+        ('x/1^1', ['x'], 4),
+        ('(x>1)+0', ['x', '1', '>', '0', '+'], 0),
+        ('x/0', ['x', '0', '/'], 0),
+        ('x+1/0', ['x', '1', '0', '/', '+'], 0),
+    ])
+    def test_optimize(self, expression, expected, eliminated):
+        optimization = self.optimizer.optimize(self.calculator.compile(expression))
+        self.assertEqual(texts(optimization.program.rpn), expected)
+        self.assertEqual(optimization.eliminated, eliminated)
+
+    @parameterized.expand([
+        ('2*pi*sqrt(x)', {'x': 2}),
+        ('log(8,2)^x--x', {'x': 3}),
+        ('(x<2)*3', {'x': 1}),
+        ('x^1*1+0', {'x': 7}),
+    ])
+    def test_optimized_results(self, expression, bindings):
+        calculator = pycalc.Calculator(optimize=True)
+        self.assertAlmostEqual(calculator.calculate(expression, bindings),
+                               self.calculator.calculate(expression, bindings))
+
+    def test_domain_errors_preserved(self):
+        calculator = pycalc.Calculator(optimize=True)
+        program = calculator.compile('x+1/0')
+        with self.assertRaises(ZeroDivisionError):
+            calculator.evaluate(program, x=1)
+        with self.assertRaises(ValueError):
+            calculator.calculate('sqrt(-1)*2')
+
+
 class TestCheck(unittest.TestCase):
     def setUp(self):
         self.checker = pycalc.ErrorChecker()
@@ -197,5 +408,1118 @@ class TestCheck(unittest.TestCase):
             self.checker.check_spaces(expression)
 
 
+class TestCalculator(unittest.TestCase):
+    def setUp(self):
+        self.calculator = pycalc.Calculator(cache_size=2)
+
+    @parameterized.expand([
+        ('2+2*2', 6.0),
+        ('-sin(pi/2)', -1.0),
+        ('log(8,2)', 3.0),
+        ('2(3+1)', 8.0),
+        ('gcd(4,6)', 2),
+        ('gcd(12/2,18,8)', 2),
+        ('lcm(2,3,4/2)', 6),
+        ('factorial(5)', 120),
+        ('factorial(10/2)+3!', 126),
+    ])
+    def test_calculate(self, expression, expected):
+        self.assertAlmostEqual(self.calculator.calculate(expression), expected)
+
+    def test_variables_named_like_parameters(self):
+        self.assertEqual(self.calculator.calculate('expression*2+mapping', expression=3, mapping=1), 7.0)
+        self.assertEqual(self.calculator.try_calculate('expression+mapping', {'mapping': 1}, expression=2).value, 3.0)
+        program = self.calculator.compile('program+mapping+bytecode')
+        bindings = {'program': 1, 'mapping': 2, 'bytecode': 3}
+        self.assertEqual(self.calculator.evaluate(program, **bindings), 6.0)
+        self.assertEqual(pycalc.Calculator(bytecode=True).calculate('program+mapping+bytecode', **bindings), 6.0)
+        self.assertEqual(codegen.CodeGenerator().evaluate(program, **bindings), 6.0)
+        if vectorized.numpy is not None:
+            self.assertEqual(vectorized.VectorizedEvaluator().evaluate(program, **bindings).values, 6.0)
+
+    def test_calculate_repeatedly(self):
+        for _ in range(3):
+            self.assertEqual(self.calculator.calculate('1+2'), 3.0)
+            self.assertEqual(self.calculator.calculate('3*4'), 12.0)
+
+    def test_compile(self):
+        program = self.calculator.compile('-sin(pi/2)')
+        self.assertEqual(program.expression, '-sin(pi/2)')
+        self.assertEqual(texts(program.rpn), ['pi', '2', '/', 'sin', 'minus'])
+        self.assertEqual(self.calculator.evaluate(program), -1.0)
+        with self.assertRaises(AttributeError):
+            program.rpn = ()
+
+    def test_compile_cache(self):
+        first = self.calculator.compile('1+2')
+        self.assertIs(self.calculator.compile('1+2'), first)
+        self.assertEqual(self.calculator.cache.info(), (1, 1, 2, 1))
+        self.calculator.compile('2+3')
+        self.calculator.compile('1+2')
+        self.calculator.compile('3+4')
+        self.assertIsNone(self.calculator.cache.get('2+3'))
+        self.assertEqual(self.calculator.cache.info().currsize, 2)
+
+    def test_compile_variables(self):
+        program = self.calculator.compile('a*sin(x)+b')
+        self.assertEqual(texts(program.rpn), ['a', 'x', 'sin', '*', 'b', '+'])
+        self.assertEqual(program.variables, {'a', 'x', 'b'})
+        self.assertEqual(self.calculator.compile('2+pi').variables, frozenset())
+
+    def test_evaluate_bindings(self):
+        program = self.calculator.compile('a*sin(x)+b')
+        expected = 2 * math.sin(0.5) + 1
+        self.assertAlmostEqual(self.calculator.evaluate(program, a=2, x=0.5, b=1), expected)
+        self.assertAlmostEqual(self.calculator.evaluate(program, {'a': 2, 'x': 0.5, 'b': 1}), expected)
+        self.assertAlmostEqual(self.calculator.evaluate(program, {'a': 2, 'x': 0.5}, b=1), expected)
+        self.assertEqual(self.calculator.calculate('2x-1', x=3), 5.0)
+
+    def test_unbound_variable(self):
+        program = self.calculator.compile('x+1')
+        with self.assertRaises(pycalc.UnboundVariableError):
+            self.calculator.evaluate(program)
+        with self.assertRaises(pycalc.UnboundVariableError):
+            self.calculator.evaluate(program, y=1)
+        with self.assertRaises(pycalc.UnknownFunctionError):
+            self.calculator.compile('f(1)')
+
+    def test_disabled_cache(self):
+        calculator = pycalc.Calculator(cache_size=0)
+        self.assertIsNot(calculator.compile('1+2'), calculator.compile('1+2'))
+        self.assertEqual(calculator.cache.info().currsize, 0)
+        with self.assertRaises(ValueError):
+            pycalc.Calculator(cache_size=-1)
+
+
+@unittest.skipIf(vectorized.numpy is None, 'numpy is not installed')
+class TestVectorizedEvaluator(unittest.TestCase):
+    def setUp(self):
+        self.calculator = pycalc.Calculator()
+        self.evaluator = vectorized.VectorizedEvaluator()
+
+    def test_evaluate(self):
+        np = vectorized.numpy
+        x = np.linspace(-3, 3, 7)
+        program = self.calculator.compile('a*sin(x)+b^2-x!')
+        result = self.evaluator.evaluate(program, {'x': x}, a=2, b=np.arange(7))
+        self.assertEqual(result.values.shape, (7,))
+        for index, value in enumerate(x):
+            if value >= 0:
+                expected = 2 * math.sin(value) + index ** 2 - math.factorial(int(value))
+                self.assertAlmostEqual(result.values[index], expected)
+        self.assertEqual(result.errors.tolist(), [True, True, True, False, False, False, False])
+
+    @parameterized.expand([
+        ('1/x', [0.0, 2.0], [True, False]),
+        ('ln(x)', [-1.0, 1.0], [True, False]),
+        ('log(8,x)', [1.0, 2.0], [True, False]),
+        ('log(x,0)', [8.0, 0.5], [True, True]),
+        ('log(x,1)', [8.0, 1.0], [True, True]),
+        ('log(x,-2)', [8.0, 2.0], [True, True]),
+        ('sqrt(x)', [-4.0, 4.0], [True, False]),
+        ('x^0.5', [-4.0, 4.0], [True, False]),
+        ('x%0', [1.0, 1.0], [True, True]),
+        ('asin(x)+1', [2.0, 0.0], [True, False]),
+    ])
+    def test_domain_errors(self, expression, values, errors):
+        result = self.evaluator.evaluate(self.calculator.compile(expression), x=values)
+        self.assertEqual(result.errors.tolist(), errors)
+        for value, error in zip(values, errors):
+            if not error:
+                self.assertEqual(result.values[values.index(value)],
+                                 self.calculator.calculate(expression, x=value))
+            else:
+                self.assertTrue(math.isnan(result.values[values.index(value)]))
+
+    def test_scalar_program(self):
+        result = self.evaluator.evaluate(self.calculator.compile('2*pi>6'))
+        self.assertEqual(result.values, 1.0)
+        self.assertFalse(result.errors)
+
+    def test_unbound_variable(self):
+        with self.assertRaises(pycalc.UnboundVariableError):
+            self.evaluator.evaluate(self.calculator.compile('x+y'), x=[1, 2])
+
+    def test_user_functions(self):
+        library = functions.FunctionLibrary()
+        library.register('twice', lambda digit: 2 * digit)
+        calculator = pycalc.Calculator(functions=library)
+        program = calculator.compile('twice(x)+gcd(x,6)')
+        result = vectorized.VectorizedEvaluator(calculator.registry).evaluate(program, x=[4.0, 1.5])
+        self.assertEqual(result.values[0], 10.0)
+        self.assertEqual(result.errors.tolist(), [False, True])
+        with self.assertRaises(pycalc.UnsupportedOperationError) as context:
+            self.evaluator.evaluate(program, x=[4.0])
+        self.assertEqual(context.exception.position, 0)
+
+
+class TestConcurrentCalculator(unittest.TestCase):
+    expressions = ['a*sin(x)+b', '2^x-log(a+1,2)', '(x<a)*b+abs(x)', 'sqrt(x^2+a^2)/(b+1)', '-x//a%3']
+
+    def evaluate_all(self, calculator, rows):
+        return [calculator.calculate(self.expressions[index % len(self.expressions)], row)
+                for index, row in enumerate(rows)]
+
+    def test_concurrent_evaluation(self):
+        calculator = pycalc.Calculator(cache_size=3)
+        rows = [{'a': index % 7 + 1, 'b': index % 5, 'x': index % 4} for index in range(2000)]
+        chunks = [rows[start:start + 50] for start in range(0, len(rows), 50)]
+        expected = self.evaluate_all(pycalc.Calculator(), rows)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = [value for chunk in executor.map(lambda chunk: self.evaluate_all(calculator, chunk), chunks)
+                       for value in chunk]
+        self.assertEqual(results, expected)
+        info = calculator.cache.info()
+        self.assertEqual(info.hits + info.misses, len(rows))
+        self.assertLessEqual(info.currsize, 3)
+
+    def test_memory_is_not_growing(self):
+        calculator = pycalc.Calculator()
+        rows = [{'a': 2, 'b': 3, 'x': 1}] * 500
+        self.evaluate_all(calculator, rows)
+        tracemalloc.start()
+        try:
+            self.evaluate_all(calculator, rows)
+            first, _ = tracemalloc.get_traced_memory()
+            for _ in range(10):
+                self.evaluate_all(calculator, rows)
+            second, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(second - first, 10000)
+
+    def test_memory_is_not_growing_with_new_names(self):
+        calculator = pycalc.Calculator(cache_size=16)
+
+        def evaluate_new_names(start):
+            for index in range(start, start + 1000):
+                name = f'v{index}'
+                calculator.calculate(f'{name}*2+sin({name})+pie', {name: 1})
+
+        evaluate_new_names(0)
+        templates, _ = calculator.lexer.memo_info()
+        for start in range(1000, 4000, 1000):
+            evaluate_new_names(start)
+            self.assertEqual(calculator.lexer.memo_info(), (templates, calculator.lexer.split_cache_size))
+            self.assertEqual(calculator.cache.info().currsize, 16)
+
+
+class TestBatch(unittest.TestCase):
+    lines = ['1+2', 'sin(pi/2)', '2+', '', 'x+1', '1+2']
+    expected = ['3.0', '1.0', 'ERROR: not enough operands for "+" operation',
+                'ERROR: no numbers or constants in expression', 'ERROR: no value for variable "x"', '3.0']
+
+    def test_read_expressions(self):
+        expressions = batch.read_expressions(StringIO('1+2\r\n3*4\n5'))
+        self.assertEqual(next(expressions), '1+2')
+        self.assertEqual(list(expressions), ['3*4', '5'])
+
+    def test_evaluate_expressions(self):
+        calculator = pycalc.Calculator()
+        self.assertEqual(list(batch.evaluate_expressions(iter(self.lines), calculator)), self.expected)
+        self.assertEqual(calculator.cache.info().hits, 1)
+
+    def test_run_batch_file(self):
+        with NamedTemporaryFile('w', suffix='.txt', delete=False) as source:
+            source.write('\n'.join(self.lines) + '\n')
+        try:
+            output = StringIO()
+            batch.run_batch(source.name, output)
+            self.assertEqual(output.getvalue().splitlines(), self.expected)
+        finally:
+            os.remove(source.name)
+
+    def test_main_batch_stdin(self):
+        with mock.patch.object(sys, 'argv', ['pycalc', '--batch']), \
+                mock.patch.object(sys, 'stdin', StringIO('\n'.join(self.lines))), \
+                mock.patch.object(sys, 'stdout', StringIO()) as output:
+            pycalc.main()
+        self.assertEqual(output.getvalue().splitlines(), self.expected)
+
+    def test_chunked(self):
+        self.assertEqual(list(batch.chunked(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_evaluate_parallel(self):
+        expressions = [f'{index}*2+{"x" if index % 7 == 0 else "1"}' for index in range(1000)]
+        expected = list(batch.evaluate_expressions(expressions))
+        results = batch.evaluate_parallel(iter(expressions), jobs=2, chunk_size=16)
+        self.assertEqual(next(results), expected[0])
+        self.assertEqual(list(results), expected[1:])
+
+    def test_calculate_parallel(self):
+        expressions = [f'{index}*2+{"x" if index % 7 == 0 else "1"}' for index in range(100)]
+        expected = list(batch.calculate_results(expressions))
+        results = list(batch.calculate_parallel(iter(expressions), jobs=2, chunk_size=16))
+        self.assertEqual(results, expected)
+        self.assertIsInstance(results[0], pycalc.CalculationResult)
+        self.assertEqual((results[0].code, results[1].value), (pycalc.ErrorCode.UNBOUND_VARIABLE, 3.0))
+
+    def test_main_parallel_batch(self):
+        with NamedTemporaryFile('w', suffix='.txt', delete=False) as source:
+            source.write('\n'.join(self.lines) + '\n')
+        try:
+            with mock.patch.object(sys, 'argv', ['pycalc', '--jobs', '2', '--batch', source.name]), \
+                    mock.patch.object(sys, 'stdout', StringIO()) as output:
+                pycalc.main()
+            self.assertEqual(output.getvalue().splitlines(), self.expected)
+        finally:
+            os.remove(source.name)
+
+    @parameterized.expand([
+        (['-1+2'], '-1+2', None, 1),
+        (['--batch'], None, '-', 1),
+        (['--batch', 'input.txt', '--jobs', '4'], None, 'input.txt', 4),
+    ])
+    def test_parse_arguments(self, args, expression, source, jobs):
+        arguments = pycalc.Calculator.parse_arguments(args)
+        self.assertEqual((arguments.expression, arguments.batch, arguments.jobs), (expression, source, jobs))
+
+
+class TestCodeGenerator(unittest.TestCase):
+    def setUp(self):
+        self.calculator = pycalc.Calculator()
+        self.generator = codegen.CodeGenerator()
+
+    @parameterized.expand([
+        ('a*sin(x)+b', {'a': 2, 'x': 0.5, 'b': 1}),
+        ('2^10/4-log(8,2)+pi', {}),
+        ('(x<2)*3+x%2-x//3', {'x': 7}),
+        ('-x^2+abs(-x)', {'x': 3}),
+        ('float+1', {'float': 2}),
+        ('if+1', {'if': 1}),
+        ('True*None-lambda', {'True': 2, 'None': 3, 'lambda': 1}),
+        ('x+in', {'x': 1, 'in': 3}),
+        ('sin(' * 2000 + 'x' + ')' * 2000, {'x': 1}),
+    ])
+    def test_evaluate(self, expression, bindings):
+        program = self.calculator.compile(expression)
+        self.assertEqual(self.generator.evaluate(program, bindings), self.calculator.evaluate(program, bindings))
+
+    def test_generate(self):
+        function = self.generator.generate(self.calculator.compile('b*x+a'))
+        self.assertEqual(function.arguments, ('a', 'b', 'x'))
+        self.assertEqual(function(1, 2, 3), 7.0)
+        self.assertEqual(function('1', 2, 3), 7.0)
+
+    def test_errors(self):
+        with self.assertRaises(ZeroDivisionError):
+            self.generator.evaluate(self.calculator.compile('1/x'), x=0)
+        with self.assertRaises(pycalc.UnboundVariableError) as context:
+            self.generator.evaluate(self.calculator.compile('x+y'), x=0)
+        self.assertEqual(context.exception.position, 2)
+        library = functions.FunctionLibrary()
+        library.register('lookup', lambda x: {}[x])
+        with self.assertRaises(KeyError):
+            self.generator.evaluate(pycalc.Calculator(functions=library).compile('lookup(x)'), x=1)
+
+    @parameterized.expand([
+        ('decimal', '1/3+x', 0),
+        ('fraction', 'x+1/3', 2),
+    ])
+    def test_numeric_backends(self, numeric, expression, position):
+        with self.assertRaises(pycalc.UnsupportedOperationError) as context:
+            self.generator.evaluate(pycalc.Calculator(numeric=numeric).compile(expression), x=1)
+        self.assertEqual(context.exception.position, position)
+
+    def test_function_cache(self):
+        program = self.calculator.compile('x+1')
+        self.generator.evaluate(program, x=1)
+        self.generator.evaluate(program, x=2)
+        self.assertEqual(self.generator.functions.info()[:2], (1, 1))
+
+
+class TestNumericBackends(unittest.TestCase):
+    @parameterized.expand([
+        ('0.1+0.2', Decimal('0.3'), Fraction(3, 10)),
+        ('1/3', Decimal('0.3333333333333333333333333333'), Fraction(1, 3)),
+        ('7//-2', Decimal(-4), Fraction(-4)),
+        ('-7%3', Decimal(2), Fraction(2)),
+        ('5!+2^-2', Decimal('120.25'), Fraction(481, 4)),
+        ('0^0+2^0', Decimal(2), Fraction(2)),
+        ('sqrt(9/4)*2', Decimal(3), Fraction(3)),
+        ('gcd(12, 18, 8)+hypot(3, 4)', Decimal(7), Fraction(7)),
+        ('floor(7/2)/2', Decimal('1.5'), Fraction(3, 2)),
+        ('0.1*3==0.3', True, True),
+    ])
+    def test_calculate(self, expression, expected_decimal, expected_fraction):
+        self.assertEqual(pycalc.Calculator(numeric='decimal').calculate(expression), expected_decimal)
+        result = pycalc.Calculator(numeric='fraction').calculate(expression)
+        self.assertEqual(result, expected_fraction)
+        self.assertIsInstance(result, type(expected_fraction))
+
+    def test_decimal_precision(self):
+        calculator = pycalc.Calculator(precision=50)
+        self.assertEqual(str(calculator.calculate('pi')), '3.1415926535897932384626433832795028841971693993751')
+        self.assertEqual(calculator.calculate('x*1.1', x=0.1), Decimal('0.11'))
+        context = decimal.Context(prec=5)
+        calculator = pycalc.Calculator(numeric=numeric.DecimalBackend(context))
+        self.assertEqual(calculator.calculate('2/3'), Decimal('0.66667'))
+        self.assertEqual(decimal.getcontext().prec, 28)
+
+    def test_optimize(self):
+        calculator = pycalc.Calculator(optimize=True, numeric='fraction')
+        program = calculator.compile('x*(1/3+1/6)+0')
+        self.assertEqual(texts(program.rpn), ['x', '1/2', '*'])
+        self.assertEqual(calculator.evaluate(program, x=Fraction(2, 3)), Fraction(1, 3))
+
+    @parameterized.expand([
+        ('sin(1)', pycalc.UnsupportedOperationError),
+        ('2+pi', pycalc.UnsupportedOperationError),
+        ('2^0.5', ValueError),
+        ('sqrt(2)', ValueError),
+        ('1/(1-1)', ZeroDivisionError),
+    ])
+    def test_fraction_errors(self, expression, error):
+        with self.assertRaises(error):
+            pycalc.Calculator(numeric='fraction').calculate(expression)
+
+    @parameterized.expand([
+        ('1/0', ZeroDivisionError),
+        ('ln(0)', ValueError),
+        ('(-8)^(1/3)', ValueError),
+        ('tan(1)', pycalc.UnsupportedOperationError),
+    ])
+    def test_decimal_errors(self, expression, error):
+        with self.assertRaises(error):
+            pycalc.Calculator(numeric='decimal').calculate(expression)
+
+    def test_get_backend(self):
+        self.assertIsInstance(numeric.get_backend(), numeric.FloatBackend)
+        with self.assertRaises(TypeError):
+            numeric.NumericBackend()
+        self.assertEqual(pycalc.Calculator(numeric='float').calculate('2^0.5'), math.sqrt(2))
+        with self.assertRaises(ValueError):
+            numeric.get_backend('complex')
+        with self.assertRaises(ValueError):
+            numeric.get_backend('fraction', precision=10)
+
+
+class TestEvaluationStats(unittest.TestCase):
+    def setUp(self):
+        self.stats = stats.EvaluationStats()
+        self.calculator = pycalc.Calculator(optimize=True, observer=self.stats)
+
+    def test_observe(self):
+        self.calculator.calculate('2*x+sin(x)', x=1)
+        self.calculator.calculate('2*x+sin(x)', x=2)
+        with self.assertRaises(ZeroDivisionError):
+            self.calculator.calculate('1/x', x=0)
+        with self.assertRaises(pycalc.UnbalancedParenthesesError):
+            self.calculator.calculate('(1')
+        self.assertEqual((self.stats.hits, self.stats.misses), (1, 3))
+        self.assertEqual(self.stats.histograms['scan'].count, 3)
+        self.assertEqual(self.stats.histograms['optimize'].count, 2)
+        self.assertEqual(self.stats.histograms['evaluate'].count, 3)
+        self.assertEqual(self.stats.errors, {'scan': 1, 'evaluate': 1})
+        self.assertEqual(self.stats.operations, {'*': 2, '+': 2, 'sin': 2, '/': 1})
+        summary = self.stats.summary()
+        self.assertIn('cache: 1 hits, 3 misses, 25.0% hit rate', summary)
+        self.assertIn('errors: scan 1, evaluate 1', summary)
+
+    def test_observer_callbacks(self):
+        observer = mock.Mock(spec=stats.CalculatorObserver)
+        calculator = pycalc.Calculator(numeric='fraction', observer=observer)
+        calculator.calculate('1/3')
+        self.assertEqual([call.args[0] for call in observer.stage.call_args_list],
+                         ['scan', 'resolve', 'convert', 'prepare', 'evaluate'])
+        observer.cache.assert_called_once_with(False)
+        observer.evaluated.assert_called_once_with(calculator.compile('1/3'))
+
+    def test_histogram(self):
+        histogram = stats.LatencyHistogram()
+        for microseconds in (1, 3, 3, 100, 1000):
+            histogram.record(microseconds / 1e6)
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.percentile(0.5), 4e-6)
+        self.assertEqual(histogram.percentile(1), 1e-3)
+        self.assertAlmostEqual(histogram.mean(), 221.4e-6)
+
+    def test_merge(self):
+        other = stats.EvaluationStats()
+        pycalc.Calculator(observer=other).calculate('1+x', x=2)
+        self.calculator.calculate('1+x', x=3)
+        self.stats.merge(pickle.loads(pickle.dumps(other)))
+        self.assertEqual(self.stats.misses, 2)
+        self.assertEqual(self.stats.histograms['evaluate'].count, 2)
+        self.assertEqual(self.stats.operations['+'], 2)
+
+    def test_parallel_batch_stats(self):
+        collected, output = stats.EvaluationStats(), StringIO()
+        with NamedTemporaryFile('w', suffix='.txt', delete=False) as source:
+            source.write('1+2\n1/0\n1+2\n')
+        try:
+            batch.run_batch(source.name, output, jobs=2, stats=collected)
+        finally:
+            os.unlink(source.name)
+        self.assertEqual(output.getvalue().splitlines()[0], '3.0')
+        self.assertEqual(collected.histograms['evaluate'].count, 3)
+        self.assertEqual(collected.errors['evaluate'], 1)
+
+
+@unittest.skipIf(store.sqlite3 is None, 'sqlite3 is not available')
+class TestProgramStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'programs.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_load_without_front_end(self):
+        expression = '-log(8)+hypot(3, 4, 12)*x+2pi'
+        first = pycalc.Calculator(store=self.path)
+        expected = first.calculate(expression, x=2)
+        second = pycalc.Calculator(store=self.path)
+        with mock.patch.object(pycalc.ReversePolishNotationConverter, 'convert_to_rpn') as convert:
+            program = second.compile(expression)
+        convert.assert_not_called()
+        self.assertEqual(texts(program.rpn), texts(first.compile(expression).rpn))
+        self.assertEqual(program.variables, {'x'})
+        self.assertEqual(second.evaluate(program, x=2), expected)
+        self.assertEqual(len(second.store), 1)
+
+    def test_shared_by_backends(self):
+        pycalc.Calculator(store=self.path).compile('1/3+x')
+        calculator = pycalc.Calculator(numeric='fraction', optimize=True, store=self.path)
+        self.assertEqual(calculator.calculate('1/3+x', x=1), Fraction(4, 3))
+        self.assertEqual(len(calculator.store), 1)
+
+    def test_registry_version(self):
+        programs = store.ProgramStore(self.path)
+        programs.save('1+2', pycalc.Calculator().convert_to_rpn('1+2'))
+        with mock.patch.object(store.ProgramStore, 'format_version', 0):
+            outdated = store.ProgramStore(self.path)
+            self.assertIsNone(outdated.load('1+2'))
+            self.assertEqual(outdated.purge(), 1)
+        self.assertIsNone(programs.load('1+2'))
+        programs.close()
+
+    def test_parallel_writers(self):
+        expressions = [f'{index}+sin({index})' for index in range(50)] * 4
+        with NamedTemporaryFile('w', suffix='.txt', delete=False) as source:
+            source.write('\n'.join(expressions) + '\n')
+        try:
+            output = StringIO()
+            batch.run_batch(source.name, output, jobs=2, store=self.path)
+        finally:
+            os.remove(source.name)
+        self.assertEqual(len(output.getvalue().splitlines()), 200)
+        self.assertEqual(len(store.ProgramStore(self.path)), 50)
+
+
+class TestBytecode(unittest.TestCase):
+    def setUp(self):
+        self.calculator = pycalc.Calculator()
+        self.compiler = bytecode.BytecodeCompiler()
+
+    @parameterized.expand([
+        ('a*sin(x)+b', {'a': 2, 'x': 0.5, 'b': 1}),
+        ('2^10/4-log(8,2)+pi-x//3+x%2', {'x': 7}),
+        ('-x^2+abs(-x)+(x<2)', {'x': 3}),
+        ('hypot(x, 2, 2)*abs(-4)', {'x': 1}),
+        ('x*x+x', {'x': 2}),
+        ('sin(' * 500 + 'x' + ')' * 500, {'x': 1}),
+    ])
+    def test_evaluate(self, expression, bindings):
+        program = self.calculator.compile(expression)
+        compiled = self.compiler.assemble(program)
+        self.assertEqual(self.compiler.evaluate(compiled, bindings), self.calculator.evaluate(program, bindings))
+        self.assertEqual([(token.text, token.arity) for token in compiled.rpn if token.arity],
+                         [(token.text, token.arity) for token in program.rpn if token.arity])
+
+    def test_assemble(self):
+        compiled = self.compiler.assemble(self.calculator.compile('2*x+2*y-x'))
+        self.assertEqual(list(compiled.code), [bytecode.LOAD_CONST, bytecode.LOAD_VAR, bytecode.CALL_2,
+                                               bytecode.LOAD_CONST, bytecode.LOAD_VAR, bytecode.CALL_2,
+                                               bytecode.CALL_2, bytecode.LOAD_VAR, bytecode.CALL_2])
+        self.assertEqual(list(compiled.constants), [2.0])
+        self.assertEqual(compiled.names, ('x', 'y'))
+        self.assertEqual(compiled.variables, {'x', 'y'})
+        with self.assertRaises(pycalc.MissingParameterError):
+            self.compiler.assemble(pycalc.CompiledExpression('+', (pycalc.MathModuleData().make_token('+'),), ()))
+
+    def test_dump_load(self):
+        compiled = self.compiler.assemble(self.calculator.compile('hypot(x, y, 2)+pi'))
+        buffer = bytearray(compiled.dump())
+        loaded = bytecode.Bytecode.load(buffer)
+        self.assertEqual(self.compiler.evaluate(loaded, x=1, y=2), self.compiler.evaluate(compiled, x=1, y=2))
+        self.assertEqual(loaded.names, ('x', 'y'))
+        offset = bytecode.Bytecode.header.size
+        buffer[offset:offset + 8] = array('d', [3.0]).tobytes()
+        self.assertEqual(loaded.constants[0], 3.0)
+        with self.assertRaises(ValueError):
+            bytecode.Bytecode.load(b'\0' * 32)
+
+    def test_calculator(self):
+        calculator = pycalc.Calculator(bytecode=True, optimize=True)
+        program = calculator.compile('x*(1+2)+0')
+        self.assertIsInstance(program, bytecode.Bytecode)
+        self.assertEqual(calculator.evaluate(program, x=2), 6.0)
+        self.assertEqual(calculator.calculate('2+2*2'), 6.0)
+        with self.assertRaises(pycalc.UnboundVariableError):
+            calculator.evaluate(program)
+        with self.assertRaises(ValueError):
+            pycalc.Calculator(bytecode=True, numeric='decimal')
+
+    def test_memory(self):
+        program = self.calculator.compile('+'.join(f'{index}*x^{index % 4}' for index in range(1, 40)))
+        tokens = sys.getsizeof(program.rpn) + sum(sys.getsizeof(token) for token in program.rpn)
+        self.assertLess(self.compiler.assemble(program).nbytes() * 5, tokens)
+
+
+class TestFormulaGraph(unittest.TestCase):
+    def setUp(self):
+        self.graph = incremental.FormulaGraph()
+        self.graph.add('a', 'x*y+sin(x)')
+        self.graph.add('b', 'y*x+1')
+        self.graph.add('c', 'sin(x)/z')
+        self.graph.update(x=1, y=2, z=4)
+
+    def test_shared_nodes(self):
+        self.assertEqual(len(self.graph), 9)
+        self.assertEqual(self.graph.add('d', '(x*y)+1'), 3.0)
+        self.assertEqual(len(self.graph), 9)
+
+    @parameterized.expand([
+        ('one_formula', {'z': 2}, {'c': math.sin(1) / 2}, 1),
+        ('shared_node', {'y': 3}, {'a': 3 + math.sin(1), 'b': 4.0}, 3),
+        ('all_formulas', {'x': 0}, {'a': 0.0, 'b': 1.0, 'c': 0.0}, 5),
+        ('same_value', {'x': 1.0, 'z': 4}, {}, 0),
+        ('unknown_variable', {'w': 1}, {}, 0),
+    ])
+    def test_update(self, name, bindings, changed, recomputed):
+        self.graph.recomputed = 0
+        self.assertEqual(self.graph.update(bindings), changed)
+        self.assertEqual(self.graph.recomputed, recomputed)
+        for formula, expression in (('a', 'x*y+sin(x)'), ('b', 'y*x+1'), ('c', 'sin(x)/z')):
+            self.assertEqual(self.graph[formula], pycalc.Calculator().calculate(
+                expression, {'x': 1, 'y': 2, 'z': 4, **bindings}))
+
+    def test_unchanged_node_stops_propagation(self):
+        self.graph.add('d', 'abs(x)*100')
+        self.graph.recomputed = 0
+        self.assertEqual(self.graph.update(x=-1), {'a': -2 + math.sin(-1), 'b': -1.0, 'c': math.sin(-1) / 4})
+        self.assertEqual(self.graph.recomputed, 6)
+
+    def test_errors(self):
+        changed = self.graph.update(z=0)
+        self.assertEqual(list(changed), ['c'])
+        self.assertIsInstance(changed['c'], ZeroDivisionError)
+        with self.assertRaises(ZeroDivisionError):
+            self.graph['c']
+        self.assertEqual(self.graph.update(z=0.0), {})
+        self.assertIsInstance(self.graph.add('e', 'c+q'), pycalc.UnboundVariableError)
+        self.assertEqual(self.graph.update(z=1), {'c': math.sin(1)})
+
+    def test_invalid_formulas(self):
+        with self.assertRaises(ValueError):
+            self.graph.add('a', 'x')
+        with self.assertRaises(pycalc.UnbalancedParenthesesError):
+            self.graph.add('e', '(x')
+        with self.assertRaises(ValueError):
+            incremental.FormulaGraph(pycalc.Calculator(bytecode=True))
+
+    def test_numeric_backend(self):
+        graph = incremental.FormulaGraph(pycalc.Calculator(numeric='fraction'))
+        graph.add('a', 'x/3+1/6')
+        self.assertEqual(graph.update(x=1), {'a': Fraction(1, 2)})
+
+
+class TestBatchCompiler(unittest.TestCase):
+    expressions = ['sqrt(x^2+y^2)', 'sqrt(y^2+x^2)*2', '1/sqrt(x^2+y^2)', 'sqrt(x^2+y^2)/z', 'x^2', '(1', '1/(y-4)']
+
+    def test_compile(self):
+        program = cse.BatchCompiler().compile(self.expressions)
+        self.assertEqual(program.evaluations, 22)
+        self.assertEqual(program.saved, 13)
+        self.assertEqual(sum(program.roots[0] in children for _, _, children in program.operations), 3)
+        self.assertIsInstance(program.roots[5], pycalc.UnbalancedParenthesesError)
+        self.assertEqual(sorted(name for _, name, _ in program.variables), ['x', 'y', 'z'])
+
+    def test_evaluate(self):
+        compiler = cse.BatchCompiler()
+        results = compiler.evaluate(compiler.compile(self.expressions), {'x': 3, 'y': 4}, z=10)
+        self.assertEqual(results[:5], [5.0, 10.0, 0.2, 0.5, 9.0])
+        self.assertIsInstance(results[5], pycalc.UnbalancedParenthesesError)
+        self.assertIsInstance(results[6], ZeroDivisionError)
+        results = compiler.evaluate(compiler.compile(self.expressions), x=3, y=4)
+        self.assertIsInstance(results[3], pycalc.UnboundVariableError)
+        self.assertEqual(results[4], 9.0)
+
+    def test_stats(self):
+        observer = stats.EvaluationStats()
+        compiler = cse.BatchCompiler(pycalc.Calculator(observer=observer))
+        compiler.evaluate(compiler.compile(self.expressions), x=3, y=4, z=1)
+        self.assertEqual((observer.evaluations, observer.saved), (22, 13))
+        self.assertIn('shared subexpressions: 13 of 22 evaluations saved', observer.summary())
+        self.assertEqual(observer.histograms['evaluate'].count, 2)
+        self.assertEqual(observer.errors, {'scan': 1, 'evaluate': 1})
+        self.assertEqual(observer.operations['^'], 9)
+        self.assertEqual(observer.operations['sqrt'], 4)
+        self.assertEqual(observer.operations['/'], 3)
+
+    def test_evaluate_shared(self):
+        lines = TestBatch.lines + ['1/0', '2^3-sqrt(4)', '(1', '2*3=6']
+        expected = list(batch.evaluate_expressions(lines))
+        self.assertEqual(list(batch.evaluate_shared(iter(lines), chunk_size=3)), expected)
+        self.assertEqual(list(batch.evaluate_parallel(iter(lines), jobs=2, chunk_size=3, cse=True)), expected)
+
+    @parameterized.expand([
+        ('shared error', ['sqrt(-1)', '1/0+sqrt(-1)'], {}, ['domain', 'division_by_zero']),
+        ('shared variable', ['y+1', 'x+y'], {}, ['unbound_variable', 'unbound_variable']),
+        ('operands order', ['y+x', 'x+y'], {}, ['unbound_variable', 'unbound_variable']),
+        ('partly bound', ['x*sqrt(-1)', '1/(x-1)*sqrt(-1)'], {'x': 1}, ['domain', 'division_by_zero']),
+    ])
+    def test_errors_match(self, name, lines, bindings, codes):
+        compiler = cse.BatchCompiler()
+        results = compiler.evaluate(compiler.compile(lines), bindings)
+        calculator = pycalc.Calculator()
+        expected = [calculator.try_calculate(line, bindings).message for line in lines]
+        self.assertEqual([str(result) for result in results], expected)
+        self.assertEqual([pycalc.error_code(result) for result in results], codes)
+        self.assertEqual(list(batch.evaluate_shared(lines, output_format='json')),
+                         list(batch.evaluate_expressions(lines, output_format='json')))
+
+    def test_numeric_backend(self):
+        compiler = cse.BatchCompiler(pycalc.Calculator(numeric='fraction'))
+        program = compiler.compile(['1/3+x', 'x+1/3'])
+        self.assertEqual(program.saved, 2)
+        self.assertEqual(compiler.evaluate(program, x=1), [Fraction(4, 3)] * 2)
+
+
+class TestCalculationResult(unittest.TestCase):
+    @parameterized.expand([
+        ('(1+2', pycalc.ErrorCode.UNBALANCED_PARENTHESES, 0),
+        ('foo(1)', pycalc.ErrorCode.UNKNOWN_FUNCTION, 0),
+        ('sin()', pycalc.ErrorCode.MISSING_PARAMETER, 0),
+        ('x+#', pycalc.ErrorCode.UNKNOWN_SYMBOL, 2),
+        ('3 4', pycalc.ErrorCode.UNEXPECTED_SPACE, 1),
+        ('y+1', pycalc.ErrorCode.UNBOUND_VARIABLE, 0),
+        ('1/0', pycalc.ErrorCode.DIVISION_BY_ZERO, None),
+        ('10.0^400', pycalc.ErrorCode.OVERFLOW, None),
+        ('sqrt(-1)', pycalc.ErrorCode.DOMAIN, None),
+    ])
+    def test_error_codes(self, expression, code, position):
+        result = pycalc.Calculator().try_calculate(expression)
+        self.assertFalse(result.ok)
+        self.assertEqual((result.value, result.code, result.position), (None, code, position))
+        with self.assertRaises(Exception) as context:
+            pycalc.Calculator().calculate(expression)
+        self.assertEqual(result.message, str(context.exception))
+        self.assertEqual(pycalc.error_code(context.exception), code)
+
+    def test_other_error_codes(self):
+        self.assertEqual(pycalc.error_code(decimal.InvalidOperation()), pycalc.ErrorCode.ARITHMETIC)
+        self.assertEqual(pycalc.error_code(TypeError()), pycalc.ErrorCode.TYPE)
+        self.assertEqual(pycalc.error_code(RecursionError()), pycalc.ErrorCode.INTERNAL)
+        self.assertEqual(pycalc.ErrorCode('division_by_zero'), pycalc.ErrorCode.DIVISION_BY_ZERO)
+
+    def test_success(self):
+        result = pycalc.Calculator().try_calculate('x*2', {'x': 3})
+        self.assertTrue(result.ok)
+        self.assertEqual(result, (6.0, None, None, None, None))
+
+    @parameterized.expand([
+        ('value', pycalc.CalculationResult.success(6.0), '6.0', {'result': 6.0}),
+        ('comparison', pycalc.CalculationResult.success(True), 'True', {'result': True}),
+        ('infinity', pycalc.CalculationResult.success(float('inf')), 'inf', {'result': 'inf'}),
+        ('fraction', pycalc.CalculationResult.success(Fraction(1, 3)), '1/3', {'result': '1/3'}),
+        ('error', pycalc.CalculationResult.failure(pycalc.UnknownSymbolError('unknown symbols "#"', 2)),
+         'ERROR: unknown symbols "#"',
+         {'error': {'type': 'UnknownSymbolError', 'code': 'unknown_symbol', 'message': 'unknown symbols "#"',
+                    'position': 2}}),
+    ])
+    def test_to_line(self, name, result, text, data):
+        self.assertEqual(result.to_line(), text)
+        self.assertEqual(json.loads(result.to_line('json')), data)
+
+    def test_failures_are_cached(self):
+        calculator = pycalc.Calculator(cache_size=2)
+        with mock.patch.object(calculator, 'compile', wraps=calculator.compile) as compile_:
+            for expression in ('(1', '(1', '1/0', '1/0', '(2', '(3', '(1'):
+                calculator.try_calculate(expression)
+        self.assertEqual(compile_.call_count, 6)
+        self.assertEqual(list(calculator.failures), ['(3', '(1'])
+        self.assertEqual(pycalc.Calculator(cache_size=0).try_calculate('(1').code,
+                         pycalc.ErrorCode.UNBALANCED_PARENTHESES)
+
+    def test_batch_json(self):
+        observer = stats.EvaluationStats()
+        lines = list(batch.evaluate_expressions(TestBatch.lines, pycalc.Calculator(observer=observer), 'json'))
+        self.assertEqual([json.loads(line) for line in lines], [
+            {'result': 3.0},
+            {'result': 1.0},
+            {'error': {'type': 'MissingParameterError', 'code': 'missing_parameter',
+                       'message': 'not enough operands for "+" operation', 'position': 1}},
+            {'error': {'type': 'MissingParameterError', 'code': 'missing_parameter',
+                       'message': 'no numbers or constants in expression', 'position': None}},
+            {'error': {'type': 'UnboundVariableError', 'code': 'unbound_variable',
+                       'message': 'no value for variable "x"', 'position': 0}},
+            {'result': 3.0},
+        ])
+        self.assertEqual(observer.failures, {'missing_parameter': 2, 'unbound_variable': 1})
+        self.assertIn('failures: missing_parameter 2, unbound_variable 1', observer.summary())
+        self.assertEqual(list(batch.evaluate_shared(TestBatch.lines, output_format='json')), lines)
+
+    def test_main_json(self):
+        with mock.patch.object(sys, 'argv', ['pycalc', '--format', 'json', '2*(3']), \
+                mock.patch.object(sys, 'stdout', StringIO()) as output:
+            pycalc.main()
+        self.assertEqual(json.loads(output.getvalue()), {'error': {
+            'type': 'UnbalancedParenthesesError', 'code': 'unbalanced_parentheses',
+            'message': 'expression has 1 unclosed parentheses', 'position': 2}})
+
+
+class TestExpressionGuard(unittest.TestCase):
+    @parameterized.expand([
+        ('length', '1+' * 15 + '1', {'max_length': 20}, pycalc.LengthLimitError, 20),
+        ('tokens', '1+' * 8 + '1', {'max_tokens': 10}, pycalc.TokenLimitError, 9),
+        ('depth', 'sin(' * 6 + '1' + ')' * 6, {'max_depth': 5}, pycalc.DepthLimitError, 4),
+        ('factorial', '100000!', {}, pycalc.NumberLimitError, 6),
+        ('factorial function', 'factorial(5000)', {}, pycalc.NumberLimitError, 0),
+        ('tower', '9^9^9', {}, pycalc.NumberLimitError, 1),
+        ('power', '2^20000', {}, pycalc.NumberLimitError, 1),
+        ('variable power', 'x^20000', {}, pycalc.NumberLimitError, 1),
+    ])
+    def test_limits(self, name, expression, options, error, position):
+        calculator = pycalc.Calculator(limits=limits.Limits(**options))
+        with self.assertRaises(error) as context:
+            calculator.calculate(expression, x=2)
+        self.assertEqual(context.exception.position, position)
+        self.assertIsInstance(context.exception, pycalc.LimitExceededError)
+        self.assertEqual(calculator.try_calculate(expression, x=2).code, error.code)
+
+    def test_exact_result_bits(self):
+        calculator = pycalc.Calculator(numeric='fraction', limits=True)
+        result = calculator.try_calculate('(2^5000)*(2^5000)*(2^5000)')
+        self.assertEqual((result.code, result.position), (pycalc.ErrorCode.NUMBER_TOO_LARGE, 8))
+        self.assertEqual(calculator.calculate('(2^5000)*(2^4000)'), 2 ** 9000)
+
+    def test_timeout(self):
+        calculator = pycalc.Calculator(limits=limits.Limits(timeout=1))
+        with mock.patch.object(limits, 'perf_counter', side_effect=[0.0, 0.5, 2.0]):
+            result = calculator.try_calculate('1+2*3')
+        self.assertEqual((result.code, result.position), (pycalc.ErrorCode.TIMEOUT, 1))
+        self.assertEqual(calculator.calculate('1+2*3'), 7)
+
+    @parameterized.expand([
+        ('2+2*2', 6),
+        ('(1/2)^2*4+10!', 3628801),
+        ('2^1000/2^999', 2),
+        ('x*y-1', 5),
+    ])
+    def test_results_unchanged(self, expression, value):
+        for options in ({}, {'optimize': True}, {'numeric': 'fraction'}):
+            calculator = pycalc.Calculator(limits=True, **options)
+            self.assertEqual(calculator.calculate(expression, x=2, y=3), value)
+
+    def test_shared_evaluation(self):
+        expressions = ['(2^5000)*(2^5000)*(2^5000)', '1+2']
+        calculator = pycalc.Calculator(numeric='fraction', limits=True)
+        compiler = cse.BatchCompiler(calculator)
+        results = compiler.evaluate(compiler.compile(expressions))
+        self.assertEqual((pycalc.error_code(results[0]), results[0].position), (pycalc.ErrorCode.NUMBER_TOO_LARGE, 8))
+        self.assertEqual(results[1], 3)
+        compiler = cse.BatchCompiler(pycalc.Calculator(limits=limits.Limits(timeout=1)))
+        with mock.patch.object(limits, 'perf_counter', side_effect=[0.0, 1.0, 10.0, 20.0, 30.0]):
+            results = compiler.evaluate(compiler.compile(['1+2', 'x*2']), x=1)
+        self.assertEqual(results[0], 3)
+        self.assertIsInstance(results[1], pycalc.TimeLimitError)
+
+    def test_incremental_evaluation(self):
+        graph = incremental.FormulaGraph(pycalc.Calculator(numeric='fraction', limits=True))
+        graph.add('a', 'x^2*x^2')
+        graph.update(x=2 ** 3000)
+        with self.assertRaises(pycalc.NumberLimitError):
+            graph['a']
+        graph.update(x=2)
+        self.assertEqual(graph['a'], 16)
+        with mock.patch.object(limits, 'perf_counter', side_effect=[0.0, 5.0]):
+            graph.update(x=3)
+        with self.assertRaises(pycalc.TimeLimitError):
+            graph['a']
+
+    @parameterized.expand([
+        ('0.5^20000', {}),
+        ('2^-20000', {}),
+        ('(-2)^-20000', {}),
+        ('x^20000', {'x': 0.5}),
+        ('2^x', {'x': -20000}),
+    ])
+    def test_shrinking_powers(self, expression, bindings):
+        self.assertEqual(pycalc.Calculator(limits=True).calculate(expression, bindings), 0.0)
+
+    @parameterized.expand([
+        ('decimal', Decimal(1024)),
+        ('fraction', Fraction(1024)),
+    ])
+    def test_numeric_backends(self, numeric, expected):
+        for options in ({'limits': True}, {'limits': limits.Limits(timeout=1.0)}):
+            calculator = pycalc.Calculator(numeric=numeric, **options)
+            self.assertEqual(calculator.calculate('2^10'), expected)
+            self.assertEqual(calculator.calculate('x^2/4+0.5^x', x=4), 4.0625)
+            self.assertEqual(calculator.try_calculate('x^2+5!', x=2).value, 124)
+        result = pycalc.Calculator(numeric=numeric, limits=True).try_calculate('(3/2)^20000')
+        self.assertEqual((result.code, result.position), (pycalc.ErrorCode.NUMBER_TOO_LARGE, 5))
+
+    def test_optimizer_does_not_fold(self):
+        result = pycalc.Calculator(optimize=True, limits=True).try_calculate('2+100000!')
+        self.assertEqual(result.code, pycalc.ErrorCode.NUMBER_TOO_LARGE)
+
+    def test_bytecode(self):
+        with self.assertRaises(ValueError):
+            pycalc.Calculator(bytecode=True, limits=True)
+
+    def test_main_sandbox(self):
+        with mock.patch.object(sys, 'argv', ['pycalc', '--sandbox', '--format', 'json', '9^9^9']), \
+                mock.patch.object(sys, 'stdout', StringIO()) as output:
+            pycalc.main()
+        self.assertEqual(json.loads(output.getvalue()), {'error': {
+            'type': 'NumberLimitError', 'code': 'number_too_large',
+            'message': 'power exceeds limit of 10000 bits', 'position': 1}})
+
+
+class TestFunctionLibrary(unittest.TestCase):
+    def setUp(self):
+        self.library = functions.FunctionLibrary()
+        self.library.register('clamp', lambda x, lo, hi: max(lo, min(x, hi)), pure=True)
+        self.library.define('lerp(a,b,t)=a+(b-a)*t')
+        self.library.define('sq(x) = x*x')
+        self.library.define('f(x)=sq(x)+1')
+
+    @parameterized.expand([
+        ('lerp(0,10,0.25)', 2.5),
+        ('clamp(15,0,10)', 10),
+        ('f(3)', 10),
+        ('2f(x)+lerp(x,sq(x),1/2)', 13),
+        ('clamp(lerp(x,10,0.5),0,5)', 5),
+    ])
+    def test_calculate(self, expression, value):
+        for options in ({}, {'optimize': True}, {'numeric': 'fraction'}, {'limits': True}):
+            calculator = pycalc.Calculator(functions=self.library, **options)
+            self.assertEqual(calculator.calculate(expression, x=2), value)
+
+    def test_inline(self):
+        program = pycalc.Calculator(functions=self.library).compile('lerp(x,y,2)+f(z)')
+        self.assertEqual(' '.join(token.text for token in program.rpn), 'x y x - 2 * + z z * 1 + +')
+        self.assertEqual(program.variables, {'x', 'y', 'z'})
+        self.assertEqual([token.position for token in program.rpn], [5, 7, 5, 0, 9, 0, 0, 14, 14, 12, 12, 12, 11])
+
+    @parameterized.expand([
+        ('arity', 'lerp(1,2)', pycalc.ErrorCode.MISSING_PARAMETER, 0),
+        ('unbound', 'f(y)', pycalc.ErrorCode.UNBOUND_VARIABLE, 2),
+        ('malformed', 'f(1)+', pycalc.ErrorCode.MISSING_PARAMETER, 4),
+    ])
+    def test_errors(self, name, expression, code, position):
+        result = pycalc.Calculator(functions=self.library).try_calculate(expression)
+        self.assertEqual((result.code, result.position), (code, position))
+
+    def test_unknown_without_library(self):
+        self.assertEqual(pycalc.Calculator().try_calculate('lerp(1,2,3)').code, pycalc.ErrorCode.UNKNOWN_FUNCTION)
+
+    def test_purity(self):
+        calls = []
+        self.library.register('tick', lambda x: calls.append(x) or len(calls))
+        self.library.register('double', lambda x: calls.append(x) or 2 * x, pure=True)
+        calculator = pycalc.Calculator(optimize=True, functions=self.library)
+        self.assertEqual(' '.join(token.text for token in calculator.compile('tick(1)+double(2)').rpn),
+                         '1 tick 4.0 +')
+        self.assertEqual(calculator.calculate('double(x)+double(x)', x=5), 20)
+        self.assertEqual(calls, [2, 5])
+        program = cse.BatchCompiler(calculator).compile(['tick(1)+tick(1)'])
+        self.assertEqual(len(program.operations), 3)
+
+    def test_expansion_limit(self):
+        self.library.define('big(x)=' + '+'.join(['x'] * 60))
+        calculator = pycalc.Calculator(functions=self.library, limits=limits.Limits(max_tokens=100))
+        result = calculator.try_calculate('1+big(x)', x=1)
+        self.assertEqual((result.code, result.position), (pycalc.ErrorCode.TOO_MANY_TOKENS, 2))
+        with mock.patch.object(functions.MacroExpander, 'default_max_tokens', 100):
+            result = pycalc.Calculator(functions=self.library).try_calculate('1+big(x)', x=1)
+        self.assertEqual((result.code, result.position), (pycalc.ErrorCode.TOO_MANY_TOKENS, 2))
+
+    def test_repeated_arguments(self):
+        calls = []
+        self.library.register('tick', lambda x: calls.append(x) or len(calls))
+        calculator = pycalc.Calculator(functions=self.library)
+        self.assertEqual(' '.join(token.text for token in calculator.compile('sq(tick(1))+sq(2)').rpn),
+                         '1 tick sq 2 2 * +')
+        self.assertEqual(calculator.calculate('sq(tick(1))'), 1)
+        self.assertEqual(calls, [1])
+        program = calculator.compile('sq(' * 22 + 'x' + ')' * 22)
+        self.assertEqual(len(program.rpn), 24)
+        self.assertEqual(calculator.evaluate(program, x=1), 1)
+
+    @parameterized.expand([
+        ('no parameters', 'g()=1', ValueError),
+        ('syntax', 'g(x)', ValueError),
+        ('free variable', 'g(x)=x+y', pycalc.UnboundVariableError),
+        ('constant parameter', 'g(pi)=pi', ValueError),
+        ('split parameter', 'g(pie)=pie', ValueError),
+        ('repeated parameter', 'g(x,x)=x', ValueError),
+        ('builtin', 'sin(x)=x', ValueError),
+        ('redefined', 'sq(x)=x^2', ValueError),
+        ('recursive', 'g(x)=g(x-1)', pycalc.UnknownFunctionError),
+        ('body', 'g(x)=(x', pycalc.UnbalancedParenthesesError),
+    ])
+    def test_define_errors(self, name, definition, error):
+        with self.assertRaises(error):
+            self.library.define(definition)
+        self.assertNotIn('g', self.library)
+
+    def test_register(self):
+        self.library.register('hypot3', lambda x, y, z: math.sqrt(x * x + y * y + z * z))
+        self.assertEqual(self.library.functions['hypot3'].arity, 3)
+        self.assertEqual(pycalc.Calculator(functions=self.library).calculate('hypot3(1,2,2)'), 3)
+        with self.assertRaises(ValueError):
+            self.library.register('nothing', lambda: 1)
+        with self.assertRaises(ValueError):
+            self.library.register('sqrt', math.sqrt)
+
+    def test_registry(self):
+        self.assertNotIn('lerp', pycalc.get_registry().all_operations)
+        self.assertNotEqual(self.library.registry.version, pycalc.get_registry().version)
+        calculator = pycalc.Calculator(functions=self.library)
+        self.library.define('g(x)=x+1')
+        self.assertEqual(calculator.try_calculate('g(1)').code, pycalc.ErrorCode.UNKNOWN_FUNCTION)
+        with self.assertRaises(ValueError):
+            pycalc.Calculator(functions=self.library, bytecode=True)
+
+    def test_store(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'programs.db')
+            for _ in range(2):
+                calculator = pycalc.Calculator(store=path, functions=self.library)
+                self.assertEqual(calculator.calculate('f(2)+clamp(7,0,1)'), 6)
+            with self.assertRaises(ValueError):
+                pycalc.Calculator(store=calculator.store)
+
+
+class TestEvaluationService(unittest.IsolatedAsyncioTestCase):
+    async def start(self, service, **options):
+        started = asyncio.get_running_loop().create_future()
+        self.serving = asyncio.create_task(server.serve(service, port=0, started=started, **options))
+        self.addAsyncCleanup(self.stop)
+        return await started
+
+    async def stop(self):
+        self.serving.cancel()
+        await asyncio.gather(self.serving, return_exceptions=True)
+
+    async def test_lines(self):
+        service = server.EvaluationService(workers=2, batch_delay=0.01)
+        listening = await self.start(service)
+        reader, writer = await asyncio.open_connection(*listening.sockets[0].getsockname()[:2])
+        lines = ['1+2', json.dumps({'id': 1, 'expression': 'x/y', 'variables': {'x': 1, 'y': 0}}),
+                 json.dumps({'id': 'b', 'expression': '2x', 'variables': {'x': 4}}), '(1', '{"expression": 1}',
+                 '10^308*10'] + [f'{index}*2' for index in range(100)]
+        writer.write(''.join(line + '\n' for line in lines).encode())
+        writer.write_eof()
+        responses = [json.loads(line) for line in (await reader.read()).decode().splitlines()]
+        writer.close()
+        self.assertEqual(responses[:5], [
+            {'result': 3.0},
+            {'id': 1, 'error': {'type': 'ZeroDivisionError', 'code': 'division_by_zero',
+                                'message': 'can\'t divide by zero', 'position': None}},
+            {'id': 'b', 'result': 8.0},
+            {'error': {'type': 'UnbalancedParenthesesError', 'code': 'unbalanced_parentheses',
+                       'message': 'expression has 1 unclosed parentheses', 'position': 0}},
+            {'error': {'type': 'ValueError', 'code': 'invalid_request',
+                       'message': 'request must have "expression" string', 'position': None}},
+        ])
+        self.assertEqual(responses[5], {'result': 'inf'})
+        self.assertEqual([response['result'] for response in responses[6:]], [index * 2.0 for index in range(100)])
+        self.assertLess(service.batches, 50)
+
+    async def test_invalid_lines(self):
+        patch = mock.patch.object(server, 'MAX_LINE', 64)
+        patch.start()
+        self.addCleanup(patch.stop)
+        listening = await self.start(server.EvaluationService())
+        reader, writer = await asyncio.open_connection(*listening.sockets[0].getsockname()[:2])
+        writer.write(b'1+2\n' + b'1+' * 100 + b'1\n' + b'\xff\xfe\n' + b'1+' * 100 + b'\n2*3\n' + b'1+' * 100)
+        writer.write_eof()
+        responses = [json.loads(line) for line in (await reader.read()).decode().splitlines()]
+        writer.close()
+        too_long = {'error': {'type': 'LimitOverrunError', 'code': 'invalid_request',
+                              'message': 'request line exceeds 64 bytes', 'position': None}}
+        self.assertEqual(len(responses), 6)
+        self.assertEqual(responses[:2], [{'result': 3.0}, too_long])
+        self.assertEqual((responses[2]['error']['type'], responses[2]['error']['code']),
+                         ('UnicodeDecodeError', 'invalid_request'))
+        self.assertEqual(responses[3:], [too_long, {'result': 6.0}, too_long])
+
+
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'pycalc.sock')
+            await self.start(server.EvaluationService(numeric='fraction'), path=path)
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write(b'1/3+1/6\n')
+            self.assertEqual(json.loads(await reader.readline()), {'result': '1/2'})
+            writer.close()
+
+    async def test_http(self):
+        listening = await self.start(server.EvaluationService(), http=True)
+        reader, writer = await asyncio.open_connection(*listening.sockets[0].getsockname()[:2])
+        body = json.dumps([{'expression': '2^10'}, {'id': 2, 'expression': 'sin()'}]).encode()
+        writer.write(b'POST /evaluate HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+        writer.write(b'GET /health HTTP/1.1\r\nConnection: close\r\n\r\n')
+        data = (await reader.read()).decode()
+        writer.close()
+        first, second = data.split('HTTP/1.1 ')[1:]
+        self.assertTrue(first.startswith('200 OK'))
+        self.assertEqual(json.loads(first.split('\r\n\r\n', 1)[1]), [
+            {'result': 1024.0},
+            {'id': 2, 'error': {'type': 'MissingParameterError', 'code': 'missing_parameter',
+                                'message': 'function "sin" takes 1 arguments, 0 given', 'position': 0}},
+        ])
+        self.assertIn('Connection: close', second)
+        self.assertEqual(json.loads(second.split('\r\n\r\n', 1)[1]), {'status': 'ok'})
+
+    async def test_http_errors(self):
+        listening = await self.start(server.EvaluationService(), http=True)
+        address = listening.sockets[0].getsockname()[:2]
+        requests = [
+            (b'GET /missing HTTP/1.1\r\nConnection: close\r\n\r\n', '404 Not Found', 'not_found'),
+            (b'GET /evaluate HTTP/1.1\r\nConnection: close\r\n\r\n', '405 Method Not Allowed', 'method_not_allowed'),
+            (b'POST /evaluate HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % (server.MAX_LINE + 1),
+             '413 Payload Too Large', 'payload_too_large'),
+        ]
+        for request, status, code in requests:
+            reader, writer = await asyncio.open_connection(*address)
+            writer.write(request)
+            data = (await reader.read()).decode()
+            writer.close()
+            self.assertTrue(data.startswith(f'HTTP/1.1 {status}'))
+            self.assertIn('Connection: close', data)
+            self.assertEqual(json.loads(data.split('\r\n\r\n', 1)[1])['error']['code'], code)
+
+    async def test_backpressure(self):
+        calculator = pycalc.Calculator()
+        evaluate = calculator.evaluate
+
+        def slow_evaluate(*args):
+            time.sleep(0.001)
+            return evaluate(*args)
+
+        calculator.evaluate = slow_evaluate
+        service = server.EvaluationService(batch_size=4, queue_size=8, calculator=calculator)
+        await service.start()
+        sizes = []
+
+        async def watch():
+            while True:
+                sizes.append(service.queue.qsize())
+                await asyncio.sleep(0)
+
+        watcher = asyncio.create_task(watch())
+        results = await asyncio.gather(*(service.evaluate(f'{index}+1') for index in range(100)))
+        watcher.cancel()
+        await service.close()
+        self.assertEqual([result['result'] for result in results], [index + 1.0 for index in range(100)])
+        self.assertLessEqual(max(sizes), 8)
+        self.assertGreaterEqual(service.batches, 25)
+
+
 if __name__ == '__main__':
     unittest.main()